@@ -0,0 +1,5 @@
+# Benchmarks run the scraper against a local stub server, never against Airbnb.
+#
+# Run a benchmark as a module from the project root, e.g.:
+#
+#     python -m benchmarks.bench_reviews
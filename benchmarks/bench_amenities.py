@@ -0,0 +1,81 @@
+"""Listings/sec of AMENITIES_REQUIRED / AMENITIES_EXCLUDED filters, amenity bitsets vs. lists of amenity ids.
+
+    python -m benchmarks.bench_amenities [--listings 100000] [--amenities 150]
+
+Generates listings with 5 to 80 amenities each, drawn from `--amenities` of Airbnb's ids, and filters them requiring
+2 amenities and excluding 1: with `in` tests on each listing's list of ids (`list`), with `AmenityFilter.check` on
+each listing's bitset, built from its ids as ListingFilter does (`check`), and with `AmenityFilter.select` over the
+stored bitsets of all listings at once, as refilter does, using pyarrow (`select`) or plain Python (`select/python`).
+As with the shipped PROPERTY_AMENITIES, 5 ids are known, the filtered ones among them; the others are mapped as first
+seen. Reports listings/sec, bytes per listing of amenity ids as JSON vs. bitsets, and whether all methods accept the
+same listings.
+
+Per listing, bitsets are no faster than lists: `check` is slower, as it builds the bitset first. They save space in the
+text index, and `select` checks stored bitsets without decoding each item, where pyarrow gains little over Python as the
+word columns are built in Python.
+"""
+import argparse
+import json
+import random
+import time
+
+from deepbnb import amenities
+from deepbnb.amenities import AmenityBits, AmenityFilter
+
+
+def run(name: str, select, count: int) -> tuple:
+    start = time.perf_counter()
+    keep = select()
+    elapsed = time.perf_counter() - start
+
+    return {'filter': name, 'listings_per_sec': round(count / elapsed), 'accepted': sum(keep)}, keep
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--listings', type=int, default=100000, help='listings to filter')
+    parser.add_argument('--amenities', type=int, default=150, help='distinct amenity ids')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    pool = rng.sample(range(1, 1000), args.amenities)
+    listings = [rng.sample(pool, rng.randint(5, min(80, len(pool)))) for _ in range(args.listings)]
+    required, excluded = pool[:2], pool[-1:]
+
+    # 5 known amenity ids, as in the shipped PROPERTY_AMENITIES, including the filtered ones
+    amenity_filter = AmenityFilter(required, excluded, {str(a): a for a in pool[:2] + pool[-3:]})
+    amenity_bits = amenity_filter.amenity_bits
+    bitsets = [AmenityBits.to_bytes(amenity_bits.bitset(amenity_ids)) for amenity_ids in listings]
+    print(json.dumps({
+        'listings': len(listings),
+        'list_bytes_per_listing': round(sum(len(json.dumps(a)) for a in listings) / len(listings), 1),
+        'bitset_bytes_per_listing': round(sum(map(len, bitsets)) / len(bitsets), 1),
+    }))
+
+    results = []
+    results.append(run('list', lambda: [
+        all(a in amenity_ids for a in required) and not any(a in amenity_ids for a in excluded)
+        for amenity_ids in listings
+    ], len(listings)))
+    results.append(run('check', lambda: [
+        not amenity_filter.check(amenity_bits.bitset(amenity_ids)) for amenity_ids in listings
+    ], len(listings)))
+
+    def select():
+        masks = amenity_filter.masks(amenity_bits)
+        words = {w: b''.join(b[8 * w:8 * w + 8].ljust(8, b'\0') for b in bitsets) for w in masks}
+        return AmenityFilter.select(masks, words, len(bitsets))
+
+    pyarrow = amenities.pyarrow
+    for name in (['select'] if pyarrow else []) + ['select/python']:
+        amenities.pyarrow = pyarrow if name == 'select' else None
+        results.append(run(name, select, len(listings)))
+    amenities.pyarrow = pyarrow
+
+    expected = results[0][1]
+    for result, keep in results:
+        print(json.dumps(result | {'agrees': keep == expected}))
+
+
+if __name__ == '__main__':
+    main()
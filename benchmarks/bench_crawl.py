@@ -0,0 +1,200 @@
+"""End-to-end throughput of the `airbnb` spider, replaying a fixture archive through the replay server.
+
+    python -m benchmarks.bench_crawl [--archive fixtures.zip] [--listings 300] [--reviews 60] [--latency 0.05]
+                                     [--error-rate 0.0] [--rate-limit 0] [--set NAME=VALUE ...] [--save]
+
+Reports requests/sec, items/sec, peak RSS and CPU time per spider callback. Without --archive, a synthetic archive of
+`--listings` listings with `--reviews` reviews each is replayed. With --save, the result is appended to
+benchmarks/results.jsonl along with the current git commit, and compared with the latest saved result of the same
+configuration from another commit.
+
+The crawl runs in its own process, so peak RSS is the crawl's alone.
+"""
+import argparse
+import json
+import os
+import re
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from datetime import date, timedelta
+from scrapy.crawler import CrawlerProcess
+
+from benchmarks.stub_server import write_synthetic_archive
+from deepbnb.spiders.airbnb import AirbnbSpider
+
+RESULTS_FILE = os.path.join(os.path.dirname(__file__), 'results.jsonl')
+TRACKED = ('requests_per_sec', 'items_per_sec', 'peak_rss_mb')
+
+
+class CallbackTimerMiddleware:
+    """Accumulate CPU time spent in each spider callback, in `callback_cpu/<callback>` stats."""
+
+    def __init__(self, stats):
+        self.__stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.stats)
+
+    def process_spider_output(self, response, result, spider):
+        name = self.__callback_name(response, spider)
+        iterator = iter(result)
+        while True:
+            start = time.process_time()
+            try:
+                output = next(iterator)
+            except StopIteration:
+                self.__add(name, start)
+                return
+            self.__add(name, start)
+            yield output
+
+    async def process_spider_output_async(self, response, result, spider):
+        name = self.__callback_name(response, spider)
+        iterator = result.__aiter__()
+        while True:
+            start = time.process_time()
+            try:
+                output = await iterator.__anext__()
+            except StopAsyncIteration:
+                self.__add(name, start)
+                return
+            self.__add(name, start)
+            yield output
+
+    def __add(self, name: str, start: float):
+        self.__stats.inc_value(f'callback_cpu/{name}', time.process_time() - start, start=0.0)
+
+    @staticmethod
+    def __callback_name(response, spider) -> str:
+        callback = response.request.callback or spider.parse
+        return getattr(callback, '__qualname__', repr(callback))
+
+
+def run_crawl(archive: str, latency: float, error_rate: float, settings: dict = None, rate_limit: float = 0.0) -> dict:
+    # serve from another process, so the server neither competes with the crawl for the GIL nor adds to its RSS
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.replay_server', archive, '--port', '0', '--latency', str(latency),
+         '--error-rate', str(error_rate), '--rate-limit', str(rate_limit)],
+        stdout=subprocess.PIPE, text=True
+    )
+    base_url = re.search(r'http://\S+', server.stdout.readline())[0]
+    process = CrawlerProcess(settings={
+        'AIRBNB_API_KEY':                 'bench-key',
+        'CONCURRENT_REQUESTS':            32,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': 32,
+        'DOWNLOADER_MIDDLEWARES':         {
+            'benchmarks.stub_server.StubRedirectMiddleware':           1,
+            'scrapy.downloadermiddlewares.offsite.OffsiteMiddleware': None,  # would drop requests to the stub
+        },
+        'LOG_LEVEL':                      'WARNING',
+        'SPIDER_MIDDLEWARES':             {'benchmarks.bench_crawl.CallbackTimerMiddleware': 950},
+        'STUB_BASE_URL':                  base_url,
+        'TELNETCONSOLE_ENABLED':          False,
+    } | (settings or {}))
+    crawler = process.create_crawler(AirbnbSpider)
+    checkin = date.today() + timedelta(days=30)
+    process.crawl(crawler, query='Springfield, IL', checkin=str(checkin), checkout=str(checkin + timedelta(days=7)))
+    start = time.perf_counter()
+    process.start()
+    elapsed = time.perf_counter() - start
+    server.send_signal(signal.SIGINT)  # prints replay counts on exit
+    replay_counts = json.loads(server.communicate()[0].splitlines()[-1])
+
+    stats = crawler.stats.get_stats()
+    requests = stats.get('downloader/request_count', 0)
+    items = stats.get('item_scraped_count', 0)
+
+    return {
+        'requests':         requests,
+        'items':            items,
+        'seconds':          round(elapsed, 3),
+        'requests_per_sec': round(requests / elapsed, 2),
+        'items_per_sec':    round(items / elapsed, 2),
+        'peak_rss_mb':      round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'retries':          stats.get('retry/count', 0),
+        'ratelimit':        {k[len('ratelimit/'):]: v for k, v in sorted(stats.items()) if k.startswith('ratelimit/')},
+        'replay':           replay_counts,
+        'callback_cpu':     {k[len('callback_cpu/'):]: round(v, 3)
+                             for k, v in sorted(stats.items()) if k.startswith('callback_cpu/')},
+    }
+
+
+def git_commit() -> str:
+    """Return current commit, marked `-dirty` if the work tree has uncommitted changes."""
+    commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True)
+
+    return commit + ('-dirty' if dirty.stdout.strip() else '')
+
+
+def save_result(result: dict):
+    """Append result to results file, then print changes since the latest result from another commit."""
+    previous = None
+    if os.path.exists(RESULTS_FILE):
+        with open(RESULTS_FILE) as f:
+            for line in f:
+                saved = json.loads(line)
+                if saved['config'] == result['config'] and saved['commit'] != result['commit']:
+                    previous = saved
+
+    with open(RESULTS_FILE, 'a') as f:
+        f.write(json.dumps(result) + '\n')
+
+    if previous:
+        for key in TRACKED:
+            before, after = previous[key], result[key]
+            change = (after - before) / before * 100 if before else 0
+            print(f'{key}: {before} -> {after} ({change:+.1f}%) since {previous["commit"]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--archive', help='fixture archive, recorded with the FIXTURE_ARCHIVE setting')
+    parser.add_argument('--listings', type=int, default=300, help='listings in synthetic archive')
+    parser.add_argument('--reviews', type=int, default=60, help='reviews per listing in synthetic archive')
+    parser.add_argument('--latency', type=float, default=0.05, help='replay server latency per response (seconds)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of responses failing with 503')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='replay server requests/sec per operation')
+    parser.add_argument('--set', dest='settings', action='append', default=[], metavar='NAME=VALUE',
+                        help='spider setting, e.g. --set PDP_PARSE_WORKERS=4')
+    parser.add_argument('--save', action='store_true', help='append result to benchmarks/results.jsonl')
+    parser.add_argument('--run', action='store_true', help='run the crawl in this process, print result only')
+    args = parser.parse_args()
+
+    settings = dict(s.split('=', 1) for s in args.settings)
+    if args.run:
+        print(json.dumps(run_crawl(args.archive, args.latency, args.error_rate, settings, args.rate_limit)))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        archive = args.archive
+        if not archive:
+            archive = os.path.join(directory, 'synthetic.zip')
+            write_synthetic_archive(archive, args.listings, args.reviews)
+
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_crawl', '--run', '--archive', archive,
+                                 '--latency', str(args.latency), '--error-rate', str(args.error_rate),
+                                 '--rate-limit', str(args.rate_limit),
+                                 *[f'--set={s}' for s in args.settings]],
+                                check=True, capture_output=True, text=True).stdout
+
+    config = {'archive': args.archive or f'synthetic:{args.listings}x{args.reviews}', 'latency': args.latency,
+              'error_rate': args.error_rate, 'settings': settings}
+    if args.rate_limit:  # keep configs saved before rate limiting comparable
+        config['rate_limit'] = args.rate_limit
+    result = {'benchmark': 'bench_crawl', 'commit': git_commit(), 'date': date.today().isoformat(), 'config': config,
+              **json.loads(output.splitlines()[-1])}
+    print(json.dumps(result, indent=2))
+
+    if args.save:
+        save_result(result)
+
+
+if __name__ == '__main__':
+    main()
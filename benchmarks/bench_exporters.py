@@ -0,0 +1,102 @@
+"""Write time and file size of CSV, xlsx and Parquet feed exporters, for the same synthetic items.
+
+    python -m benchmarks.bench_exporters [--items 10000] [--reviews 20]
+
+Reviews can't be flattened into CSV or xlsx cells usefully, so the format comparison leaves them out. A separate
+Parquet run includes them, written to the `.reviews.parquet` child table, along with `amenity_ids`.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from scrapy.exporters import CsvItemExporter
+
+from deepbnb.exporter import ParquetItemExporter, XlsxItemExporter
+from deepbnb.items import DeepbnbItem
+
+EXPORTERS = {
+    'csv':     (CsvItemExporter, '.csv'),
+    'xlsx':    (XlsxItemExporter, '.xlsx'),
+    'parquet': (ParquetItemExporter, '.parquet'),
+}
+
+
+def make_items(count: int, reviews: int) -> list:
+    rng = random.Random(0)
+    words = ['cozy', 'loft', 'view', 'quiet', 'downtown', 'garden', 'bright', 'studio', 'pool', 'walk']
+    items = []
+    for i in range(count):
+        amenity_ids = sorted(rng.sample(range(1, 300), 30))
+        items.append(DeepbnbItem(
+            id=str(10_000_000 + i),
+            name=' '.join(rng.choices(words, k=4)),
+            amenities=[f'Amenity {a}' for a in amenity_ids],
+            amenity_ids=amenity_ids,
+            available_dates=['2023-06-01/2023-06-08'],
+            avg_rating=round(rng.uniform(3, 5), 2),
+            bathrooms=rng.choice([1, 1.5, 2]),
+            bedrooms=rng.randint(1, 4),
+            beds=rng.randint(1, 6),
+            city='Springfield',
+            description=' '.join(rng.choices(words, k=120)),
+            host_id=str(rng.randint(1, 10 ** 8)),
+            house_rules=['No smoking', 'No pets', 'Check-in after 3:00 PM'],
+            latitude=rng.uniform(39, 40),
+            longitude=rng.uniform(-90, -89),
+            person_capacity=rng.randint(1, 8),
+            photo_count=20,
+            photos=[f'https://a0.muscache.com/im/pictures/{i}-{n}.jpg' for n in range(20)],
+            price_rate=rng.randint(50, 500),
+            price_rate_type='night',
+            review_count=reviews,
+            reviews=[{'comments': ' '.join(rng.choices(words, k=40)), 'created_at': '2022-10-01T12:00:00Z',
+                      'language': 'en', 'rating': rng.randint(1, 5), 'response': ''} for _ in range(reviews)],
+            room_type='Entire home/apt',
+            total_price=rng.randint(350, 3500),
+            url=f'https://www.airbnb.com/rooms/{10_000_000 + i}',
+        ))
+
+    return items
+
+
+def run(name: str, items: list, fields: list, directory: str) -> dict:
+    exporter_cls, ext = EXPORTERS[name]
+    path = os.path.join(directory, name + ext)
+    start = time.perf_counter()
+    with open(path, 'wb') as f:
+        exporter = exporter_cls(f, fields_to_export=fields)
+        exporter.start_exporting()
+        for item in items:
+            exporter.export_item(item.copy())  # xlsx exporter rewrites `name`
+        exporter.finish_exporting()
+    elapsed = time.perf_counter() - start
+
+    size = sum(os.path.getsize(os.path.join(directory, p)) for p in os.listdir(directory) if p.startswith(name + '.'))
+    for p in os.listdir(directory):
+        os.remove(os.path.join(directory, p))
+
+    return {'format': name, 'reviews': 'reviews' in fields, 'items': len(items), 'seconds': round(elapsed, 3),
+            'items_per_sec': round(len(items) / elapsed, 1), 'bytes': size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=10_000)
+    parser.add_argument('--reviews', type=int, default=20, help='reviews per listing, for the Parquet reviews run')
+    args = parser.parse_args()
+
+    items = make_items(args.items, args.reviews)
+    # the xlsx exporter only joins lists of strings, so leave out `amenity_ids`; `amenities` has the same data
+    fields = [f for f in DeepbnbItem.fields if f not in ('amenity_ids', 'reviews')]
+    with tempfile.TemporaryDirectory() as directory:
+        for name in EXPORTERS:
+            print(json.dumps(run(name, items, fields, directory)))
+
+        print(json.dumps(run('parquet', items, fields + ['amenity_ids', 'reviews'], directory)))
+
+
+if __name__ == '__main__':
+    main()
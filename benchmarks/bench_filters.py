@@ -0,0 +1,117 @@
+"""Items/sec of BnbPipeline text filters, compiled rules vs. the former regex search per field and filter.
+
+    python -m benchmarks.bench_filters [--archive fixtures.zip] [--items 100000] [--keywords 0 200]
+
+Filters listing descriptions and names with the README's example filters, CANNOT_HAVE="studio" and
+MUST_HAVE="(atico|attic|balcon|terra|patio|outdoor|roof|view)", plus `--keywords` CANNOT_HAVE keywords more, drawn
+from words that don't occur in descriptions. Descriptions are taken from the listing pages of a fixture archive,
+repeated up to `--items`, or else generated from a vocabulary of English, Spanish and Portuguese words.
+
+Compiled rules are run as configured, i.e. with an Aho-Corasick automaton for many keywords if pyahocorasick is
+installed, and with one regex per rule (`compiled/regex`). Reports items/sec and rejections per filter. The former
+filters match the `repr` of ASCII-encoded fields, so accented words like "balcón" never matched; items filtered
+differently are reported as `differences`.
+"""
+import argparse
+import json
+import random
+import re
+import time
+
+from collections import Counter
+
+from deepbnb import filters
+from deepbnb.api.PdpPlatformSections import PdpPlatformSections
+from deepbnb.filters import ListingFilter
+from deepbnb.fixtures import FixtureArchive
+
+CANNOT_HAVE = 'studio'
+MUST_HAVE = '(atico|attic|balcon|terra|patio|outdoor|roof|view)'
+VOCABULARY = (
+    'a bright and quiet apartment in the heart of the old town with a balcony overlooking the square close to shops '
+    'restaurants and the metro the kitchen is fully equipped and the bedroom has a double bed and air conditioning '
+    'apartamento luminoso y tranquilo en el corazón del casco antiguo con balcón y terraza cerca de tiendas y del '
+    'metro la cocina está totalmente equipada y el dormitorio tiene cama doble y aire acondicionado ático con vistas '
+    'apartamento claro e silencioso no coração da cidade com varanda e vista para o mar perto de lojas e do metrô '
+    'a cozinha está equipada e o quarto tem cama de casal e ar condicionado pátio jardim piscina garagem'
+).split()
+
+
+def load_items(archive_path: str | None, count: int) -> list:
+    """Return `count` items with description and name, from archived listing pages or generated."""
+    rng = random.Random(0)
+    descriptions = []
+    if archive_path:
+        archive = FixtureArchive(archive_path)
+        for url, data in archive:
+            operation, _ = FixtureArchive.parse_url(url)
+            if operation == 'PdpPlatformSections':
+                descriptions.append(PdpPlatformSections.get_listing_fields(data).get('description'))
+        archive.close()
+
+    if not descriptions:
+        descriptions = [' '.join(rng.choices(VOCABULARY, k=rng.randint(40, 200))) for _ in range(min(count, 10000))]
+
+    return [
+        {'id': str(i), 'name': ' '.join(rng.choices(VOCABULARY, k=5)).capitalize(),
+         'description': descriptions[i % len(descriptions)]}
+        for i in range(count)
+    ]
+
+
+def legacy_check(cannot_have: str, must_have: str):
+    """Return the former CANNOT_HAVE / MUST_HAVE check: each regex searched in each ASCII-encoded field in turn."""
+    cannot_have_regex = re.compile(cannot_have, re.IGNORECASE)
+    must_have_regex = re.compile(must_have, re.IGNORECASE)
+    fields = ('description', 'name')
+
+    def search(regex, field_val):
+        return field_val is not None and bool(regex.search(str(field_val.encode('ASCII', 'replace'))))
+
+    def check(item):
+        if any(search(cannot_have_regex, item[f]) for f in fields):
+            return 'cannot_have', None
+        if not any(search(must_have_regex, item[f]) for f in fields):
+            return 'must_have', None
+
+        return None
+
+    return check
+
+
+def run(name: str, check, items: list) -> tuple:
+    start = time.perf_counter()
+    rejections = [check(item) for item in items]
+    elapsed = time.perf_counter() - start
+    rejected = Counter(r[0] for r in rejections if r)
+
+    return {'filter': name, 'items_per_sec': round(len(items) / elapsed), 'rejected': dict(rejected)}, rejections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--archive', help='fixture archive to take descriptions from')
+    parser.add_argument('--items', type=int, default=100000, help='items to filter')
+    parser.add_argument('--keywords', type=int, nargs='+', default=[0, 200], help='extra CANNOT_HAVE keyword counts')
+    args = parser.parse_args()
+
+    items = load_items(args.archive, args.items)
+    rng = random.Random(1)
+    for keyword_count in args.keywords:
+        keywords = ['studio'] + [''.join(rng.choices('bcdfghjklmnpqrstvwxz', k=8)) for _ in range(keyword_count)]
+        cannot_have = f'({"|".join(keywords)})' if keyword_count else CANNOT_HAVE
+        result, legacy = run('legacy', legacy_check(cannot_have, MUST_HAVE), items)
+        print(json.dumps({'keywords': len(keywords)} | result))
+
+        automaton = filters.ahocorasick
+        for name in (['compiled'] if automaton else []) + ['compiled/regex']:
+            filters.ahocorasick = automaton if name == 'compiled' else None
+            listing_filter = ListingFilter(cannot_have=cannot_have, must_have=MUST_HAVE)
+            result, compiled = run(name, listing_filter.check, items)
+            differences = sum((a and a[0]) != (b and b[0]) for a, b in zip(legacy, compiled))
+            print(json.dumps({'keywords': len(keywords)} | result | {'differences': differences}))
+        filters.ahocorasick = automaton
+
+
+if __name__ == '__main__':
+    main()
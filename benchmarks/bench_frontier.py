@@ -0,0 +1,105 @@
+"""Items/sec of one survey split between several `airbnb` spider workers through a shared SQLite frontier.
+
+    python -m benchmarks.bench_frontier [--workers 1 4] [--listings 300] [--reviews 20] [--latency 0.2]
+                                        [--concurrency 4] [--lease 600] [--stop-after SECONDS]
+
+For each worker count, starts that many crawls of the same survey, each replaying a synthetic archive through a
+replay server of its own, as if on its own host, with concurrent requests limited to `--concurrency`, as if by its IP's
+rate limit. Reports wall time and items/sec of the whole survey, and items per worker, then checks that every listing
+of the archive was saved exactly once, by any worker.
+
+With --stop-after, the first worker is shut down after that many seconds, as with Ctrl-C, abandoning the tasks it
+leased but didn't complete. The other workers take over those tasks once their lease, `--lease` seconds, expires.
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from collections import Counter
+
+from benchmarks.stub_server import write_synthetic_archive
+
+
+def start_worker(archive: str, latency: float, concurrency: int, frontier: str, lease: float,
+                 feed: str) -> subprocess.Popen:
+    settings = {
+        'CONCURRENT_REQUESTS':            concurrency,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': concurrency,
+        'FEEDS':                          json.dumps({feed: {'format': 'jsonlines'}}),
+        'FRONTIER':                       frontier,
+        'FRONTIER_LEASE_SECONDS':         lease,
+        'ITEM_PIPELINES':                 json.dumps({'deepbnb.pipelines.DuplicatesPipeline': 299}),
+    }
+
+    return subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.bench_crawl', '--run', '--archive', archive, '--latency', str(latency),
+         *[f'--set={name}={value}' for name, value in settings.items()]],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+
+
+def run(archive: str, listings: int, workers: int, latency: float, concurrency: int, lease: float,
+        stop_after: float) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        frontier = os.path.join(directory, 'frontier.sqlite')
+        feeds = [os.path.join(directory, f'worker-{i}.jsonl') for i in range(workers)]
+        start = time.perf_counter()
+        processes = [start_worker(archive, latency, concurrency, frontier, lease, feed) for feed in feeds]
+        if stop_after:
+            time.sleep(stop_after)
+            processes[0].send_signal(signal.SIGINT)
+
+        for process in processes:
+            process.communicate()
+        elapsed = time.perf_counter() - start
+
+        worker_items = []
+        saved = Counter()
+        for feed in feeds:
+            ids = []
+            if os.path.exists(feed):
+                with open(feed) as f:
+                    ids = [json.loads(line)['id'] for line in f]
+            worker_items.append(len(ids))
+            saved.update(ids)
+
+    duplicates = sum(count - 1 for count in saved.values())
+    if duplicates or len(saved) != listings:
+        raise AssertionError(f'{workers} workers saved {len(saved)} of {listings} listings, {duplicates} duplicates')
+
+    return {
+        'workers':       workers,
+        'stopped':       bool(stop_after),
+        'items':         sum(worker_items),
+        'seconds':       round(elapsed, 3),
+        'items_per_sec': round(sum(worker_items) / elapsed, 2),
+        'worker_items':  worker_items,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4], help='worker counts to run')
+    parser.add_argument('--listings', type=int, default=300, help='listings in synthetic archive')
+    parser.add_argument('--reviews', type=int, default=20, help='reviews per listing in synthetic archive')
+    parser.add_argument('--latency', type=float, default=0.2, help='replay server latency per response (seconds)')
+    parser.add_argument('--concurrency', type=int, default=4, help='concurrent requests per worker')
+    parser.add_argument('--lease', type=float, default=600, help='frontier lease (seconds)')
+    parser.add_argument('--stop-after', type=float, help='shut the first worker down after this many seconds')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        archive = os.path.join(directory, 'synthetic.zip')
+        write_synthetic_archive(archive, args.listings, args.reviews)
+        for workers in args.workers:
+            print(json.dumps(run(archive, args.listings, workers, args.latency, args.concurrency, args.lease,
+                                 args.stop_after)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Decode time and allocations of API responses per JSON decoder.
+
+    python -m benchmarks.bench_json [--archive fixtures.zip] [--listings 50] [--padding 100] [--repeat 5]
+
+Without --archive, a synthetic archive is decoded, with `--padding` unused sections per listing page to make listing
+pages about as large as real ones. For each API operation, reports mean time per body and, from tracemalloc, mean peak
+and retained Python allocations per body.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.stub_server import write_synthetic_archive
+from deepbnb.api.ApiBase import ApiBase, orjson
+from deepbnb.api.ExploreSearch import ExploreSearch
+from deepbnb.api.PdpAvailabilityCalendar import PdpAvailabilityCalendar
+from deepbnb.api.PdpPlatformSections import PdpPlatformSections
+from deepbnb.api.PdpReviews import PdpReviews
+from deepbnb.fixtures import FixtureArchive
+
+APIS = {api.__name__: api for api in (ExploreSearch, PdpAvailabilityCalendar, PdpPlatformSections, PdpReviews)}
+
+
+def load_bodies(archive_path: str) -> dict:
+    """Load archived response bodies, by API operation."""
+    bodies = {}
+    archive = FixtureArchive(archive_path)
+    for url, data in archive:
+        operation, _ = FixtureArchive.parse_url(url)
+        if operation in APIS:
+            bodies.setdefault(operation, []).append(json.dumps(data).encode())
+    archive.close()
+
+    return bodies
+
+
+def run(bodies: list, decoder: str, repeat: int) -> dict:
+    decode = ApiBase.decode_data
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for body in bodies:
+            decode(body, decoder)
+    elapsed = time.perf_counter() - start
+
+    peak = retained = 0
+    for body in bodies:
+        tracemalloc.start()
+        data = decode(body, decoder)
+        retained += tracemalloc.get_traced_memory()[0]
+        peak += tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del data
+
+    return {
+        'decoder':          decoder,
+        'us_per_body':      round(elapsed / (repeat * len(bodies)) * 1e6, 1),
+        'peak_kb_per_body': round(peak / len(bodies) / 1024, 1),
+        'kept_kb_per_body': round(retained / len(bodies) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--archive', help='fixture archive, recorded with the FIXTURE_ARCHIVE setting')
+    parser.add_argument('--listings', type=int, default=50, help='listings in synthetic archive')
+    parser.add_argument('--padding', type=int, default=100, help='unused sections per synthetic listing page')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.archive:
+        bodies = load_bodies(args.archive)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            archive = os.path.join(directory, 'synthetic.zip')
+            write_synthetic_archive(archive, args.listings, 60, pdp_padding=args.padding)
+            bodies = load_bodies(archive)
+
+    decoders = ['json', 'orjson'] if orjson else ['json']
+
+    for operation, operation_bodies in sorted(bodies.items()):
+        size = sum(map(len, operation_bodies)) / len(operation_bodies)
+        print(f'{operation}: {len(operation_bodies)} bodies, {size / 1024:.1f} KB mean')
+        for decoder in decoders:
+            print(json.dumps(run(operation_bodies, decoder, args.repeat)))
+
+
+if __name__ == '__main__':
+    main()
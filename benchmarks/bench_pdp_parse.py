@@ -0,0 +1,43 @@
+"""Listing page parsing throughput, inline on the reactor thread vs. in worker processes (PDP_PARSE_WORKERS).
+
+    python -m benchmarks.bench_pdp_parse [--listings 2000] [--padding 100] [--workers 2,4]
+
+Replays a synthetic archive with large listing pages (`--padding` unused sections of about 2 KB each) and no reviews,
+without latency, so parsing is the bottleneck. Each run is a `bench_crawl` run in its own process.
+
+Worker processes move parsing off the reactor thread (see `callback_cpu`), but copying bodies to them costs about as
+much as the parsing saved: on 1 core with 200 listings, items/sec stayed within 5% of inline parsing. Workers can only
+come out ahead with more cores than workers.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.stub_server import write_synthetic_archive
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--listings', type=int, default=2000)
+    parser.add_argument('--padding', type=int, default=100, help='unused sections per listing page')
+    parser.add_argument('--workers', default='2,4', help='comma-separated PDP_PARSE_WORKERS values to compare')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        archive = os.path.join(directory, 'synthetic.zip')
+        write_synthetic_archive(archive, args.listings, 0, pdp_padding=args.padding)
+
+        for workers in [0] + [int(w) for w in args.workers.split(',')]:
+            output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_crawl', '--run', '--archive', archive,
+                                     '--latency', '0', f'--set=PDP_PARSE_WORKERS={workers}'],
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.splitlines()[-1])
+            print(json.dumps({'pdp_parse_workers': workers, 'items': result['items'], 'seconds': result['seconds'],
+                              'items_per_sec': result['items_per_sec'], 'callback_cpu': result['callback_cpu']}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Items/sec and throttled requests of the `airbnb` spider against a rate limited replay server, with and without
+adaptive rate limiting.
+
+    python -m benchmarks.bench_ratelimit [--listings 100] [--reviews 20] [--latency 0.05] [--rate-limit 5]
+                                         [--concurrency 16] [--increase 1.0]
+
+The replay server answers each API operation at most `--rate-limit` requests/sec, and 429 beyond that. Without
+RATE_LIMIT_ENABLED, the spider requests as fast as `--concurrency` allows, and listings whose retries are all
+throttled are lost. With it, each endpoint's rate converges on the server's limit, rising by `--increase`
+requests/sec per second (RATE_LIMIT_INCREASE). Reports items, wall time, throttled
+responses, requests given up after retries, and the achieved and final rate per endpoint.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.stub_server import write_synthetic_archive
+
+
+def run(archive: str, latency: float, rate_limit: float, concurrency: int, increase: float, enabled: bool) -> dict:
+    settings = {
+        'AUTOTHROTTLE_ENABLED':           False,
+        'CONCURRENT_REQUESTS':            concurrency,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': concurrency,
+        'RATE_LIMIT_ENABLED':             enabled,
+        'RATE_LIMIT_INCREASE':            increase,
+        'DOWNLOADER_MIDDLEWARES':         json.dumps({
+            'benchmarks.stub_server.StubRedirectMiddleware':           1,
+            'scrapy.downloadermiddlewares.offsite.OffsiteMiddleware': None,
+            'deepbnb.middlewares.AdaptiveRateLimitMiddleware':         600,
+        }),
+    }
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_crawl', '--run', '--archive', archive, '--latency', str(latency),
+         '--rate-limit', str(rate_limit), *[f'--set={name}={value}' for name, value in settings.items()]],
+        check=True, capture_output=True, text=True
+    ).stdout
+    result = json.loads(output.splitlines()[-1])
+    ratelimit = result['ratelimit']
+    endpoints = sorted({key.split('/')[0] for key in ratelimit})
+
+    return {
+        'rate_limiting': enabled,
+        'items':         result['items'],
+        'seconds':       result['seconds'],
+        'items_per_sec': result['items_per_sec'],
+        'throttled':     result['replay'].get('throttled', 0),
+        'retries':       result['retries'],
+        'endpoints':     {endpoint: {
+            'achieved_rate': ratelimit.get(f'{endpoint}/achieved_rate'),
+            'final_rate':    ratelimit.get(f'{endpoint}/rate'),
+            'backoffs':      ratelimit.get(f'{endpoint}/backoffs', 0),
+        } for endpoint in endpoints},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--listings', type=int, default=100, help='listings in synthetic archive')
+    parser.add_argument('--reviews', type=int, default=20, help='reviews per listing in synthetic archive')
+    parser.add_argument('--latency', type=float, default=0.05, help='replay server latency per response (seconds)')
+    parser.add_argument('--rate-limit', type=float, default=5, help='replay server requests/sec per operation')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent requests')
+    parser.add_argument('--increase', type=float, default=1.0, help='RATE_LIMIT_INCREASE setting')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        archive = os.path.join(directory, 'synthetic.zip')
+        write_synthetic_archive(archive, args.listings, args.reviews)
+        for enabled in (False, True):
+            print(json.dumps(run(archive, args.latency, args.rate_limit, args.concurrency, args.increase, enabled)))
+
+
+if __name__ == '__main__':
+    main()
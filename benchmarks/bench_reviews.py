@@ -0,0 +1,118 @@
+"""Listings/sec for PDP + review fetching, scheduled (current) vs. blocking `requests.get` (legacy).
+
+    python -m benchmarks.bench_reviews [--listings 200] [--latency 0.05] [--reviews 120]
+
+Each mode runs in its own process, since a Twisted reactor can only be started once.
+"""
+import argparse
+import json
+import requests
+import scrapy
+import subprocess
+import sys
+import time
+
+from scrapy.crawler import CrawlerProcess
+
+from benchmarks.stub_server import AIRBNB_BASE_URL, start_stub_server
+from deepbnb.api.PdpPlatformSections import PdpPlatformSections
+from deepbnb.api.PdpReviews import PdpReviews
+
+class BlockingPdpReviews(PdpReviews):
+    """Legacy review fetching: one blocking `requests.get` per batch, on the reactor thread."""
+
+    def __init__(self, *args, base_url, limit=50, **kwargs):
+        super().__init__(*args, limit=limit, **kwargs)
+        self.__base_url = base_url
+        self.__limit = limit
+
+    def api_request(self, item, offset=0):
+        reviews, n_reviews_total = self.__get_batch(item['id'], offset)
+        for batch_offset in range(self.__limit, n_reviews_total, self.__limit):
+            reviews.extend(self.__get_batch(item['id'], batch_offset)[0])
+
+        item['reviews'] = reviews
+        return item
+
+    def __get_batch(self, listing_id, offset):
+        url = self._get_url(listing_id, self.__limit, offset).replace(AIRBNB_BASE_URL, self.__base_url)
+        pdp_reviews = requests.get(url, headers=self._get_search_headers()).json()['data']['merlin']['pdpReviews']
+        return pdp_reviews['reviews'], int(pdp_reviews['metadata']['reviewsCount'])
+
+
+class ReviewsBenchSpider(scrapy.Spider):
+    name = 'bench_reviews'
+
+    def __init__(self, mode, listings, base_url, **kwargs):
+        super().__init__(**kwargs)
+        self.__mode = mode
+        self.__listing_ids = [str(10_000_000 + i) for i in range(int(listings))]
+        self.__base_url = base_url
+
+    def start_requests(self):
+        args = ('bench-key', self.logger, 'USD')
+        if self.__mode == 'blocking':
+            pdp_reviews = BlockingPdpReviews(*args, base_url=self.__base_url)
+        else:
+            pdp_reviews = PdpReviews(*args)
+
+        data_cache = {listing_id: self.__search_data() for listing_id in self.__listing_ids}
+        geography = {'city': 'Springfield', 'country': 'US', 'placeId': 'bench', 'state': 'IL'}
+        pdp_platform_sections = PdpPlatformSections(*args, data_cache, geography, pdp_reviews)
+        for listing_id in self.__listing_ids:
+            yield pdp_platform_sections.api_request(listing_id)
+
+    @staticmethod
+    def __search_data():
+        """Listing data as cached by AirbnbSpider._collect_listing_data."""
+        return {
+            'avg_rating': 4.8, 'bathrooms': 1, 'bedrooms': 1, 'beds': 1, 'business_travel_ready': False,
+            'city': 'Springfield', 'host_id': 1, 'latitude': 39.8, 'longitude': -89.6, 'name': 'Bench listing',
+            'neighborhood_overview': None, 'person_capacity': 2, 'photo_count': 10, 'photos': [], 'review_count': 1,
+            'room_and_property_type': 'Entire home', 'room_type': 'Entire home/apt',
+            'room_type_category': 'entire_home', 'star_rating': 5, 'monthly_price_factor': None,
+            'weekly_price_factor': None, 'price_rate': 100, 'price_rate_type': 'night', 'total_price': None,
+        }
+
+
+def run_mode(mode, listings, latency, reviews):
+    server = start_stub_server(latency=latency, reviews_count=reviews)
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    process = CrawlerProcess(settings={
+        'CONCURRENT_REQUESTS':            32,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': 32,
+        'DOWNLOADER_MIDDLEWARES':         {'benchmarks.stub_server.StubRedirectMiddleware': 1},
+        'LOG_LEVEL':                      'WARNING',
+        'STUB_BASE_URL':                  base_url,
+    })
+    crawler = process.create_crawler(ReviewsBenchSpider)
+    process.crawl(crawler, mode=mode, listings=listings, base_url=base_url)
+    start = time.perf_counter()
+    process.start()
+    elapsed = time.perf_counter() - start
+
+    items = crawler.stats.get_value('item_scraped_count', 0)
+    print(json.dumps({'mode': mode, 'items': items, 'seconds': round(elapsed, 3),
+                      'listings_per_sec': round(items / elapsed, 2)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--listings', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help='stub server latency per response (seconds)')
+    parser.add_argument('--reviews', type=int, default=120, help='reviews per listing')
+    parser.add_argument('--mode', choices=['scheduled', 'blocking'], help='run a single mode in this process')
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.listings, args.latency, args.reviews)
+        return
+
+    for mode in ('blocking', 'scheduled'):
+        subprocess.run([sys.executable, '-m', 'benchmarks.bench_reviews', '--mode', mode,
+                        '--listings', str(args.listings), '--latency', str(args.latency),
+                        '--reviews', str(args.reviews)], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Request URLs/sec per API, built from a URL template vs. encoding all request variables per URL.
+
+    python -m benchmarks.bench_urls [--urls 20000]
+
+Every templated URL is checked against the URL built by the API's `_build_url`, which encodes all request variables
+as before templates, and the benchmark fails on the first difference. `api_request` rates include building the
+`scrapy.Request`, for scale. ExploreSearch is left out: most of its request variables vary per search, and a template
+was slower than its builder, which it still uses.
+"""
+import argparse
+import json
+import logging
+import random
+import time
+
+from deepbnb.api.PdpAvailabilityCalendar import PdpAvailabilityCalendar
+from deepbnb.api.PdpPlatformSections import PdpPlatformSections
+from deepbnb.api.PdpReviews import PdpReviews
+
+
+def make_cases(count: int) -> dict:
+    """Return (API, _get_url arguments, request variables they stand for) per API, for `count` URLs each."""
+    rng = random.Random(0)
+    logger = logging.getLogger('bench_urls')
+    pdp_calendar = PdpAvailabilityCalendar('bench-key', logger, 'USD', {}, [('2023-06-01', '2023-06-08')], None)
+    pdp_platform_sections = PdpPlatformSections('bench-key', logger, 'USD', {}, {}, None)
+    pdp_reviews = PdpReviews('bench-key', logger, 'USD')
+
+    cases = {'PdpAvailabilityCalendar': [], 'PdpPlatformSections': [], 'PdpReviews': []}
+    for _ in range(count):
+        listing_id = str(rng.randint(10 ** 6, 10 ** 9))
+        month, year, months = rng.randint(1, 12), 2023, rng.randint(1, 3)
+        cases['PdpAvailabilityCalendar'].append(
+            (pdp_calendar, (listing_id, month, year, months),
+             {'count': months, 'listingId': listing_id, 'month': month, 'year': year}))
+        cases['PdpPlatformSections'].append((pdp_platform_sections, (listing_id,), {'id': listing_id}))
+        offset = rng.randrange(0, 500, 50)
+        cases['PdpReviews'].append(
+            (pdp_reviews, (listing_id, 50, offset),
+             {'limit': 50, 'listingId': listing_id} | ({'offset': offset} if offset else {})))
+
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--urls', type=int, default=20000, help='URLs per API')
+    args = parser.parse_args()
+
+    for name, cases in make_cases(args.urls).items():
+        start = time.perf_counter()
+        encoded = [api._build_url(api.request_variables | variables) for api, _, variables in cases]
+        encoded_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        templated = [api._get_url(*url_args) for api, url_args, _ in cases]
+        templated_time = time.perf_counter() - start
+
+        for url, expected in zip(templated, encoded):
+            if url != expected:
+                raise AssertionError(f'{name} URL differs:\n{url}\n{expected}')
+
+        result = {'api': name, 'urls': len(cases), 'encoded_per_sec': round(len(cases) / encoded_time),
+                  'templated_per_sec': round(len(cases) / templated_time),
+                  'speedup': round(encoded_time / templated_time, 1)}
+        if name == 'PdpPlatformSections':
+            api = cases[0][0]
+            start = time.perf_counter()
+            for _, url_args, _ in cases:
+                api.api_request(*url_args)
+            result['api_request_per_sec'] = round(len(cases) / (time.perf_counter() - start))
+
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""Stub HTTP server replaying a fixture archive, with configurable latency and error rate.
+
+    python -m benchmarks.replay_server fixtures.zip [--port 8080] [--latency 0.05] [--error-rate 0.01]
+                                                    [--rate-limit 5]
+
+A request is answered with the fixture recorded for the same request variables. Failing that, with a fixture for the
+same listing / page (see `fallback_keys`), so a crawl with different search parameters still replays. Failing that,
+with any fixture for the same operation, picked by hash of the request variables.
+
+With --rate-limit, each operation answers at most that many requests/sec, and 429 with `Retry-After: 1` beyond it, as
+Airbnb throttles its API.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from deepbnb.fixtures import FixtureArchive
+
+fallback_keys = {
+    'ExploreSearch':           ('itemsOffset',),
+    'PdpAvailabilityCalendar': ('listingId',),
+    'PdpPlatformSections':     ('id',),
+    'PdpReviews':              ('listingId', 'offset'),
+}
+
+
+class Fixtures:
+    """Archived response bodies, indexed for lookup by request URL."""
+
+    def __init__(self, archive_path: str):
+        self.__exact = {}
+        self.__fallback = {}
+        self.__by_operation = {}
+
+        archive = FixtureArchive(archive_path)
+        for url, data in archive:
+            body = json.dumps(data).encode()
+            operation, variables = FixtureArchive.parse_url(url)
+            self.__exact[FixtureArchive.fixture_name(url)] = body
+            self.__fallback.setdefault(self.__fallback_key(operation, variables), body)
+            self.__by_operation.setdefault(operation, []).append(body)
+
+        archive.close()
+
+    def __len__(self) -> int:
+        return len(self.__exact)
+
+    def find(self, url: str) -> tuple:
+        """Return (body, match type) for URL. Body is None if there's no fixture for the operation."""
+        body = self.__exact.get(FixtureArchive.fixture_name(url))
+        if body:
+            return body, 'exact'
+
+        operation, variables = FixtureArchive.parse_url(url)
+        body = self.__fallback.get(self.__fallback_key(operation, variables))
+        if body:
+            return body, 'fallback'
+
+        candidates = self.__by_operation.get(operation)
+        if not candidates:
+            return None, 'missing'
+
+        index = zlib.crc32(json.dumps(variables, sort_keys=True).encode()) % len(candidates)
+
+        return candidates[index], 'operation'
+
+    @staticmethod
+    def __fallback_key(operation: str, variables: dict) -> tuple:
+        return (operation,) + tuple(variables.get(k) or None for k in fallback_keys.get(operation, ()))
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """Replay archived responses, delayed by the server's latency, failing with 503 at the server's error rate and
+    429 beyond its rate limit."""
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+        if server.rate_limit and not server.take_token(self.path.split('?', 1)[0]):
+            server.count('throttled')
+            self.send_response(429)
+            self.send_header('Retry-After', '1')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if server.error_rate and server.random.random() < server.error_rate:
+            server.count('errors')
+            self.send_error(503)
+            return
+
+        body, match = server.fixtures.find(self.path)
+        server.count(match)
+        if body is None:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, fixtures: Fixtures, latency: float, error_rate: float, port: int, seed: int,
+                 rate_limit: float = 0.0):
+        super().__init__(('127.0.0.1', port), ReplayHandler)
+        self.counts = {}
+        self.error_rate = error_rate
+        self.fixtures = fixtures
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.rate_limit = rate_limit
+        self.__buckets = {}
+        self.__lock = threading.Lock()
+
+    def count(self, key: str):
+        with self.__lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def take_token(self, path: str) -> bool:
+        """Take a token from the path's bucket, refilled at the rate limit, holding up to a second's worth."""
+        capacity = max(self.rate_limit, 1)
+        with self.__lock:
+            now = time.monotonic()
+            tokens, updated = self.__buckets.get(path, (capacity, now))
+            tokens = min(tokens + (now - updated) * self.rate_limit, capacity)
+            taken = tokens >= 1
+            self.__buckets[path] = (tokens - taken, now)
+
+            return taken
+
+
+def start_replay_server(
+        archive_path: str,
+        latency: float = 0.05,
+        error_rate: float = 0.0,
+        port: int = 0,
+        seed: int = 0,
+        rate_limit: float = 0.0
+) -> ReplayServer:
+    """Start replay server in a daemon thread. Return server; its base URL is `http://127.0.0.1:<server_port>`."""
+    server = ReplayServer(Fixtures(archive_path), latency, error_rate, port, seed, rate_limit)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('archive', help='fixture archive, recorded with the FIXTURE_ARCHIVE setting')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.05, help='latency per response (seconds)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='requests/sec per operation, 0 for no limit')
+    args = parser.parse_args()
+
+    server = ReplayServer(Fixtures(args.archive), args.latency, args.error_rate, args.port, 0, args.rate_limit)
+    print(f'Replaying {len(server.fixtures)} fixtures on http://127.0.0.1:{server.server_port}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(server.counts))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+import json
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from deepbnb.api.ExploreSearch import ExploreSearch
+from deepbnb.api.PdpPlatformSections import PdpPlatformSections
+from deepbnb.api.PdpReviews import PdpReviews
+from deepbnb.fixtures import FixtureArchive
+
+
+AIRBNB_BASE_URL = 'https://www.airbnb.com'
+GEOGRAPHY = {'city': 'Springfield', 'country': 'US', 'placeId': 'bench', 'state': 'IL'}
+
+
+class StubRedirectMiddleware:
+    """Send requests for www.airbnb.com to the stub server (STUB_BASE_URL setting) instead."""
+
+    def __init__(self, base_url):
+        self._base_url = base_url
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings.get('STUB_BASE_URL'))
+
+    def process_request(self, request, spider):
+        if request.url.startswith(AIRBNB_BASE_URL):
+            return request.replace(url=self._base_url + request.url[len(AIRBNB_BASE_URL):])
+
+
+def explore_search_payload(listing_ids: list, items_offset: int, has_next_page: bool, reviews_count: int) -> dict:
+    """Build an ExploreSearch response holding one page of search results."""
+    items = [{
+        'listing':      {
+            'id':                  listing_id,
+            'avgRating':           4.8,
+            'bathrooms':           1,
+            'bedrooms':            1,
+            'beds':                1,
+            'city':                GEOGRAPHY['city'],
+            'contextualPictures':  [{'picture': f'https://a0.muscache.com/im/pictures/{listing_id}-{i}.jpg'}
+                                    for i in range(10)],
+            'lat':                 39.8,
+            'lng':                 -89.6,
+            'name':                f'Bench listing {listing_id}',
+            'personCapacity':      2,
+            'pictureCount':        10,
+            'reviewsCount':        reviews_count,
+            'roomAndPropertyType': 'Entire home',
+            'roomType':            'Entire home/apt',
+            'roomTypeCategory':    'entire_home',
+            'starRating':          5,
+            'user':                {'id': '1'},
+        },
+        'pricingQuote': {
+            'monthlyPriceFactor':        0.8,
+            'rateWithServiceFee':        {'amount': 120},
+            'structuredStayDisplayPrice': {
+                'primaryLine':   {'price': '$120', 'qualifier': 'night'},
+                'secondaryLine': {'price': '$840 total'},
+            },
+            'weeklyPriceFactor':         0.9,
+        },
+    } for listing_id in listing_ids]
+
+    return {'data': {'dora': {'exploreV3': {
+        'filters':  {'state': [{'key': 'query', 'value': {'stringValue': GEOGRAPHY['city']}}]},
+        'metadata': {
+            'geography':          GEOGRAPHY,
+            'paginationMetadata': {
+                'hasNextPage':     has_next_page,
+                'itemsOffset':     items_offset + len(listing_ids),
+                'searchSessionId': 'bench-session',
+            },
+        },
+        'sections': [{'sectionComponentType': 'listings_ListingsGrid_Explore', 'items': items}],
+    }}}}
+
+
+def pdp_platform_sections_payload(listing_id: str, padding: int = 0) -> dict:
+    """Build a PdpPlatformSections response for a listing.
+
+    :param padding: number of unused sections (about 2 KB each) to add, real responses are a few hundred KB
+    """
+    amenities = [
+        {'id': f'pdp_amenity_{i}_item', 'title': f'Amenity {i}', 'subtitle': None, 'available': True}
+        for i in (4, 8, 33, 34, 58)
+    ]
+    sections = {
+        'AMENITIES_DEFAULT':    {'seeAllAmenitiesGroups': [
+            {'title': 'Basic', 'amenities': amenities},
+            {'title': 'Guest access', 'amenities': [
+                {'id': 'pdp_amenity_57_item', 'title': 'Whole place', 'subtitle': 'Private entrance', 'available': True}
+            ]},
+        ]},
+        'DESCRIPTION_DEFAULT':  {'htmlDescription': {'htmlText': '<p>' + 'A lovely place to stay. ' * 40 + '</p>'}},
+        'HOST_PROFILE_DEFAULT': {'hostInfos': [{'title': 'During your stay', 'html': {'htmlText': '<p>Text me</p>'}}]},
+        'LOCATION_DEFAULT':     {'seeAllLocationDetails': [
+            {'title': 'Getting around', 'content': {'htmlText': '<p>Bus stop nearby</p>'}}
+        ]},
+        'POLICIES_DEFAULT':     {
+            'additionalHouseRules': 'Be nice',
+            'houseRules':           [{'title': 'No smoking'}, {'title': 'No parties or events'}],
+            'listingExpectations':  [{'title': 'Stairs', 'subtitle': 'Two flights'}],
+        },
+    }
+    for i in range(padding):
+        sections[f'UNUSED_{i}'] = {'items': [
+            {'id': f'{listing_id}-{i}-{j}', 'title': f'Item {j}', 'html': {'htmlText': '<p>Unused text.</p>' * 4},
+             'flags': [True, False, None], 'position': {'x': j, 'y': i}} for j in range(8)
+        ]}
+    ratings = ('accuracy', 'checkin', 'cleanliness', 'communication', 'location', 'value')
+    return {'data': {'merlin': {'pdpSections': {
+        'id':       listing_id,
+        'sections': [{'sectionId': k, 'section': v} for k, v in sections.items()],
+        'metadata': {
+            'bookingPrefetchData': {'isHotelRatePlanEnabled': False},
+            'loggingContext':      {'eventDataLogging': {
+                **{f'{r}Rating': 4.8 for r in ratings}, 'guestSatisfactionOverall': 4.9
+            }},
+        },
+    }}}}
+
+
+def pdp_reviews_payload(listing_id: str, limit: int, offset: int, reviews_count: int) -> dict:
+    """Build a PdpReviews response holding one batch of reviews."""
+    reviews = [{
+        'comments':  f'Review {i} of listing {listing_id}. Great stay, would book again.',
+        'createdAt': '2022-10-01T12:00:00Z',
+        'language':  'en',
+        'rating':    5,
+        'response':  None,
+    } for i in range(offset, min(offset + limit, reviews_count))]
+
+    return {'data': {'merlin': {'pdpReviews': {
+        'metadata': {'reviewsCount': reviews_count},
+        'reviews':  reviews,
+    }}}}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serve synthetic Airbnb API v3 responses, delayed by the server's configured latency."""
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        parsed = urlparse(self.path)
+        qs = parse_qs(parsed.query)
+        request = json.loads(qs['variables'][0])['request'] if 'variables' in qs else {}
+
+        if parsed.path == '/api/v3/PdpPlatformSections':
+            payload = pdp_platform_sections_payload(request['id'])
+        elif parsed.path == '/api/v3/PdpReviews':
+            payload = pdp_reviews_payload(
+                request['listingId'], request['limit'], request.get('offset', 0), self.server.reviews_count)
+        else:
+            self.send_error(404)
+            return
+
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_server(latency: float = 0.05, reviews_count: int = 120, port: int = 0) -> ThreadingHTTPServer:
+    """Start stub server in a daemon thread. Return server; its base URL is `http://127.0.0.1:<server_port>`."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.reviews_count = reviews_count
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def write_synthetic_archive(path: str, listings: int, reviews_count: int, page_size: int = 20, pdp_padding: int = 0):
+    """Write a fixture archive for a search returning `listings` listings, for replay when nothing has been recorded.
+
+    URLs are built by the API classes, so fixtures look just like recorded ones.
+    """
+    args = ('bench-key', None, 'USD')
+    explore_search = ExploreSearch(*args, None, None, GEOGRAPHY, GEOGRAPHY['city'])
+    pdp_reviews = PdpReviews(*args)
+    pdp_platform_sections = PdpPlatformSections(*args, {}, GEOGRAPHY, pdp_reviews)
+    listing_ids = [str(10_000_000 + i) for i in range(listings)]
+
+    archive = FixtureArchive(path, 'a')
+    for offset in range(0, listings, page_size):
+        page = listing_ids[offset:offset + page_size]
+        url = explore_search._get_url(GEOGRAPHY['city'], {'itemsOffset': offset} if offset else None)
+        archive.add(url, explore_search_payload(page, offset, offset + page_size < listings, reviews_count))
+
+    limit = 50
+    for listing_id in listing_ids:
+        url = pdp_platform_sections.api_request(listing_id).url
+        archive.add(url, pdp_platform_sections_payload(listing_id, pdp_padding))
+        for offset in range(0, reviews_count, limit):
+            url = pdp_reviews._get_url(listing_id, limit, offset)
+            archive.add(url, pdp_reviews_payload(listing_id, limit, offset, reviews_count))
+
+    archive.close()
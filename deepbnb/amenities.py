@@ -0,0 +1,138 @@
+import sys
+
+from array import array
+
+try:
+    import pyarrow
+    import pyarrow.compute
+except ImportError:
+    pyarrow = None
+
+
+class AmenityBits:
+    """Mapping of amenity ids to bits of compact bitsets, one per listing.
+
+    Known amenity ids, e.g. those in PROPERTY_AMENITIES, are given the lowest bits in order of id, so the amenities
+    filtered on take the first bytes of each bitset. Any other id is given the next free bit when first seen, so a
+    bitset takes about one bit per distinct amenity id seen. Bitsets only agree under the same mapping, so the text
+    index stores its mapping along with its bitsets.
+    """
+
+    def __init__(self, known_ids=()):
+        self.bits = {a: bit for bit, a in enumerate(sorted({int(a) for a in known_ids}))}  # known amenity id: bit
+
+    @classmethod
+    def load(cls, bits) -> 'AmenityBits':
+        """Return mapping of stored (known amenity id, bit) pairs."""
+        amenity_bits = cls()
+        amenity_bits.bits = dict(bits)
+
+        return amenity_bits
+
+    def bit(self, amenity_id: int) -> int:
+        """Return bit of amenity id, mapping it to the next free bit if not mapped yet."""
+        bit = self.bits.get(amenity_id)
+        if bit is None:
+            bit = self.bits[amenity_id] = len(self.bits)
+
+        return bit
+
+    def bitset(self, amenity_ids) -> int:
+        """Return bitset of amenity ids."""
+        bitset = 0
+        for amenity_id in amenity_ids:
+            bitset |= 1 << self.bit(amenity_id)
+
+        return bitset
+
+    @staticmethod
+    def to_bytes(bitset: int) -> bytes:
+        return bitset.to_bytes((bitset.bit_length() + 7) // 8, 'little')
+
+
+class AmenityFilter:
+    """AMENITIES_REQUIRED and AMENITIES_EXCLUDED: amenities a listing must all have, or must have none of.
+
+    Amenities are given by id, or by name in PROPERTY_AMENITIES. Those ids and the filtered ids are the known ids of the
+    filter's amenity bit mapping. `check` tests one item's bitset against the required and excluded masks. `select`
+    tests the bitsets of a stored crawl, a 64 bit word at a time for all listings, with pyarrow compute functions if
+    installed.
+    """
+
+    def __init__(self, required=(), excluded=(), names: dict = None):
+        """Class constructor.
+
+        :param names: amenity name: id, e.g. PROPERTY_AMENITIES
+        """
+        self.required = [self.__amenity_id(a, names or {}) for a in required]
+        self.excluded = [self.__amenity_id(a, names or {}) for a in excluded]
+        self.amenity_bits = AmenityBits([*(names or {}).values(), *self.required, *self.excluded])
+        self.required_mask = self.amenity_bits.bitset(self.required)
+        self.excluded_mask = self.amenity_bits.bitset(self.excluded)
+
+    def __bool__(self):
+        return bool(self.required or self.excluded)
+
+    @staticmethod
+    def __amenity_id(amenity, names: dict) -> int:
+        if isinstance(amenity, str) and not amenity.isdigit():
+            if amenity not in names:
+                raise ValueError(f'Unknown amenity {amenity!r}, add its id to PROPERTY_AMENITIES')
+            return names[amenity]
+
+        return int(amenity)
+
+    def check(self, bitset: int) -> tuple | None:
+        """Check item amenity bitset, mapped by `amenity_bits`. If rejected, return (filter name, reason)."""
+        if bitset & self.required_mask != self.required_mask:
+            missing = [a for a in self.required if not bitset >> self.amenity_bits.bit(a) & 1]
+            return 'amenities_required', 'Missing amenities: {}'.format(missing)
+
+        if bitset & self.excluded_mask:
+            found = [a for a in self.excluded if bitset >> self.amenity_bits.bit(a) & 1]
+            return 'amenities_excluded', 'Excluded amenities: {}'.format(found)
+
+        return None
+
+    def masks(self, amenity_bits: AmenityBits = None) -> dict:
+        """Return (required, excluded) masks per 64 bit word of bitsets mapped by `amenity_bits` (default: the filter's
+        mapping), for words with any filtered bits. Filtered ids `amenity_bits` hasn't mapped yet are mapped."""
+        if amenity_bits is None:
+            required, excluded = self.required_mask, self.excluded_mask
+        else:
+            required, excluded = amenity_bits.bitset(self.required), amenity_bits.bitset(self.excluded)
+
+        words = (max(required.bit_length(), excluded.bit_length()) + 63) // 64
+        masks = {}
+        for word in range(words):
+            word_masks = ((required >> 64 * word) & 0xFFFFFFFFFFFFFFFF, (excluded >> 64 * word) & 0xFFFFFFFFFFFFFFFF)
+            if any(word_masks):
+                masks[word] = word_masks
+
+        return masks
+
+    @staticmethod
+    def select(masks: dict, words: dict, count: int) -> list:
+        """Return whether each of `count` listings passes, given the masks from `masks`, and per masked word, that word
+        of all their bitsets, as little-endian 64 bit integers in one bytes object."""
+        if pyarrow and sys.byteorder == 'little':
+            keep = pyarrow.array([True] * count, pyarrow.bool_())
+            uint64 = pyarrow.uint64()
+            zero = pyarrow.scalar(0, uint64)
+            for word, (required, excluded) in masks.items():
+                required, excluded = pyarrow.scalar(required, uint64), pyarrow.scalar(excluded, uint64)
+                column = pyarrow.Array.from_buffers(uint64, count, [None, pyarrow.py_buffer(words[word])])
+                has_required = pyarrow.compute.equal(pyarrow.compute.bit_wise_and(column, required), required)
+                has_excluded = pyarrow.compute.not_equal(pyarrow.compute.bit_wise_and(column, excluded), zero)
+                keep = pyarrow.compute.and_(keep, pyarrow.compute.and_not(has_required, has_excluded))
+
+            return keep.to_pylist()
+
+        keep = [True] * count
+        for word, (required, excluded) in masks.items():
+            column = array('Q', words[word])
+            if sys.byteorder == 'big':
+                column.byteswap()
+            keep = [k and b & required == required and not b & excluded for k, b in zip(keep, column)]
+
+        return keep
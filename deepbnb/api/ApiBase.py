@@ -1,13 +1,22 @@
 import json
+import time
 
 from abc import abstractmethod, ABC
 from logging import LoggerAdapter
 from scrapy.http import Response
 from urllib.parse import urlencode, urlunparse
 
+try:
+    import orjson
+except ImportError:  # optional, faster JSON decoding
+    orjson = None
+
 
 class ApiBase(ABC):
 
+    # JSON decoder: 'orjson', 'json', or 'auto' for orjson if installed
+    json_decoder = 'auto'
+
     def __init__(self, api_key: str, logger: LoggerAdapter, currency: str):
         self._api_key = api_key
         self._currency = currency
@@ -35,12 +44,41 @@ class ApiBase(ABC):
         query['extensions'] = json.dumps(query['extensions'], separators=(',', ':'))
 
     def read_data(self, response: Response):
-        """Read response data as json"""
+        """Read response data as json. Responses rendered by Playwright have the json wrapped in html, remove it.
+
+        Time taken is added to `decode_seconds` in response meta, for instrumentation.
+        """
         self._logger.debug(f"Parsing {response.url}")
-        data = json.loads(response.body)
+        start = time.perf_counter()
+        body = response.body
+        if body.lstrip().startswith(b'<'):
+            body = response.xpath('body/pre/text()').get()  # remove html wrapper
+
+        data = self.decode_data(body)
+        response.meta['decode_seconds'] = response.meta.get('decode_seconds', 0.0) + time.perf_counter() - start
 
         return data
 
+    @classmethod
+    def set_json_decoder(cls, name: str):
+        """Set JSON decoder used by all APIs. Fail early if it isn't installed."""
+        installed = {'auto': json, 'json': json, 'orjson': orjson}
+        if name not in installed:
+            raise ValueError(f'Unknown JSON decoder: {name}')
+        if installed[name] is None:
+            raise ImportError(f'{name} is required for JSON_DECODER = {name!r}')
+
+        ApiBase.json_decoder = name
+
+    @classmethod
+    def decode_data(cls, body: bytes | str, decoder: str = None) -> dict:
+        """Decode JSON response body."""
+        decoder = decoder or cls.json_decoder
+        if decoder == 'auto':
+            decoder = 'orjson' if orjson else 'json'
+
+        return orjson.loads(body) if decoder == 'orjson' else json.loads(body)
+
     def _get_search_headers(self, response=None) -> dict:
         """Get headers for search requests."""
         headers = {
@@ -13,6 +13,27 @@ from deepbnb.api.ApiBase import ApiBase
 class ExploreSearch(ApiBase):
     """Airbnb API v3 Search Endpoint"""
 
+    # request variables, None for those set per request. Search parameters are added to them.
+    request_variables = {
+        'metadataOnly':          False,
+        'version':               '1.7.9',
+        'itemsPerGrid':          20,
+        'tabId':                 'home_tab',
+        'refinementPaths':       ['/homes'],
+        'source':                'structured_search_input_header',
+        'searchType':            'filter_change',
+        'query':                 None,
+        # 'roomTypes':             self.__room_types,
+        'cdnCacheSafe':          False,
+        'simpleSearchTreatment': 'simple_search_only',
+        'treatmentFlags':        [
+            'simple_search_1_1',
+            'simple_search_desktop_v3_full_bleed',
+            'flexible_dates_options_extend_one_three_seven_days'
+        ],
+        'screenSize':            'large'
+    }
+
     def __init__(
             self,
             api_key: str,
@@ -21,12 +42,15 @@ class ExploreSearch(ApiBase):
             spider: Spider,
             room_types: list,
             geography: dict,
-            query: str
+            query: str,
+            playwright: bool = True
     ):
         super().__init__(api_key, logger, currency)
         self.__geography = geography
+        self.__playwright = playwright
         self.__room_types = room_types
         self.__query = query
+        self.__session_cookies = None
         self.__spider = spider
 
     @staticmethod
@@ -43,23 +67,50 @@ class ExploreSearch(ApiBase):
         if 'priceMin' in variables:
             params['priceMin'] = variables['priceMin']
 
-        if 'ne_lat' in parsed_qs:
-            params['ne_lat'] = parsed_qs['ne_lat'][0]
+        if 'ne_lat' in variables:
+            params['ne_lat'] = variables['ne_lat']
+
+        if 'ne_lng' in variables:
+            params['ne_lng'] = variables['ne_lng']
+
+        if 'sw_lat' in variables:
+            params['sw_lat'] = variables['sw_lat']
+
+        if 'sw_lng' in variables:
+            params['sw_lng'] = variables['sw_lng']
 
-        if 'ne_lng' in parsed_qs:
-            params['ne_lng'] = parsed_qs['ne_lng'][0]
+    @classmethod
+    def get_request_params(cls, url: str) -> dict:
+        """Get search parameters of a request URL, i.e. its request variables other than the query and constants.
+        `api_request` with these parameters builds the same URL again."""
+        variables = json.loads(parse_qs(urlparse(url).query)['variables'][0])['request']
 
-        if 'sw_lat' in parsed_qs:
-            params['sw_lat'] = parsed_qs['sw_lat'][0]
+        return {k: v for k, v in variables.items() if k not in cls.request_variables}
 
-        if 'sw_lng' in parsed_qs:
-            params['sw_lng'] = parsed_qs['sw_lng'][0]
+    @property
+    def session_cookies(self):
+        return self.__session_cookies
+
+    @session_cookies.setter
+    def session_cookies(self, cookies: list):
+        """Set cookies obtained from a browser session, to be shared by plain HTTP API requests."""
+        self.__session_cookies = cookies
 
     def api_request(self, query, params=None, callback=None, response=None, headers=None):
-        """Perform API request."""
+        """Perform API request.
+
+        Requests are rendered by Playwright, unless disabled. Without Playwright, requests go through Scrapy's HTTP
+        downloader, and session cookies are handled by its cookie jar.
+        """
         request = response.follow if response else scrapy.Request
         callback = callback or self.__spider.parse
         url = self._get_url(query, params)
+        if not self.__playwright:
+            search_headers = self._get_search_headers()
+            headers = headers | search_headers if headers else search_headers
+            cookies = self.__session_cookies
+            return request(url, callback, headers=headers, cookies=cookies, cb_kwargs={'headers': headers})
+
         search_headers = self._get_search_headers(response)
         headers = headers | search_headers if headers else search_headers
         return request(url, callback, headers=headers, meta={'playwright': True}, cb_kwargs={'headers': headers})
@@ -81,11 +132,9 @@ class ExploreSearch(ApiBase):
 
         return params
 
-    def parse_landing_page(self, response):
+    def parse_landing_page(self, response, **kwargs):
         """Parse search response and generate URLs for all searches, then perform them."""
-        self._logger.debug(f"Parsing {response.url}")
-        json_response = response.xpath('body/pre/text()').get()  # remove html wrapper
-        data = json.loads(json_response)
+        data = self.read_data(response)
         search_params = self.get_paginated_search_params(response, data)
 
         self.__geography.update(data['data']['dora']['exploreV3']['metadata']['geography'])
@@ -93,6 +142,25 @@ class ExploreSearch(ApiBase):
 
         yield self.api_request(self.__query, search_params, self.__spider.parse, response)
 
+    def get_date_pairs(
+            self,
+            checkin: str,
+            checkout: str,
+            checkin_range_spec: str | None,
+            checkout_range_spec: str | None
+    ) -> list:
+        """Get all (checkin, checkout) ISO date pairs for checkin and checkout dates, each with an optional range."""
+        checkin_dates, checkout_dates = [checkin], [checkout]
+        if checkin_range_spec:  # ranged start date, iterate over checkin range
+            checkin_start_date, checkin_range = self._build_date_range(checkin, checkin_range_spec)
+            checkin_dates = [str(checkin_start_date + timedelta(days=i)) for i in range(checkin_range.days + 1)]
+
+        if checkout_range_spec:  # ranged end date, iterate over checkout range
+            checkout_start_date, checkout_range = self._build_date_range(checkout, checkout_range_spec)
+            checkout_dates = [str(checkout_start_date + timedelta(days=i)) for i in range(checkout_range.days + 1)]
+
+        return [(i, o) for i in checkin_dates for o in checkout_dates]
+
     def perform_checkin_start_requests(
             self,
             checkin: str,
@@ -101,7 +169,7 @@ class ExploreSearch(ApiBase):
             checkout_range_spec: str,
             params: dict
     ):
-        """Perform requests for start URLs.
+        """Perform requests for start URLs. One search per (checkin, checkout) pair.
 
         :param checkin:
         :param checkout:
@@ -110,38 +178,11 @@ class ExploreSearch(ApiBase):
         :param params:
         :return:
         """
-        # single request for static start and end dates
-        if not (checkin_range_spec or checkout_range_spec):  # simple start and end date
-            params['checkin'] = checkin
-            params['checkout'] = checkout
+        for pair_checkin, pair_checkout in self.get_date_pairs(checkin, checkout, checkin_range_spec, checkout_range_spec):
+            params['checkin'] = pair_checkin
+            params['checkout'] = pair_checkout
             yield self.api_request(self.__query, params, self.parse_landing_page)
 
-        # multi request for dynamic start and static end date
-        if checkin_range_spec and not checkout_range_spec:  # ranged start date, single end date, iterate over checkin range
-            checkin_start_date, checkin_range = self._build_date_range(checkin, checkin_range_spec)
-            for i in range(checkin_range.days + 1):  # + 1 to include end date
-                params['checkin'] = str(checkin_start_date + timedelta(days=i))
-                params['checkout'] = checkout
-                yield self.api_request(self.__query, params, self.parse_landing_page)
-
-        # multi request for static start and dynamic end date
-        if checkout_range_spec and not checkin_range_spec:  # ranged end date, single start date, iterate over checkout range
-            checkout_start_date, checkout_range = self._build_date_range(checkout, checkout_range_spec)
-            for i in range(checkout_range.days + 1):  # + 1 to include end date
-                params['checkout'] = str(checkout_start_date + timedelta(days=i))
-                params['checkin'] = checkin
-                yield self.api_request(self.__query, params, self.parse_landing_page)
-
-        # double nested multi request, iterate over both start and end date ranges
-        if checkout_range_spec and checkin_range_spec:
-            checkin_start_date, checkin_range = self._build_date_range(checkin, checkin_range_spec)
-            checkout_start_date, checkout_range = self._build_date_range(checkout, checkout_range_spec)
-            for i in range(checkin_range.days + 1):  # + 1 to include end date
-                params['checkin'] = str(checkin_start_date + timedelta(days=i))
-                for j in range(checkout_range.days + 1):  # + 1 to include end date
-                    params['checkout'] = str(checkout_start_date + timedelta(days=j))
-                    yield self.api_request(self.__query, params, self.parse_landing_page)
-
     @staticmethod
     def _build_date_range(iso_date: str, range_spec: str):
         """Calculate start and end dates for a range. Return start date and timedelta for number of days."""
@@ -160,6 +201,10 @@ class ExploreSearch(ApiBase):
         return start_date, end_date - start_date
 
     def _get_url(self, search_string: str, params: dict = None):
+        return self._build_url(self.request_variables | {'query': search_string} | (params or {}))
+
+    def _build_url(self, request: dict) -> str:
+        """Build URL for request variables. Most search variables vary per request, so a URL template is no faster."""
         _api_path = '/api/v3/ExploreSearch'
         query = {
             'operationName': 'ExploreSearch',
@@ -168,27 +213,7 @@ class ExploreSearch(ApiBase):
             '_cb':           'ld7rar1fhh6if',
         }
         data = {
-            'variables':  {
-                'request': {
-                    'metadataOnly':          False,
-                    'version':               '1.7.9',
-                    'itemsPerGrid':          20,
-                    'tabId':                 'home_tab',
-                    'refinementPaths':       ['/homes'],
-                    'source':                'structured_search_input_header',
-                    'searchType':            'filter_change',
-                    'query':                 search_string,
-                    # 'roomTypes':             self.__room_types,
-                    'cdnCacheSafe':          False,
-                    'simpleSearchTreatment': 'simple_search_only',
-                    'treatmentFlags':        [
-                        'simple_search_1_1',
-                        'simple_search_desktop_v3_full_bleed',
-                        'flexible_dates_options_extend_one_three_seven_days'
-                    ],
-                    'screenSize':            'large'
-                }
-            },
+            'variables':  {'request': request},
             'extensions': {
                 'persistedQuery': {
                     'version':    1,
@@ -196,8 +221,6 @@ class ExploreSearch(ApiBase):
                 }
             }
         }
-        if params:
-            data['variables']['request'] |= params
 
         self._put_json_param_strings(data)
 
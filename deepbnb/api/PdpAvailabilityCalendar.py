@@ -0,0 +1,148 @@
+import re
+import scrapy
+
+from datetime import date, timedelta
+from logging import LoggerAdapter
+
+from deepbnb.api.ApiBase import ApiBase
+from deepbnb.api.UrlTemplate import UrlTemplate
+
+
+class PdpAvailabilityCalendar(ApiBase):
+    """Airbnb API v3 Availability Calendar Endpoint
+
+    Used for flexible date searches: rather than one search per (checkin, checkout) pair, the spider searches once and
+    fetches each listing's calendar once. Matching date pairs are then worked out locally from the calendar.
+    """
+
+    # request variables, None for those set per request
+    request_variables = {
+        'count':     None,
+        'listingId': None,
+        'month':     None,
+        'year':      None
+    }
+
+    def __init__(
+            self,
+            api_key: str,
+            logger: LoggerAdapter,
+            currency: str,
+            data_cache: dict,
+            date_pairs: list,
+            listing_callback,
+            unavailable_callback=None
+    ):
+        """Class constructor.
+
+        :param data_cache: listing data cached from search results, matching dates are added to it
+        :param date_pairs: acceptable (checkin, checkout) ISO date pairs
+        :param listing_callback: called with the listing ID of each listing available for any date pair, returns
+            request(s) for the listing page
+        :param unavailable_callback: called with the listing ID of each listing not available for any date pair
+        """
+        super().__init__(api_key, logger, currency)
+        self.__data_cache = data_cache
+        self.__date_pairs = [(date.fromisoformat(i), date.fromisoformat(o)) for i, o in date_pairs]
+        self.__listing_callback = listing_callback
+        self.__unavailable_callback = unavailable_callback
+        self.__url_template = UrlTemplate(self._build_url, self.request_variables, tuple(self.request_variables))
+
+    def api_request(self, listing_id: str):
+        """Generate scrapy.Request for the calendar months covering all date pairs."""
+        first_month = min(i for i, _ in self.__date_pairs)
+        last_month = max(o for _, o in self.__date_pairs)
+        count = (last_month.year - first_month.year) * 12 + last_month.month - first_month.month + 1
+        url = self._get_url(listing_id, first_month.month, first_month.year, count)
+
+        return scrapy.Request(
+            url,
+            callback=self.parse_calendar,
+            headers=self._get_search_headers(),
+            cb_kwargs={'listing_id': listing_id},
+            dont_filter=True  # batch surveys may share listings
+        )
+
+    def parse_calendar(self, response, listing_id: str):
+        """Find date pairs the listing is available for. Request listing page if there are any, forget it otherwise."""
+        data = self.read_data(response)
+        calendar_months = data['data']['merlin']['pdpAvailabilityCalendar']['calendarMonths']
+        days = {date.fromisoformat(d['calendarDate']): d for m in calendar_months for d in m['days']}
+
+        available_dates = []
+        for checkin, checkout in self.__date_pairs:
+            total_price = self._get_stay_price(days, checkin, checkout)
+            if total_price is not False:
+                available_dates.append((checkin, checkout, total_price))
+
+        if not available_dates:
+            self._logger.debug(f'Listing {listing_id} not available for any dates')
+            del self.__data_cache[listing_id]
+            if self.__unavailable_callback:
+                self.__unavailable_callback(listing_id)
+            return
+
+        listing_data = self.__data_cache[listing_id]
+        listing_data['available_dates'] = [f'{i}/{o}' for i, o, _ in available_dates]
+        prices = [p for _, _, p in available_dates if p is not None]
+        if prices:  # quote cheapest stay
+            listing_data['total_price'] = min(prices)
+
+        self.__data_cache[listing_id] = listing_data  # store again, cache may hand out copies
+
+        yield from self.__listing_callback(listing_id)
+
+    @staticmethod
+    def _get_stay_price(days: dict, checkin: date, checkout: date) -> int | None | bool:
+        """Return total nightly price of a stay if available (None if calendar has no prices), False otherwise."""
+        checkin_day, checkout_day = days.get(checkin), days.get(checkout)
+        if not checkin_day or not checkout_day:
+            return False
+
+        nights = (checkout - checkin).days
+        if not checkin_day.get('availableForCheckin', checkin_day.get('available')):
+            return False
+
+        if not checkout_day.get('availableForCheckout', True):
+            return False
+
+        if nights < (checkin_day.get('minNights') or 0) or nights > (checkin_day.get('maxNights') or nights):
+            return False
+
+        total_price = 0
+        for night in (checkin + timedelta(days=n) for n in range(nights)):
+            day = days.get(night)
+            if not day or not day.get('available', day.get('availableForCheckin')):
+                return False
+
+            price = (day.get('price') or {}).get('localPriceFormatted')
+            amount_match = re.search(r'([\d,]+)', price) if price else None
+            if total_price is not None and amount_match:
+                total_price += int(amount_match[1].replace(',', ''))
+            else:
+                total_price = None
+
+        return total_price
+
+    def _get_url(self, listing_id: str, month: int, year: int, count: int) -> str:
+        return self.__url_template.url({'count': count, 'listingId': listing_id, 'month': month, 'year': year})
+
+    def _build_url(self, request: dict) -> str:
+        """Build URL for request variables. Used once for the URL template, which builds the same URLs faster."""
+        _api_path = '/api/v3/PdpAvailabilityCalendar'
+        query = {
+            'operationName': 'PdpAvailabilityCalendar',
+            'locale':        'en',
+            'currency':      self._currency,
+            'variables':     {'request': request},
+            'extensions':    {
+                'persistedQuery': {
+                    'version':    1,
+                    'sha256Hash': '8f08e03c7bd16fcad3c92a3592c19a8b559a0d0855a84028d1163d4733ed9ade'
+                }
+            }
+        }
+
+        self._put_json_param_strings(query)
+
+        return self.build_airbnb_url(_api_path, query)
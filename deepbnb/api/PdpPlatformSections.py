@@ -1,19 +1,27 @@
 import lxml.html
 import re
 import scrapy
+import time
 
+from concurrent.futures import Executor
 from typing import Union
 from logging import LoggerAdapter
+from scrapy.statscollectors import StatsCollector
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet.defer import Deferred
+from twisted.python.failure import Failure
 
 from deepbnb.api.ApiBase import ApiBase
 from deepbnb.api.PdpReviews import PdpReviews
+from deepbnb.api.UrlTemplate import UrlTemplate
+from deepbnb.filters import ListingFilter
 from deepbnb.items import DeepbnbItem
 
 
 class PdpPlatformSections(ApiBase):
     """Airbnb API v3 Property Display Endpoint"""
 
-    # Unused. This is just a list of sections where we presently pull data from. (@see `parse_listing_contents()`)
+    # Sections we presently pull data from. (@see `get_listing_fields()`)
     SECTION_IDS = [
         'AMENITIES_DEFAULT',
         'DESCRIPTION_DEFAULT',
@@ -22,6 +30,50 @@ class PdpPlatformSections(ApiBase):
         'POLICIES_DEFAULT',
     ]
 
+    # Item fields only found on listing pages. Others are found in search results, see `search_result_item()`.
+    listing_page_fields = (
+        'access', 'additional_house_rules', 'allows_events', 'amenities', 'amenity_ids', 'description',
+        'house_rules', 'interaction', 'is_hotel', 'listing_expectations', 'rating_accuracy', 'rating_checkin',
+        'rating_cleanliness', 'rating_communication', 'rating_location', 'rating_value', 'satisfaction_guest', 'transit'
+    )
+
+    _amenity_ids = {}  # amenity id string: amenity id, as there are a few hundred amenities
+    _regex_amenity_id = re.compile(r'^([a-z0-9]+_)+([0-9]+)_')
+
+    # request variables, None for those set per request
+    request_variables = {
+        'id':                            None,
+        'layouts':                       ['SIDEBAR', 'SINGLE_COLUMN'],
+        'pdpTypeOverride':               None,
+        'translateUgc':                  None,
+        'preview':                       False,
+        'bypassTargetings':              False,
+        'displayExtensions':             None,
+        'adults':                        '1',
+        'children':                      None,
+        'infants':                       None,
+        'causeId':                       None,
+        'disasterId':                    None,
+        'priceDropSource':               None,
+        'promotionUuid':                 None,
+        'selectedCancellationPolicyId':  None,
+        'forceBoostPriorityMessageType': None,
+        'privateBooking':                False,
+        'invitationClaimed':             False,
+        'discountedGuestFeeVersion':     None,
+        'staysBookingMigrationEnabled':  False,
+        'useNewSectionWrapperApi':       False,
+        'previousStateCheckIn':          None,
+        'previousStateCheckOut':         None,
+        'federatedSearchId':             None,
+        'interactionType':               None,
+        'searchId':                      None,
+        'sectionIds':                    None,
+        'checkIn':                       None,
+        'checkOut':                      None,
+        'p3ImpressionId':                'p3_1608841700_z2VzPeybmBEdZG20'
+    }
+
     def __init__(
             self,
             api_key: str,
@@ -29,55 +81,48 @@ class PdpPlatformSections(ApiBase):
             currency: str,
             data_cache: dict,
             geography: dict,
-            pdp_reviews: PdpReviews
+            pdp_reviews: PdpReviews | None,
+            executor: Executor = None,
+            survey: str = None,
+            listing_filter: ListingFilter = None,
+            stats: StatsCollector = None
     ):
+        """Class constructor.
+
+        :param pdp_reviews: fetches reviews of each item, None if reviews aren't wanted
+        :param executor: if given, listing pages are parsed in its worker processes rather than the reactor thread
+        :param survey: name of the batch survey, items are tagged with it
+        :param listing_filter: BnbPipeline filters, reviews aren't fetched for items they reject
+        """
         super().__init__(api_key, logger, currency)
         self.__data_cache = data_cache
+        self.__executor = executor
         self.__geography = geography
-        self.__regex_amenity_id = re.compile(r'^([a-z0-9]+_)+([0-9]+)_')
+        self.__listing_filter = listing_filter
         self.__pdp_reviews = pdp_reviews
+        self.__stats = stats
+        self.__survey = survey
+        self.__url_template = UrlTemplate(self._build_url, self.request_variables, ('id',))
 
     def api_request(self, listing_id: str):
         """Generate scrapy.Request for listing page."""
+        url = self._get_url(listing_id)
+        callback = self.parse_listing_contents_in_executor if self.__executor else self.parse_listing_contents
+
+        # listings are deduplicated by the spider, but batch surveys may share listings
+        return scrapy.Request(url, callback=callback, headers=self._get_search_headers(), dont_filter=True)
+
+    def _get_url(self, listing_id: str) -> str:
+        return self.__url_template.url({'id': listing_id})
+
+    def _build_url(self, request: dict) -> str:
+        """Build URL for request variables. Used once for the URL template, which builds the same URLs faster."""
         _api_path = '/api/v3/PdpPlatformSections'
         query = {
             'operationName': 'PdpPlatformSections',
             'locale':        'en',
             'currency':      self._currency,
-            'variables':     {
-                'request': {
-                    'id':                            listing_id,
-                    'layouts':                       ['SIDEBAR', 'SINGLE_COLUMN'],
-                    'pdpTypeOverride':               None,
-                    'translateUgc':                  None,
-                    'preview':                       False,
-                    'bypassTargetings':              False,
-                    'displayExtensions':             None,
-                    'adults':                        '1',
-                    'children':                      None,
-                    'infants':                       None,
-                    'causeId':                       None,
-                    'disasterId':                    None,
-                    'priceDropSource':               None,
-                    'promotionUuid':                 None,
-                    'selectedCancellationPolicyId':  None,
-                    'forceBoostPriorityMessageType': None,
-                    'privateBooking':                False,
-                    'invitationClaimed':             False,
-                    'discountedGuestFeeVersion':     None,
-                    'staysBookingMigrationEnabled':  False,
-                    'useNewSectionWrapperApi':       False,
-                    'previousStateCheckIn':          None,
-                    'previousStateCheckOut':         None,
-                    'federatedSearchId':             None,
-                    'interactionType':               None,
-                    'searchId':                      None,
-                    'sectionIds':                    None,
-                    'checkIn':                       None,
-                    'checkOut':                      None,
-                    'p3ImpressionId':                'p3_1608841700_z2VzPeybmBEdZG20'
-                }
-            },
+            'variables':     {'request': request},
             'extensions':    {
                 'persistedQuery': {
                     'version':    1,
@@ -87,56 +132,109 @@ class PdpPlatformSections(ApiBase):
         }
 
         self._put_json_param_strings(query)
-        url = self.build_airbnb_url(_api_path, query)
 
-        return scrapy.Request(url, callback=self.parse_listing_contents, headers=self._get_search_headers())
+        return self.build_airbnb_url(_api_path, query)
 
     def parse_listing_contents(self, response):
-        """Obtain data from an individual listing page, combine with cached data, and return DeepbnbItem."""
-        # Collect base data
-        data = self.read_data(response)
+        """Obtain data from an individual listing page, combine with cached data, and yield DeepbnbItem.
+
+        If the listing has reviews, and they're wanted, the item is handed off to PdpReviews, which emits it once all
+        reviews are fetched. Items that BnbPipeline will drop are emitted without reviews.
+        """
+        yield from self.__build_item(self.get_listing_fields(self.read_data(response)))
+
+    async def parse_listing_contents_in_executor(self, response):
+        """Like parse_listing_contents, but decode and parse the response body in a worker process of the executor."""
+        listing_fields, decode_seconds = await maybe_deferred_to_future(
+            self.__submit(self.parse_listing_body, response.body, self.json_decoder))
+        response.meta['decode_seconds'] = response.meta.get('decode_seconds', 0.0) + decode_seconds
+
+        return list(self.__build_item(listing_fields))
+
+    def search_result_item(self, listing_id: str):
+        """Build DeepbnbItem from cached search data alone, without requesting the listing page. Yield item, or request
+        for its reviews."""
+        yield from self.__build_item({'id': listing_id, 'url': self.listing_url(listing_id)})
+
+    @staticmethod
+    def listing_url(listing_id: str) -> str:
+        return f'https://www.airbnb.com/rooms/{listing_id}'
+
+    @classmethod
+    def parse_listing_body(cls, body: bytes, json_decoder: str) -> tuple:
+        """Get listing fields from response body, and seconds taken to decode it. Runs in executor worker processes."""
+        start = time.perf_counter()
+        data = cls.decode_data(body, json_decoder)
+        decode_seconds = time.perf_counter() - start
+
+        return cls.get_listing_fields(data), decode_seconds
+
+    @classmethod
+    def get_listing_fields(cls, data: dict) -> dict:
+        """Get item fields found in listing page data."""
         pdp_sections = data['data']['merlin']['pdpSections']
         listing_id = pdp_sections['id']
-        sections = pdp_sections['sections']
         metadata = pdp_sections['metadata']
         logging_data = metadata['loggingContext']['eventDataLogging']
 
         # Get sections
-        amenities_section = [s for s in sections if s['sectionId'] == 'AMENITIES_DEFAULT'][0]['section']
-        description_section = [s for s in sections if s['sectionId'] == 'DESCRIPTION_DEFAULT'][0]['section']
-        host_profile = [s for s in sections if s['sectionId'] == 'HOST_PROFILE_DEFAULT'][0]['section']
-        location = [s for s in sections if s['sectionId'] == 'LOCATION_DEFAULT'][0]['section']
-        policies = [s for s in sections if s['sectionId'] == 'POLICIES_DEFAULT'][0]['section']
+        sections = {s['sectionId']: s['section'] for s in pdp_sections['sections'] if s['sectionId'] in cls.SECTION_IDS}
+        amenities_section = sections['AMENITIES_DEFAULT']
+        description_section = sections['DESCRIPTION_DEFAULT']
+        host_profile = sections['HOST_PROFILE_DEFAULT']
+        location = sections['LOCATION_DEFAULT']
+        policies = sections['POLICIES_DEFAULT']
 
         # Collect amenity data
         amenities_groups = amenities_section['seeAllAmenitiesGroups']
         amenities_access = [g['amenities'] for g in amenities_groups if g['title'] == 'Guest access']
         amenities_avail = [amenity for g in amenities_groups for amenity in g['amenities'] if amenity['available']]
 
-        # Structure data
-        listing_data_cached = self.__data_cache[listing_id]
-        item = DeepbnbItem(
+        listing_fields = dict(
             id=listing_id,
-            access=self._render_titles(amenities_access[0]) if amenities_access else None,
+            access=cls._render_titles(amenities_access[0]) if amenities_access else None,
             additional_house_rules=policies['additionalHouseRules'],
             allows_events='No parties or events' in [r['title'] for r in policies['houseRules']],
-            amenities=self._render_titles(amenities_avail, sep=' - ', join=False),
-            amenity_ids=list(self._get_amenity_ids(amenities_avail)),
+            amenities=cls._render_titles(amenities_avail, sep=' - ', join=False),
+            amenity_ids=list(cls._get_amenity_ids(amenities_avail)),
+            description=cls._html_to_text(
+                description_section['htmlDescription']['htmlText']
+            ) if description_section.get('htmlDescription') else None,
+            house_rules=[r['title'] for r in policies['houseRules']],
+            is_hotel=metadata['bookingPrefetchData']['isHotelRatePlanEnabled'],
+            listing_expectations=cls._render_titles(policies['listingExpectations']) if policies else None,
+            rating_accuracy=logging_data['accuracyRating'],
+            rating_checkin=logging_data['checkinRating'],
+            rating_cleanliness=logging_data['cleanlinessRating'],
+            rating_communication=logging_data['communicationRating'],
+            rating_location=logging_data['locationRating'],
+            rating_value=logging_data['valueRating'],
+            satisfaction_guest=logging_data['guestSatisfactionOverall'],
+            url=cls.listing_url(listing_id),
+        )
+
+        cls._get_detail_property(
+            listing_fields, 'transit', 'Getting around', location['seeAllLocationDetails'], 'content')
+        cls._get_detail_property(
+            listing_fields, 'interaction', 'During your stay', host_profile['hostInfos'], 'html')
+
+        return listing_fields
+
+    def __build_item(self, listing_fields: dict):
+        """Combine listing fields with cached search data into DeepbnbItem. Yield item, or request for its reviews."""
+        listing_id = listing_fields['id']
+        listing_data_cached = self.__data_cache.pop(listing_id)  # no longer needed once item is built
+        item = DeepbnbItem(
+            available_dates=listing_data_cached.get('available_dates'),
             avg_rating=listing_data_cached['avg_rating'],
             bathrooms=listing_data_cached['bathrooms'],
             bedrooms=listing_data_cached['bedrooms'],
             beds=listing_data_cached['beds'],
             business_travel_ready=listing_data_cached['business_travel_ready'],
-            city=listing_data_cached.get('city', self.__geography['city']),
-            country=self.__geography['country'],
-            description=self._html_to_text(
-                description_section['htmlDescription']['htmlText']
-            ) if description_section.get('htmlDescription') else None,
+            city=listing_data_cached.get('city', self.__geography.get('city')),
+            country=self.__geography.get('country'),
             host_id=listing_data_cached['host_id'],
-            house_rules=[r['title'] for r in policies['houseRules']],
-            is_hotel=metadata['bookingPrefetchData']['isHotelRatePlanEnabled'],
             latitude=listing_data_cached['latitude'],
-            listing_expectations=self._render_titles(policies['listingExpectations']) if policies else None,
             longitude=listing_data_cached['longitude'],
             # max_nights=listing.get('max_nights'),
             # min_nights=listing['min_nights'],
@@ -147,34 +245,57 @@ class PdpPlatformSections(ApiBase):
             person_capacity=listing_data_cached['person_capacity'],
             photo_count=listing_data_cached['photo_count'],
             photos=listing_data_cached['photos'],
-            place_id=self.__geography['placeId'],
+            place_id=self.__geography.get('placeId'),
             price_rate=listing_data_cached['price_rate'],
             price_rate_type=listing_data_cached['price_rate_type'],
             province=self.__geography.get('province'),
-            rating_accuracy=logging_data['accuracyRating'],
-            rating_checkin=logging_data['checkinRating'],
-            rating_cleanliness=logging_data['cleanlinessRating'],
-            rating_communication=logging_data['communicationRating'],
-            rating_location=logging_data['locationRating'],
-            rating_value=logging_data['valueRating'],
             review_count=listing_data_cached['review_count'],
-            reviews=self.__pdp_reviews.api_request(listing_id, 50),
             room_and_property_type=listing_data_cached['room_and_property_type'],
             room_type=listing_data_cached['room_type'],
             room_type_category=listing_data_cached['room_type_category'],
-            satisfaction_guest=logging_data['guestSatisfactionOverall'],
             star_rating=listing_data_cached['star_rating'],
-            state=self.__geography['state'],
+            state=self.__geography.get('state'),
             # summary=listing['sectioned_description']['summary'],
             total_price=listing_data_cached['total_price'],
-            url="https://www.airbnb.com/rooms/{}".format(listing_id),
-            weekly_price_factor=listing_data_cached['weekly_price_factor']
+            weekly_price_factor=listing_data_cached['weekly_price_factor'],
+            **listing_fields
         )
+        if self.__survey:
+            item['survey'] = self.__survey
+
+        if not self.__pdp_reviews:
+            yield item
+        elif item['review_count'] and not self.__rejected(item):
+            yield self.__pdp_reviews.api_request(item)
+        else:
+            item['reviews'] = []
+            yield item
+
+    def __rejected(self, item: DeepbnbItem) -> bool:
+        """Return whether BnbPipeline filters will drop item, so its reviews needn't be fetched. Filters on its reviews
+        can't reject it yet."""
+        if not self.__listing_filter or not self.__listing_filter.check(item, complete=False):
+            return False
+
+        if self.__stats:
+            self.__stats.inc_value('prefilter/review_requests_avoided')
+        return True
+
+    def __submit(self, fn, *args) -> Deferred:
+        """Run function in executor. Return deferred firing with its result in the reactor thread."""
+        from twisted.internet import reactor
+
+        deferred = Deferred()
+
+        def fire(future):
+            if future.exception() is not None:
+                deferred.errback(Failure(future.exception()))
+            else:
+                deferred.callback(future.result())
 
-        self._get_detail_property(item, 'transit', 'Getting around', location['seeAllLocationDetails'], 'content')
-        self._get_detail_property(item, 'interaction', 'During your stay', host_profile['hostInfos'], 'html')
+        self.__executor.submit(fn, *args).add_done_callback(lambda f: reactor.callFromThread(fire, f))
 
-        return item
+        return deferred
 
     @staticmethod
     def _html_to_text(html: str) -> str:
@@ -191,13 +312,18 @@ class PdpPlatformSections(ApiBase):
 
         return '\n'.join(lines) if join else lines
 
-    def _get_amenity_ids(self, amenities: list):
+    @classmethod
+    def _get_amenity_ids(cls, amenities: list):
         """Extract amenity id from `id` string field."""
         for amenity in amenities:
-            match = self.__regex_amenity_id.match(amenity['id'])
-            yield int(match.group(match.lastindex))
+            amenity_id = cls._amenity_ids.get(amenity['id'])
+            if amenity_id is None:
+                match = cls._regex_amenity_id.match(amenity['id'])
+                amenity_id = cls._amenity_ids[amenity['id']] = int(match.group(match.lastindex))
+            yield amenity_id
 
-    def _get_detail_property(self, item, prop, title, prop_list, key):
+    @classmethod
+    def _get_detail_property(cls, item, prop, title, prop_list, key):
         """Search for matching title in property list for prop. If exists, add htmlText for key to item."""
         if title in [i['title'] for i in prop_list]:
-            item[prop] = self._html_to_text([i[key]['htmlText'] for i in prop_list if i['title'] == title][0])
+            item[prop] = cls._html_to_text([i[key]['htmlText'] for i in prop_list if i['title'] == title][0])
@@ -1,36 +1,93 @@
-import json
-import requests
 import scrapy
 
-from urllib.parse import urlparse, parse_qs
+from logging import LoggerAdapter
 
 from deepbnb.api.ApiBase import ApiBase
+from deepbnb.api.UrlTemplate import UrlTemplate
+from deepbnb.items import DeepbnbItem
+from deepbnb.state import CrawlState
 
 
 class PdpReviews(ApiBase):
-    """Airbnb API v3 Reviews Endpoint"""
-
-    def api_request(self, listing_id: str, limit: int = 7, start_offset: int = 0):
-        """Perform API request."""
-        # get first batch of reviews
-        reviews, n_reviews_total = self._get_reviews_batch(listing_id, limit, start_offset)
-
-        # get any additional batches
-        start_idx = start_offset + limit
-        for offset in range(start_idx, n_reviews_total, limit):
-            r, _ = self._get_reviews_batch(listing_id, limit, offset)
-            reviews.extend(r)
-
-        return reviews
-
-    def _get_reviews_batch(self, listing_id: str, limit: int, offset: int):
-        """Get reviews for a given listing ID in batches."""
-        url = self._get_url(listing_id, limit, offset)
-        headers = self._get_search_headers()
-        response = requests.get(url, headers=headers)
-        data = json.loads(response.text)
+    """Airbnb API v3 Reviews Endpoint
+
+    Reviews are fetched through the Scrapy scheduler. The first page of reviews for a listing tells us how many reviews
+    there are in total, and all remaining pages are then requested at once. The listing item is held back until every
+    page has come back (or failed), and is then emitted with all of its reviews attached.
+
+    If crawl state is given and reviews of the listing were seen before, only new reviews are fetched: reviews come
+    newest first, so pages are requested one at a time until one reaches a review already seen.
+
+    With `max_reviews`, only that many of the newest reviews are fetched per listing.
+    """
+
+    # request variables, None for those set per request
+    request_variables = {
+        'fieldSelector':    'for_p3',
+        'limit':            None,
+        'listingId':        None,
+        'numberOfAdults':   '1',
+        'numberOfChildren': '0',
+        'numberOfInfants':  '0'
+    }
+
+    def __init__(
+            self,
+            api_key: str,
+            logger: LoggerAdapter,
+            currency: str,
+            limit: int = 50,
+            crawl_state: CrawlState = None,
+            max_reviews: int = None
+    ):
+        super().__init__(api_key, logger, currency)
+        self.__crawl_state = crawl_state
+        self.__limit = min(limit, max_reviews) if max_reviews else limit
+        self.__max_reviews = max_reviews
+        self.__pending = {}
+        self.__url_template = UrlTemplate(self._build_url, self.request_variables, ('limit', 'listingId'))
+
+    def api_request(self, item: DeepbnbItem, offset: int = 0):
+        """Generate scrapy.Request for a batch of reviews belonging to the given listing item."""
+        listing_id = item['id']
+        if offset == 0:
+            state_key = CrawlState.key(listing_id, item.get('survey'))
+            newest_seen = self.__crawl_state.newest_review(state_key) if self.__crawl_state else None
+            self.__pending[listing_id] = {'item': item, 'pages': {}, 'remaining': 1, 'newest_seen': newest_seen}
+
+        url = self._get_url(listing_id, self.__limit, offset)
+        return scrapy.Request(
+            url,
+            callback=self.parse_reviews,
+            errback=self.errback,
+            headers=self._get_search_headers(),
+            priority=1,  # finish listings already in flight before starting new ones
+            cb_kwargs={'listing_id': listing_id, 'offset': offset},
+            dont_filter=True  # batch surveys may share listings
+        )
+
+    def parse_reviews(self, response, listing_id: str, offset: int):
+        """Collect a batch of reviews. Request all other batches after the first one, emit item after the last one.
+
+        If the batch can't be parsed, the listing is still emitted with whatever reviews were collected.
+        """
+        requests = []
+        try:
+            requests = self.__read_page(response, listing_id, offset)
+        except Exception as e:
+            self._logger.error(f'Failed to parse reviews for listing {listing_id}: {e!r}')
+
+        yield from requests
+        yield from self.__complete_page(listing_id)
+
+    def __read_page(self, response, listing_id: str, offset: int) -> list:
+        """Save a batch of reviews. Return requests for further batches."""
+        data = self.read_data(response)
         pdp_reviews = data['data']['merlin']['pdpReviews']
+        pending = self.__pending[listing_id]
         n_reviews_total = int(pdp_reviews['metadata']['reviewsCount'])
+        if self.__max_reviews:
+            n_reviews_total = min(n_reviews_total, self.__max_reviews)
         reviews = [{
             'comments':   r['comments'],
             'created_at': r['createdAt'],
@@ -39,24 +96,43 @@ class PdpReviews(ApiBase):
             'response':   r['response'],
         } for r in pdp_reviews['reviews']]
 
-        return reviews, n_reviews_total
+        next_offsets = []
+        newest_seen = pending['newest_seen']
+        if newest_seen:  # only new reviews wanted, get next page unless this one reached seen reviews
+            new_reviews = [r for r in reviews if r['created_at'] > newest_seen]
+            if len(new_reviews) == len(reviews) and offset + self.__limit < n_reviews_total:
+                next_offsets.append(offset + self.__limit)
+            reviews = new_reviews
+        elif offset == 0:  # get all other reviews in parallel
+            next_offsets.extend(range(self.__limit, n_reviews_total, self.__limit))
+
+        pending['pages'][offset] = reviews
+        pending['remaining'] += len(next_offsets)
+
+        return [self.api_request(pending['item'], next_offset) for next_offset in next_offsets]
+
+    def errback(self, failure):
+        """Log failed review batch. The listing is still emitted with whatever reviews were collected."""
+        listing_id = failure.request.cb_kwargs['listing_id']
+        self._logger.error(f'Failed to get reviews for listing {listing_id}: {failure.value!r}')
+
+        yield from self.__complete_page(listing_id)
 
     def _get_url(self, listing_id: str, limit: int = 7, offset: int = None) -> str:
+        values = {'limit': limit, 'listingId': listing_id}
+        if offset:
+            values['offset'] = offset
+
+        return self.__url_template.url(values)
+
+    def _build_url(self, request: dict) -> str:
+        """Build URL for request variables. Used once for the URL template, which builds the same URLs faster."""
         _api_path = '/api/v3/PdpReviews'
         query = {
             'operationName': 'PdpReviews',
             'locale':        'en',
             'currency':      self._currency,
-            'variables':     {
-                'request': {
-                    'fieldSelector':    'for_p3',
-                    'limit':            limit,
-                    'listingId':        listing_id,
-                    'numberOfAdults':   '1',
-                    'numberOfChildren': '0',
-                    'numberOfInfants':  '0'
-                }
-            },
+            'variables':     {'request': request},
             'extensions':    {
                 'persistedQuery': {
                     'version':    1,
@@ -65,37 +141,19 @@ class PdpReviews(ApiBase):
             }
         }
 
-        if offset:
-            query['variables']['request']['offset'] = offset
-
         self._put_json_param_strings(query)
 
         return self.build_airbnb_url(_api_path, query)
 
-    def _parse_reviews(self, response):
-        # parse qs
-        parsed = urlparse(response.request.url)
-        parsed_qs = parse_qs(parsed.query)
-        variables = json.loads(parsed_qs['variables'][0])
-
-        # extract data
-        listing_id = variables['request']['listingId']
-        limit = variables['request']['limit']
-        offset = variables['request'].get('offset', 0)
-        data = self.read_data(response)
-        pdp_reviews = data['data']['merlin']['pdpReviews']
-        n_reviews_total = int(pdp_reviews['metadata']['reviewsCount'])
+    def __complete_page(self, listing_id: str):
+        """Mark one batch as done. Once all batches are in, attach reviews in offset order and emit the item."""
+        pending = self.__pending[listing_id]
+        pending['remaining'] -= 1
+        if pending['remaining'] > 0:
+            return
 
-        if offset == 0:  # get all other reviews
-            for offset in range(limit, n_reviews_total, limit):
-                url = self._get_url(listing_id, limit, offset)
-                yield scrapy.Request(url, callback=self._parse_reviews, headers=self._get_search_headers())
+        del self.__pending[listing_id]
+        item = pending['item']
+        item['reviews'] = [r for _, page in sorted(pending['pages'].items()) for r in page][:self.__max_reviews]
 
-        # return distilled review
-        yield from ({
-            'comments':   r['comments'],
-            'created_at': r['createdAt'],
-            'language':   r['language'],
-            'rating':     r['rating'],
-            'response':   r['response'],
-        } for r in pdp_reviews['reviews'])
+        yield item
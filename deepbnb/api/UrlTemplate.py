@@ -0,0 +1,74 @@
+import json
+
+from urllib.parse import quote_plus
+
+
+class UrlTemplate:
+    """API request URL, encoded once, with variable request fields filled in per URL.
+
+    The template is made from a URL built by the API's own URL builder, with marker values for the variable fields of
+    the request variables. Filling in a URL only JSON-encodes the values of those fields, into the same text the
+    builder would have produced for them, so the URL comes out identical to the builder's. Fields not in the request
+    are appended to it, as `dict.update` would; the builder is used if a constant field is given a value.
+    """
+
+    __extra = '@@extra@@'
+
+    def __init__(self, build_url, request: dict, fields: tuple, quoted: bool = True):
+        """Class constructor.
+
+        :param build_url: function returning the URL for a request variables dict
+        :param request: request variables, the values of `fields` are ignored
+        :param fields: names of variable request fields
+        :param quoted: whether request variables are URL-quoted in the URL, rather than included as JSON text
+        """
+        self.__build_url = build_url
+        self.__fields = fields
+        self.__quoted = quoted
+        self.__request = request
+
+        markers = {name: f'@@{name}@@' for name in fields}
+        marked_request = request | markers | {self.__extra: None}
+        url = build_url(marked_request)
+
+        # split URL into constant parts, between the encoded markers, which are in request order
+        self.__parts = []
+        self.__names = []
+        for name in (k for k in marked_request if k in markers or k == self.__extra):
+            if name == self.__extra:
+                text = self.__encode_extra(name, None)
+            else:
+                text = self.__encode_json(markers[name])
+            head, found, url = url.partition(text)
+            if not found:
+                raise ValueError(f'Field {name} not found in URL template')
+            self.__parts.append(head)
+            self.__names.append(name)
+        self.__parts.append(url)
+
+    def url(self, values: dict) -> str:
+        """Return URL for the given request field values."""
+        extra = {k: v for k, v in values.items() if k not in self.__fields}
+        if any(k in self.__request for k in extra):
+            return self.__build_url(self.__request | values)
+
+        parts = self.__parts
+        url = [parts[0]]
+        for i, name in enumerate(self.__names):
+            if name == self.__extra:
+                url.extend(self.__encode_extra(k, v) for k, v in extra.items())
+            else:
+                url.append(self.__encode_json(values[name]))
+            url.append(parts[i + 1])
+
+        return ''.join(url)
+
+    def __encode_json(self, value) -> str:
+        text = json.dumps(value, separators=(',', ':'))
+
+        return quote_plus(text) if self.__quoted else text
+
+    def __encode_extra(self, name: str, value) -> str:
+        text = ',' + json.dumps(name) + ':' + json.dumps(value, separators=(',', ':'))
+
+        return quote_plus(text) if self.__quoted else text
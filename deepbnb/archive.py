@@ -0,0 +1,73 @@
+import json
+import os
+import time
+import zlib
+
+from deepbnb.fixtures import FixtureArchive
+
+
+class ResponseArchive:
+    """Append-only archive of raw API responses, for reparsing without crawling again.
+
+    The archive is a directory holding `responses.dat`, a sequence of zlib-compressed response bodies, and
+    `index.jsonl`, one line per response with its request URL, status, and position in `responses.dat`. Both files are
+    only ever appended to, so any number of crawls can be archived into one directory, and a crashed crawl loses at most
+    the response being written. Responses are indexed by API operation and request variables; for requests archived
+    more than once, the latest response wins.
+    """
+
+    data_file = 'responses.dat'
+    index_file = 'index.jsonl'
+
+    def __init__(self, path: str, mode: str = 'r'):
+        """Class constructor.
+
+        :param path: archive directory
+        :param mode: 'r' to read, 'a' to append responses (directory is created if it doesn't exist)
+        """
+        self.__path = path
+        self.__mode = mode
+        self.__index = None
+        if mode == 'a':
+            os.makedirs(path, exist_ok=True)
+            self.__data = open(os.path.join(path, self.data_file), 'ab')
+            self.__index_out = open(os.path.join(path, self.index_file), 'a', encoding='utf-8')
+        else:
+            self.__data = open(os.path.join(path, self.data_file), 'rb')
+
+    @staticmethod
+    def key(url: str) -> str:
+        return FixtureArchive.fixture_name(url)
+
+    def append(self, url: str, status: int, body: bytes):
+        compressed = zlib.compress(body)
+        position = self.__data.seek(0, os.SEEK_END)
+        self.__data.write(compressed)
+        self.__data.flush()
+
+        entry = {'url': url, 'status': status, 'position': position, 'size': len(compressed), 'time': time.time()}
+        self.__index_out.write(json.dumps(entry, separators=(',', ':')) + '\n')
+        self.__index_out.flush()
+
+    @property
+    def index(self) -> dict:
+        """Index entries of archived responses, by key. Loaded on first use."""
+        if self.__index is None:
+            self.__index = {}
+            with open(os.path.join(self.__path, self.index_file), encoding='utf-8') as f:
+                for line in f:
+                    if line.endswith('\n'):  # skip line cut short by a crash
+                        entry = json.loads(line)
+                        self.__index[self.key(entry['url'])] = entry
+
+        return self.__index
+
+    def read(self, entry: dict) -> bytes:
+        """Read body of archived response, given its index entry."""
+        self.__data.seek(entry['position'])
+        return zlib.decompress(self.__data.read(entry['size']))
+
+    def close(self):
+        self.__data.close()
+        if self.__mode == 'a':
+            self.__index_out.close()
@@ -0,0 +1,120 @@
+import os
+import pickle
+import shelve
+import tempfile
+
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from logging import LoggerAdapter
+
+from scrapy.statscollectors import StatsCollector
+
+
+class ListingDataCache(MutableMapping):
+    """Listing data collected from search results, held until the listing's item is built.
+
+    Entries are evicted as soon as they are popped for their item, or their listing fails. The size of entries in memory
+    is kept under `max_bytes`, measured by their pickled size: if a spill directory is given, the oldest pending entries
+    are moved to an on-disk shelf, otherwise a warning is logged once the budget is exceeded.
+    """
+
+    def __init__(self, logger: LoggerAdapter, stats: StatsCollector, max_bytes: int = 0, spill_dir: str = None):
+        """Class constructor.
+
+        :param max_bytes: memory budget for entries, unlimited if 0
+        :param spill_dir: directory for spilled entries, entries are never spilled if not given
+        """
+        self.__entries = OrderedDict()
+        self.__logger = logger
+        self.__max_bytes = max_bytes
+        self.__over_budget_warned = False
+        self.__size = 0
+        self.__sizes = {}
+        self.__spill = None
+        self.__spill_path = None
+        self.__stats = stats
+
+        if spill_dir:
+            fd, self.__spill_path = tempfile.mkstemp(prefix='listing-cache-', dir=spill_dir)
+            os.close(fd)
+            self.__spill = shelve.open(self.__spill_path, flag='n')
+
+    def __getitem__(self, listing_id: str) -> dict:
+        if listing_id in self.__entries:
+            self.__stats.inc_value('listing_cache/hits')
+            return self.__entries[listing_id]
+
+        if self.__spill is not None and listing_id in self.__spill:
+            self.__stats.inc_value('listing_cache/hits')
+            self.__stats.inc_value('listing_cache/spill_reads')
+            return self.__spill[listing_id]
+
+        self.__stats.inc_value('listing_cache/misses')
+        raise KeyError(listing_id)
+
+    def __setitem__(self, listing_id: str, listing_data: dict):
+        self.__discard(listing_id)
+        size = len(pickle.dumps(listing_data, pickle.HIGHEST_PROTOCOL))
+        self.__entries[listing_id] = listing_data
+        self.__sizes[listing_id] = size
+        self.__size += size
+        self.__stats.max_value('listing_cache/max_bytes', self.__size)
+        self.__enforce_budget()
+
+    def __delitem__(self, listing_id: str):
+        if not self.__discard(listing_id):
+            raise KeyError(listing_id)
+
+        self.__stats.inc_value('listing_cache/evictions')
+
+    def __iter__(self):
+        yield from self.__entries
+        if self.__spill is not None:
+            yield from self.__spill.keys()
+
+    def __len__(self) -> int:
+        return len(self.__entries) + (len(self.__spill) if self.__spill is not None else 0)
+
+    def __contains__(self, listing_id) -> bool:
+        return listing_id in self.__entries or (self.__spill is not None and listing_id in self.__spill)
+
+    def close(self):
+        """Close and remove spill file."""
+        if self.__spill is None:
+            return
+
+        self.__spill.close()
+        self.__spill = None
+        for path in [self.__spill_path] + [self.__spill_path + ext for ext in ('.db', '.dat', '.dir', '.bak')]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __discard(self, listing_id: str) -> bool:
+        """Remove entry from memory or spill file. Return whether it existed."""
+        if listing_id in self.__entries:
+            del self.__entries[listing_id]
+            self.__size -= self.__sizes.pop(listing_id)
+            return True
+
+        if self.__spill is not None and listing_id in self.__spill:
+            del self.__spill[listing_id]
+            return True
+
+        return False
+
+    def __enforce_budget(self):
+        """Spill oldest entries to disk while over budget, or warn if there is nowhere to spill them."""
+        if not self.__max_bytes or self.__size <= self.__max_bytes:
+            return
+
+        if self.__spill is None:
+            if not self.__over_budget_warned:
+                self.__over_budget_warned = True
+                self.__logger.warning(f'Listing data cache exceeds {self.__max_bytes} bytes, set a spill directory')
+            return
+
+        while self.__size > self.__max_bytes and self.__entries:
+            listing_id, listing_data = self.__entries.popitem(last=False)
+            self.__size -= self.__sizes.pop(listing_id)
+            self.__spill[listing_id] = listing_data
+            self.__stats.inc_value('listing_cache/spills')
@@ -1,12 +1,25 @@
+import csv
 import openpyxl
+import os
 
 from scrapy.exporters import BaseItemExporter
 
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # only needed for parquet export
+    pyarrow = None
+
 
 class XlsxItemExporter(BaseItemExporter):
-    """Export items to Excel spreadsheet."""
+    """Export items to Excel spreadsheet.
+
+    Rows are streamed to a write-only workbook, so memory use stays flat however many rows are written. Optionally, rows
+    are also checkpointed to a CSV file next to the output every `checkpoint_rows` rows, so a crash doesn't lose them.
+    The checkpoint file is removed once the spreadsheet is saved.
+    """
 
-    def __init__(self, file, include_headers_line=True, join_multivalued=',', **kwargs):
+    def __init__(self, file, include_headers_line=True, join_multivalued=',', checkpoint_rows=0, **kwargs):
         """Class constructor."""
         # fields_to_export = settings.get('FIELDS_TO_EXPORT', [])
         # if fields_to_export:
@@ -15,13 +28,23 @@ class XlsxItemExporter(BaseItemExporter):
         super().__init__(**kwargs)
 
         self.include_headers_line = include_headers_line
-        self._workbook = openpyxl.workbook.Workbook()
-        self._worksheet = self._workbook.active
+        self._workbook = openpyxl.Workbook(write_only=True)
+        self._worksheet = self._workbook.create_sheet()
         self._headers_not_written = True
         self._join_multivalued = join_multivalued
         self._filename = file.name
         file.close()
 
+        self._checkpoint_rows = checkpoint_rows
+        self._checkpoint_file = None
+        self._checkpoint_writer = None
+        self._rows_since_checkpoint = 0
+
+    @classmethod
+    def from_crawler(cls, crawler, file, *args, **kwargs):
+        kwargs.setdefault('checkpoint_rows', crawler.settings.getint('XLSX_CHECKPOINT_ROWS'))
+        return cls(file, *args, **kwargs)
+
     def export_item(self, item):
         if self._headers_not_written:
             self._headers_not_written = False
@@ -29,19 +52,39 @@ class XlsxItemExporter(BaseItemExporter):
 
         # Make name into a hyperlink
         item['name'] = '=HYPERLINK("https://www.airbnb.com/rooms/{}", "{}")'.format(
-            item['id'], item.get('name', item['id'])),
+            item['id'], item.get('name', item['id']))
 
         fields = self._get_serialized_fields(item, default_value='', include_empty=True)
         values = tuple(self._build_row(x for _, x in fields))
-        self._worksheet.append(values)
+        self._append(values)
 
     def finish_exporting(self):
         self._workbook.save(self._filename)
+        if self._checkpoint_file:
+            self._checkpoint_file.close()
+            os.remove(self._checkpoint_file.name)
 
     def serialize_field(self, field, name, value):
         serializer = field.get('serializer', self._join_if_needed)
         return serializer(value)
 
+    def _append(self, row: tuple):
+        """Append row to worksheet and checkpoint file."""
+        self._worksheet.append(row)
+        if not self._checkpoint_rows:
+            return
+
+        if not self._checkpoint_file:
+            self._checkpoint_file = open(self._filename + '.checkpoint.csv', 'w', newline='', encoding='utf-8')
+            self._checkpoint_writer = csv.writer(self._checkpoint_file)
+
+        self._checkpoint_writer.writerow(row)
+        self._rows_since_checkpoint += 1
+        if self._rows_since_checkpoint >= self._checkpoint_rows:
+            self._rows_since_checkpoint = 0
+            self._checkpoint_file.flush()
+            os.fsync(self._checkpoint_file.fileno())
+
     @staticmethod
     def _build_row(values):
         for s in values:
@@ -67,4 +110,146 @@ class XlsxItemExporter(BaseItemExporter):
                     self.fields_to_export = list(item.fields.keys())
 
             row = tuple(self._build_row(self.fields_to_export))
-            self._worksheet.append(row)
+            self._append(row)
+
+
+class ParquetItemExporter(BaseItemExporter):
+    """Export items to a Parquet file, with reviews in a separate Parquet file keyed by listing id.
+
+    Columns are typed (see `field_types`), lists such as `amenity_ids` are stored as list columns, and rows are written
+    in row groups of `row_group_size` items. Reviews are written to `<output>.reviews.parquet`, one row per review.
+    Requires pyarrow.
+    """
+
+    field_types = {
+        'allows_events':         'bool_',
+        'amenities':             'list<string>',
+        'amenity_ids':           'list<int64>',
+        'available_dates':       'list<string>',
+        'avg_rating':            'float64',
+        'bathrooms':             'float64',
+        'bedrooms':              'int64',
+        'beds':                  'int64',
+        'business_travel_ready': 'bool_',
+        'house_rules':           'list<string>',
+        'is_hotel':              'bool_',
+        'latitude':              'float64',
+        'longitude':             'float64',
+        'monthly_price_factor':  'float64',
+        'person_capacity':       'int64',
+        'photo_count':           'int64',
+        'photos':                'list<string>',
+        'price_rate':            'int64',
+        'rating_accuracy':       'float64',
+        'rating_checkin':        'float64',
+        'rating_cleanliness':    'float64',
+        'rating_communication':  'float64',
+        'rating_location':       'float64',
+        'rating_value':          'float64',
+        'review_count':          'int64',
+        'satisfaction_guest':    'float64',
+        'star_rating':           'float64',
+        'total_price':           'int64',
+        'weekly_price_factor':   'float64',
+    }  # all other fields are strings
+
+    review_fields = ('comments', 'created_at', 'language', 'rating', 'response')
+
+    def __init__(self, file, row_group_size=1000, **kwargs):
+        """Class constructor."""
+        if pyarrow is None:
+            raise ImportError('pyarrow is required for parquet export')
+
+        super().__init__(dont_fail=True, **kwargs)
+
+        self._file = file
+        self._reviews_filename = os.path.splitext(file.name)[0] + '.reviews.parquet'
+        self._row_group_size = row_group_size
+        self._rows = []
+        self._reviews = []
+        self._schema = None
+        self._writer = None
+        self._reviews_writer = None
+
+    @classmethod
+    def from_crawler(cls, crawler, file, *args, **kwargs):
+        kwargs.setdefault('row_group_size', crawler.settings.getint('PARQUET_ROW_GROUP_SIZE', 1000))
+        return cls(file, *args, **kwargs)
+
+    def export_item(self, item):
+        if self._schema is None:
+            self._schema = self._build_schema(item)
+
+        row = {name: item.get(name) for name in self._schema.names}
+        self._rows.append(row)
+        for review in item.get('reviews') or []:
+            self._reviews.append({'listing_id': item['id'], **{f: review.get(f) for f in self.review_fields}})
+
+        if len(self._rows) >= self._row_group_size:
+            self._write_row_group()
+
+    def finish_exporting(self):
+        self._write_row_group()
+        if self._writer:
+            self._writer.close()
+
+        if self._reviews_writer:
+            self._reviews_writer.close()
+
+    def _build_schema(self, item):
+        """Build schema from fields to export, or fields declared in item. Reviews aren't a column, `id` always is."""
+        if self.fields_to_export:
+            names = list(self.fields_to_export)
+        else:
+            names = list(item.keys()) if isinstance(item, dict) else list(item.fields.keys())
+
+        names = ['id'] + [n for n in names if n not in ('id', 'reviews')]
+
+        return pyarrow.schema([(n, self._arrow_type(self.field_types.get(n, 'string'))) for n in names])
+
+    @staticmethod
+    def _arrow_type(type_name: str):
+        if type_name.startswith('list<'):
+            return pyarrow.list_(getattr(pyarrow, type_name[5:-1])())
+
+        return getattr(pyarrow, type_name)()
+
+    def _write_row_group(self):
+        """Write buffered items and their reviews as one row group each."""
+        if self._rows:
+            for row in self._rows:
+                for name, field_type in zip(self._schema.names, self._schema.types):
+                    if pyarrow.types.is_string(field_type) and row[name] is not None:
+                        row[name] = self._join_if_needed(row[name])
+
+            table = pyarrow.Table.from_pylist(self._rows, schema=self._schema)
+            if self._writer is None:
+                self._writer = pyarrow.parquet.ParquetWriter(self._file, self._schema)
+            self._writer.write_table(table)
+            self._rows = []
+
+        if self._reviews:
+            table = pyarrow.Table.from_pylist(self._reviews, schema=self._reviews_schema())
+            if self._reviews_writer is None:
+                self._reviews_writer = pyarrow.parquet.ParquetWriter(self._reviews_filename, table.schema)
+            self._reviews_writer.write_table(table)
+            self._reviews = []
+
+    @staticmethod
+    def _reviews_schema():
+        return pyarrow.schema([
+            ('listing_id', pyarrow.string()),
+            ('comments', pyarrow.string()),
+            ('created_at', pyarrow.string()),
+            ('language', pyarrow.string()),
+            ('rating', pyarrow.int64()),
+            ('response', pyarrow.string()),
+        ])
+
+    @staticmethod
+    def _join_if_needed(value) -> str:
+        """Render value of string column. Lists of strings are joined by newlines."""
+        if isinstance(value, (list, tuple)):
+            return '\n'.join(str(v) for v in value)
+
+        return str(value)
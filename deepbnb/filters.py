@@ -0,0 +1,329 @@
+import ast
+import re
+import unicodedata
+
+from scrapy.exceptions import DropItem
+from scrapy.settings import Settings
+
+from deepbnb.amenities import AmenityFilter
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+# combining diacritical mark blocks, i.e. accents once decomposed
+_combining_marks = re.compile('[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]')
+
+
+def strip_accents(text: str) -> str:
+    """Return text decomposed to compatibility form, with accents removed."""
+    if text.isascii():
+        return text
+
+    return _combining_marks.sub('', unicodedata.normalize('NFKD', text))
+
+
+def normalize_text(value) -> str:
+    """Fold field value for matching: strip accents and case. Lists, e.g. amenities, are joined one value per line."""
+    if value is None:
+        return ''
+
+    if isinstance(value, (list, tuple)):
+        value = '\n'.join(map(str, value))
+
+    return strip_accents(str(value)).casefold()
+
+
+def field_text(data, field: str) -> str:
+    """Return folded text of a field of item data, as matched by text rules. Of reviews, only comments are matched."""
+    value = data.get(field)
+    if field == 'reviews' and value:
+        value = [review.get('comments') or '' for review in value]
+
+    return normalize_text(value)
+
+
+class TextRule:
+    """CANNOT_HAVE or MUST_HAVE rule for text fields: a regex, or a list of keywords.
+
+    A regex that is only an alternation of literal words, e.g. `(attic|balcony|roof terrace)`, is taken as keywords, so
+    it's matched along with the keywords of all other rules in one pass over each field.
+    """
+
+    def __init__(self, name: str, fields: list, cannot_have=None, must_have=None):
+        if (cannot_have is None) == (must_have is None):
+            raise ValueError(f'Text filter {name!r} needs one of cannot_have or must_have')
+
+        self.cannot_have = cannot_have is not None
+        self.fields = tuple(fields)
+        self.name = name
+        self.pattern = cannot_have if self.cannot_have else must_have
+
+        keywords = self.pattern if isinstance(self.pattern, (list, tuple)) else self.literal_alternatives(self.pattern)
+        self.keywords = sorted({normalize_text(k) for k in keywords} - {''}) if keywords is not None else None
+        self.regex = None
+        if self.keywords is None:  # field values are folded, the pattern only has accents stripped to keep escapes
+            self.regex = re.compile(strip_accents(str(self.pattern)), re.IGNORECASE)
+
+    @staticmethod
+    def literal_alternatives(pattern: str) -> list | None:
+        """Return words of a regex that only matches literal words, e.g. `studio` or `(attic|balcony)`, else None."""
+        pattern = str(pattern)
+        if pattern.startswith('(') and pattern.endswith(')'):
+            pattern = pattern[1:-1]
+
+        words = pattern.split('|')
+        if any(not w or re.search(r'[.^$*+?{}\[\]\\|()]', w) for w in words):
+            return None
+
+        return words
+
+    def describe(self) -> str:
+        return self.regex.pattern if self.regex else '|'.join(self.keywords)
+
+
+class TextFilter:
+    """Text rules compiled per field. Each field is normalized once per item, then searched once for the keywords of
+    all its rules, with an Aho-Corasick automaton (requires pyahocorasick), and for each regex rule in turn. Without
+    pyahocorasick, or with few keywords, the keywords of each rule are searched as one regex instead.
+    """
+
+    # fewer keywords per field are searched faster by a regex per rule, as the automaton reports every match
+    automaton_min_keywords = 16
+
+    def __init__(self, rules: list):
+        self.rules = rules
+        self.fields = sorted({f for rule in rules for f in rule.fields})
+        self.__automata = {}  # field: automaton of (keyword, rules) of keyword rules checking that field
+        self.__keyword_rules = {}  # field: keyword rules in its automaton
+        self.__regexes = {}  # field: (rule, regex) of rules checking that field, if not in an automaton
+        for field in self.fields:
+            field_rules = [rule for rule in rules if field in rule.fields]
+            keyword_rules = [rule for rule in field_rules if rule.keywords is not None]
+            if ahocorasick and sum(len(rule.keywords) for rule in keyword_rules) >= self.automaton_min_keywords:
+                keywords = {}
+                for rule in keyword_rules:
+                    for keyword in rule.keywords:
+                        keywords.setdefault(keyword, []).append(rule)
+
+                automaton = ahocorasick.Automaton()
+                for keyword, rules_of_keyword in keywords.items():
+                    automaton.add_word(keyword, (keyword, tuple(rules_of_keyword)))
+                automaton.make_automaton()
+                self.__automata[field] = automaton
+                self.__keyword_rules[field] = keyword_rules
+                field_rules = [rule for rule in field_rules if rule.keywords is None]
+
+            self.__regexes[field] = [
+                (rule, rule.regex or re.compile('|'.join(map(re.escape, rule.keywords)))) for rule in field_rules
+            ]
+
+    def check(self, data, complete: bool = True) -> tuple | None:
+        """Apply rules to item data. If rejected, return (rule name, reason).
+
+        :param data: complete item, or listing data from search results
+        :param complete: False for search data or items without reviews yet, where MUST_HAVE rules checking fields
+            missing from them are skipped
+        """
+        found = {}  # rule: (field, match) of its first match
+        for field in self.fields:
+            if not complete and field not in data:
+                continue
+
+            text = field_text(data, field)
+            if not text:
+                continue
+
+            automaton = self.__automata.get(field)
+            if automaton:
+                unmatched = sum(rule not in found for rule in self.__keyword_rules[field])
+                for _, (keyword, rules) in automaton.iter(text):
+                    for rule in rules:
+                        if rule not in found:
+                            found[rule] = (field, keyword)
+                            unmatched -= 1
+                    if not unmatched:
+                        break  # all keyword rules of field matched
+
+            for rule, regex in self.__regexes[field]:
+                if rule not in found:
+                    match = regex.search(text)
+                    if match:
+                        found[rule] = (field, match.group())
+
+        for rule in self.rules:
+            if rule.cannot_have and rule in found:
+                field, match = found[rule]
+                return rule.name, f'Found: {match!r} in {field} ({rule.name})'
+
+            if not rule.cannot_have and rule not in found:
+                if complete or all(f in data for f in rule.fields):
+                    return rule.name, f'Not Found: {rule.describe()} ({rule.name})'
+
+        return None
+
+
+class ListingFilter:
+    """Listing filters configured in settings. Used by BnbPipeline, and by the spider to filter search results.
+
+    Search results hold only part of the listing data. `check_search_data` applies the filters which can be decided from
+    search results alone, so rejected listings never need their listing page requested. `check_item` applies all filters
+    to a complete item.
+    """
+
+    def __init__(
+            self,
+            minimum_monthly_discount=None,
+            minimum_weekly_discount=None,
+            minimum_photos=None,
+            skip_list=None,
+            cannot_have=None,
+            must_have=None,
+            property_type_blacklist=None,
+            text_filters=None,
+            amenities_required=None,
+            amenities_excluded=None,
+            property_amenities=None
+    ):
+        """Class constructor.
+
+        :param text_filters: rule name: {'fields': [...], 'cannot_have' or 'must_have': regex or list of keywords}
+        :param amenities_required: amenity ids or names in `property_amenities`, all of which listings must have
+        :param amenities_excluded: amenity ids or names in `property_amenities`, none of which listings may have
+        """
+        # self._fields_to_check = ['description', 'name', 'summary', 'notes']
+        self._fields_to_check = ['description', 'name']
+        self._minimum_monthly_discount = minimum_monthly_discount
+        self._minimum_weekly_discount = minimum_weekly_discount
+        self._minimum_photos = minimum_photos
+
+        self._skip_list = frozenset(map(str, self._as_list(skip_list)))
+        self._property_type_blacklist = frozenset(self._as_list(property_type_blacklist))
+
+        rules = []
+        if cannot_have:
+            rules.append(TextRule('cannot_have', self._fields_to_check, cannot_have=cannot_have))
+        if must_have:
+            rules.append(TextRule('must_have', self._fields_to_check, must_have=must_have))
+        for name, rule in (text_filters or {}).items():
+            rules.append(TextRule(name, rule.get('fields', self._fields_to_check), rule.get('cannot_have'),
+                                  rule.get('must_have')))
+
+        self._text_filter = TextFilter(rules) if rules else None
+        self._amenity_filter = AmenityFilter(
+            self._as_list(amenities_required), self._as_list(amenities_excluded), property_amenities)
+
+    @classmethod
+    def from_settings(cls, settings: Settings):
+        return cls(
+            minimum_monthly_discount=settings.getfloat('MINIMUM_MONTHLY_DISCOUNT') or None,
+            minimum_weekly_discount=settings.getfloat('MINIMUM_WEEKLY_DISCOUNT') or None,
+            minimum_photos=settings.getint('MINIMUM_PHOTOS') or None,
+            skip_list=settings.get('SKIP_LIST'),
+            cannot_have=settings.get('CANNOT_HAVE'),
+            must_have=settings.get('MUST_HAVE'),
+            property_type_blacklist=settings.get('PROPERTY_TYPE_BLACKLIST'),
+            text_filters=settings.getdict('TEXT_FILTERS'),
+            amenities_required=settings.get('AMENITIES_REQUIRED'),
+            amenities_excluded=settings.get('AMENITIES_EXCLUDED'),
+            property_amenities=settings.getdict('PROPERTY_AMENITIES')
+        )
+
+    @property
+    def text_rules(self) -> list:
+        """CANNOT_HAVE, MUST_HAVE and TEXT_FILTERS rules, in the order they're checked."""
+        return self._text_filter.rules if self._text_filter else []
+
+    @property
+    def amenity_filter(self) -> AmenityFilter:
+        return self._amenity_filter
+
+    def checks_any(self, fields) -> bool:
+        """Return whether filters check any of the given fields, e.g. those only found on listing pages."""
+        if self._amenity_filter and 'amenity_ids' in fields:
+            return True
+
+        return bool(self._text_filter and set(self._text_filter.fields).intersection(fields))
+
+    def check_item(self, item):
+        """Raise DropItem if item doesn't fit parameters."""
+        rejection = self.check(item)
+        if rejection:
+            raise DropItem(rejection[1])
+
+    def check(self, item, complete: bool = True) -> tuple | None:
+        """Apply all filters to an item. If rejected, return (filter name, reason).
+
+        :param complete: False for an item whose reviews aren't fetched yet, where MUST_HAVE rules checking fields
+            missing from it are skipped
+        """
+        rejection = self.__check_search_fields(item['id'], item)
+        if rejection:
+            return rejection
+
+        if self._minimum_monthly_discount and 'monthly_discount' in item:
+            if item['monthly_discount'] < self._minimum_monthly_discount:
+                return 'minimum_monthly_discount', 'Monthly discount too low: {}'.format(item['monthly_discount'])
+
+        if self._minimum_weekly_discount and 'weekly_discount' in item:
+            if item['weekly_discount'] < self._minimum_weekly_discount:
+                return 'minimum_weekly_discount', 'Weekly discount too low: {}'.format(item['weekly_discount'])
+
+        if self._amenity_filter:
+            bitset = self._amenity_filter.amenity_bits.bitset(item.get('amenity_ids') or ())
+            rejection = self._amenity_filter.check(bitset)
+            if rejection:
+                return rejection
+
+        if self._text_filter:
+            return self._text_filter.check(item, complete)
+
+        return None
+
+    def check_search_data(self, listing_id: str, listing_data) -> tuple | None:
+        """Apply filters which can be decided from search result data. If rejected, return (filter name, reason).
+
+        Text filters are applied to the fields found in search results, e.g. the name. CANNOT_HAVE can reject on those,
+        but MUST_HAVE only if it checks no other fields: the description may still match.
+
+        :param listing_id: listing ID
+        :param listing_data: listing data cached from search results
+        """
+        rejection = self.__check_search_fields(listing_id, listing_data)
+        if rejection or not self._text_filter:
+            return rejection
+
+        return self._text_filter.check(listing_data, complete=False)
+
+    def __check_search_fields(self, listing_id: str, listing_data) -> tuple | None:
+        if str(listing_id) in self._skip_list:
+            return 'skip_list', 'Item in skip list: {}'.format(listing_id)
+
+        property_type = listing_data.get('room_and_property_type')
+        if property_type in self._property_type_blacklist:
+            return 'property_type_blacklist', 'Skipping property type: {}'.format(property_type)
+
+        photo_count = listing_data.get('photo_count')
+        if self._minimum_photos and photo_count is not None and photo_count < self._minimum_photos:
+            return 'minimum_photos', 'Photos too low: {} photos'.format(photo_count)
+
+        return None
+
+    @staticmethod
+    def _as_list(value) -> list:
+        """Return list setting as list. On the command line, it may be given as a Python list, or comma-separated."""
+        if not value:
+            return []
+
+        if isinstance(value, str):
+            try:
+                value = ast.literal_eval(value)
+            except (SyntaxError, ValueError):
+                value = value.split(',')
+
+            if not isinstance(value, (list, tuple, set)):
+                value = [value]
+
+        return [v.strip() if isinstance(v, str) else v for v in value]
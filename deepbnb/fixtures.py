@@ -0,0 +1,61 @@
+import json
+import zipfile
+
+from hashlib import sha1
+from urllib.parse import parse_qs, urlparse
+
+
+class FixtureArchive:
+    """Zip archive of recorded Airbnb API responses, replayed by the benchmark stub server.
+
+    Each response is stored as `<operation>/<hash of request variables>.json`, holding the request URL and the response
+    data. Responses already in the archive are kept, so several crawls can be recorded into one archive.
+    """
+
+    def __init__(self, path: str, mode: str = 'r'):
+        """Class constructor.
+
+        :param path: archive file path
+        :param mode: 'r' to read, 'a' to add fixtures (archive is created if it doesn't exist)
+        """
+        self.__zip = zipfile.ZipFile(path, mode, compression=zipfile.ZIP_DEFLATED, compresslevel=9)
+        self.__names = set(self.__zip.namelist())
+
+    @staticmethod
+    def parse_url(url: str) -> tuple:
+        """Return API operation name and request variables of an API URL."""
+        parsed = urlparse(url)
+        qs = parse_qs(parsed.query)
+        variables = json.loads(qs['variables'][0]).get('request', {}) if 'variables' in qs else {}
+
+        return parsed.path.rsplit('/', 1)[-1], variables
+
+    @classmethod
+    def fixture_name(cls, url: str) -> str:
+        operation, variables = cls.parse_url(url)
+        digest = sha1(json.dumps(variables, sort_keys=True).encode()).hexdigest()
+
+        return f'{operation}/{digest}.json'
+
+    def add(self, url: str, data: dict) -> bool:
+        """Add response data for URL, unless a response for the same request is already archived."""
+        name = self.fixture_name(url)
+        if name in self.__names:
+            return False
+
+        self.__zip.writestr(name, json.dumps({'url': url, 'data': data}, separators=(',', ':')))
+        self.__names.add(name)
+
+        return True
+
+    def __iter__(self):
+        """Yield (url, data) for each archived response."""
+        for name in sorted(self.__names):
+            fixture = json.loads(self.__zip.read(name))
+            yield fixture['url'], fixture['data']
+
+    def __len__(self) -> int:
+        return len(self.__names)
+
+    def close(self):
+        self.__zip.close()
@@ -0,0 +1,238 @@
+import json
+import sqlite3
+import time
+
+from abc import abstractmethod, ABC
+from scrapy.statscollectors import StatsCollector
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class Frontier(ABC):
+    """Crawl frontier shared by the workers of a distributed crawl, so several nodes can split one survey.
+
+    Work is held as tasks: searches, and listings with their search result data. A worker leases a batch of tasks,
+    requests them, and completes each task once its response is received. Tasks whose lease expires before they're
+    completed, e.g. because their worker failed, are leased again, up to `max_attempts` times. Listings and items are
+    claimed in a set shared by all workers, so each is requested and saved once.
+
+    All keys are kept per survey, so surveys of different queries can share a database or Redis server.
+    """
+
+    def __init__(self, survey: str, worker: str, stats: StatsCollector, lease_seconds: float, max_attempts: int):
+        """Class constructor.
+
+        :param survey: survey name, i.e. the query
+        :param worker: name of this worker, for diagnostics
+        :param lease_seconds: time within which a leased task must be completed, before it's leased again
+        :param max_attempts: number of leases after which a task is given up
+        """
+        self._lease_seconds = lease_seconds
+        self._max_attempts = max_attempts
+        self._stats = stats
+        self._survey = survey
+        self._worker = worker
+
+    @staticmethod
+    def open(url: str, survey: str, worker: str, stats: StatsCollector, lease_seconds: float = 600,
+             max_attempts: int = 3) -> 'Frontier':
+        """Open frontier in a Redis (redis://, rediss:// or unix:// URL) or SQLite (file path) database."""
+        if url.startswith(('redis://', 'rediss://', 'unix://')):
+            return RedisFrontier(url, survey, worker, stats, lease_seconds, max_attempts)
+
+        return SqliteFrontier(url, survey, worker, stats, lease_seconds, max_attempts)
+
+    def claim(self, key: str) -> bool:
+        """Claim key for this worker. Return False if any worker claimed it before."""
+        claimed = self._claim(key)
+        if not claimed:
+            self._stats.inc_value(f'frontier/claimed_before/{key.split("/")[0]}')
+
+        return claimed
+
+    def push(self, key: str, kind: str, payload: dict) -> bool:
+        """Add task, unless a task with the same key was added before. Return whether it was added."""
+        pushed = self._push(key, kind, payload)
+        self._stats.inc_value(f'frontier/pushed/{kind}' if pushed else f'frontier/pushed_before/{kind}')
+
+        return pushed
+
+    def lease(self, count: int) -> list:
+        """Lease up to `count` tasks, oldest first. Return (key, kind, payload) per task."""
+        tasks = self._lease(count)
+        for _, kind, _ in tasks:
+            self._stats.inc_value(f'frontier/leased/{kind}')
+
+        return tasks
+
+    def complete(self, key: str) -> bool:
+        """Mark leased task as done. Return False if it was already done."""
+        completed = self._complete(key)
+        self._stats.inc_value('frontier/completed' if completed else 'frontier/completed_before')
+
+        return completed
+
+    @abstractmethod
+    def pending(self) -> int:
+        """Return number of tasks not done yet, and still to be leased, or leased and not expired."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _claim(self, key: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _push(self, key: str, kind: str, payload: dict) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _lease(self, count: int) -> list:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _complete(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SqliteFrontier(Frontier):
+    """Frontier in a SQLite database file. Workers on one host, or sharing a file system with working locks."""
+
+    def __init__(self, path: str, *args):
+        super().__init__(*args)
+        self.__connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.__connection.execute('PRAGMA journal_mode = WAL')
+        self.__connection.execute('PRAGMA synchronous = NORMAL')
+        self.__connection.execute(
+            'CREATE TABLE IF NOT EXISTS claim (survey TEXT, key TEXT, worker TEXT, PRIMARY KEY (survey, key))')
+        self.__connection.execute(
+            'CREATE TABLE IF NOT EXISTS task ('
+            'survey TEXT, key TEXT, kind TEXT, payload TEXT, worker TEXT, lease_until REAL, '
+            'attempts INTEGER NOT NULL DEFAULT 0, done INTEGER NOT NULL DEFAULT 0, UNIQUE (survey, key))'
+        )
+
+    def _claim(self, key: str) -> bool:
+        cursor = self.__connection.execute(
+            'INSERT OR IGNORE INTO claim (survey, key, worker) VALUES (?, ?, ?)', (self._survey, key, self._worker))
+
+        return cursor.rowcount == 1
+
+    def _push(self, key: str, kind: str, payload: dict) -> bool:
+        cursor = self.__connection.execute(
+            'INSERT OR IGNORE INTO task (survey, key, kind, payload) VALUES (?, ?, ?, ?)',
+            (self._survey, key, kind, json.dumps(payload))
+        )
+
+        return cursor.rowcount == 1
+
+    def _lease(self, count: int) -> list:
+        now = time.time()
+        self.__connection.execute('BEGIN IMMEDIATE')  # no other worker may lease the same tasks in between
+        try:
+            rows = self.__connection.execute(
+                'SELECT rowid, key, kind, payload FROM task '
+                'WHERE survey = ? AND done = 0 AND attempts < ? AND (lease_until IS NULL OR lease_until < ?) '
+                'ORDER BY rowid LIMIT ?',
+                (self._survey, self._max_attempts, now, count)
+            ).fetchall()
+            self.__connection.executemany(
+                'UPDATE task SET worker = ?, lease_until = ?, attempts = attempts + 1 WHERE rowid = ?',
+                [(self._worker, now + self._lease_seconds, row[0]) for row in rows]
+            )
+            self.__connection.execute('COMMIT')
+        except BaseException:
+            self.__connection.execute('ROLLBACK')
+            raise
+
+        return [(key, kind, json.loads(payload)) for _, key, kind, payload in rows]
+
+    def _complete(self, key: str) -> bool:
+        cursor = self.__connection.execute(
+            'UPDATE task SET done = 1, lease_until = NULL WHERE survey = ? AND key = ? AND done = 0',
+            (self._survey, key)
+        )
+
+        return cursor.rowcount == 1
+
+    def pending(self) -> int:
+        return self.__connection.execute(
+            'SELECT count(*) FROM task WHERE survey = ? AND done = 0 AND (attempts < ? OR lease_until >= ?)',
+            (self._survey, self._max_attempts, time.time())
+        ).fetchone()[0]
+
+    def close(self):
+        self.__connection.close()
+
+
+class RedisFrontier(Frontier):
+    """Frontier in a Redis, or Redis compatible, server (requires the redis package). Workers on any host.
+
+    Per survey, task payloads are held in a hash, keys of tasks to be leased in a list, and leased keys in a sorted set
+    scored by lease expiry. Expired leases are moved back to the list before leasing.
+    """
+
+    def __init__(self, url: str, *args):
+        if redis is None:
+            raise ImportError('A Redis frontier requires the redis package')
+
+        super().__init__(*args)
+        self.__redis = redis.Redis.from_url(url)
+        prefix = f'deepbnb:frontier:{self._survey}:'
+        self.__attempts = prefix + 'attempts'
+        self.__claims = prefix + 'claims'
+        self.__done = prefix + 'done'
+        self.__leases = prefix + 'leases'
+        self.__queue = prefix + 'queue'
+        self.__tasks = prefix + 'tasks'
+
+    def _claim(self, key: str) -> bool:
+        return self.__redis.sadd(self.__claims, key) == 1
+
+    def _push(self, key: str, kind: str, payload: dict) -> bool:
+        if not self.__redis.hsetnx(self.__tasks, key, json.dumps([kind, payload])):
+            return False
+
+        self.__redis.rpush(self.__queue, key)
+
+        return True
+
+    def _lease(self, count: int) -> list:
+        now = time.time()
+        for key in self.__redis.zrangebyscore(self.__leases, '-inf', now):
+            # whichever worker removes an expired lease requeues its task
+            if self.__redis.zrem(self.__leases, key) and not self.__redis.sismember(self.__done, key):
+                if int(self.__redis.hget(self.__attempts, key) or 0) < self._max_attempts:
+                    self.__redis.rpush(self.__queue, key)
+
+        keys = self.__redis.lpop(self.__queue, count) or []
+        if not keys:
+            return []
+
+        pipeline = self.__redis.pipeline()
+        pipeline.zadd(self.__leases, {key: now + self._lease_seconds for key in keys})
+        for key in keys:
+            pipeline.hincrby(self.__attempts, key)
+        pipeline.execute()
+
+        tasks = self.__redis.hmget(self.__tasks, keys)
+
+        return [(key.decode(), *json.loads(task)) for key, task in zip(keys, tasks)]
+
+    def _complete(self, key: str) -> bool:
+        if not self.__redis.sadd(self.__done, key):
+            return False
+
+        self.__redis.zrem(self.__leases, key)
+
+        return True
+
+    def pending(self) -> int:
+        return self.__redis.llen(self.__queue) + self.__redis.zcount(self.__leases, time.time(), '+inf')
+
+    def close(self):
+        self.__redis.close()
@@ -0,0 +1,188 @@
+import functools
+import os
+import re
+import time
+
+from bisect import bisect_left
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+from twisted.internet.defer import Deferred
+from urllib.parse import urlparse
+
+# upper bounds of histogram buckets: seconds, and bytes (256 B to 16 MiB)
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+SIZE_BUCKETS = tuple(4 ** i for i in range(4, 13))
+
+
+class Histogram:
+    """Count of observed values per bucket, with their sum and maximum, like a Prometheus histogram."""
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.count = 0
+        self.counts = [0] * (len(bounds) + 1)  # the last bucket is +Inf
+        self.max = 0
+        self.sum = 0
+
+    def __repr__(self):
+        if not self.count:
+            return 'Histogram(count=0)'
+
+        return (f'Histogram(count={self.count}, mean={self.sum / self.count:.4g}, p50<={self.quantile(0.5):.4g}, '
+                f'p95<={self.quantile(0.95):.4g}, max={self.max:.4g})')
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.max = max(self.max, value)
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Return upper bound of the bucket holding quantile `q` of observed values, or their maximum if above all."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+
+        return self.max
+
+
+def observe(stats, key: str, value: float, bounds: tuple = TIME_BUCKETS):
+    """Add value to histogram at stats key, e.g. `timing/callback/<callback>` or `size/response/<endpoint>`."""
+    histogram = stats.get_value(key)
+    if histogram is None:
+        histogram = Histogram(bounds)
+        stats.set_value(key, histogram)
+
+    histogram.observe(value)
+
+
+def timed_pipeline(process_item):
+    """Decorate the process_item method of an item pipeline to record its time at `timing/pipeline/<pipeline class>` in
+    the crawl stats, if INSTRUMENTATION_ENABLED is set. A dropped item is timed until DropItem is raised, and a deferred
+    result until it fires.
+    """
+    @functools.wraps(process_item)
+    def timed_process_item(self, item, spider):
+        if not spider.settings.getbool('INSTRUMENTATION_ENABLED'):
+            return process_item(self, item, spider)
+
+        key = f'timing/pipeline/{type(self).__name__}'
+        start = time.perf_counter()
+
+        def done(result):
+            observe(spider.crawler.stats, key, time.perf_counter() - start)
+            return result
+
+        try:
+            result = process_item(self, item, spider)
+        except Exception:  # DropItem, mostly
+            done(None)
+            raise
+
+        if isinstance(result, Deferred):
+            return result.addBoth(done)
+
+        return done(result)
+
+    return timed_process_item
+
+
+def write_prometheus(stats: dict, path: str):
+    """Write stats to a Prometheus text file, e.g. for the node exporter's textfile collector.
+
+    Histograms at `[batch/<survey>/]timing|size/<stage>[/<name>]` keys become `deepbnb_<stage>_seconds|bytes`
+    histograms, labelled with survey and name. Other numeric stats become `deepbnb_stat` gauges, labelled with key.
+    """
+    families = {}
+    gauges = []
+    for key, value in sorted(stats.items()):
+        match = re.fullmatch(r'(?:batch/(?P<survey>[^/]+)/)?(?P<kind>timing|size)/(?P<stage>[^/]+)(?:/(?P<name>.+))?',
+                             key)
+        if isinstance(value, Histogram) and match:
+            unit = 'seconds' if match['kind'] == 'timing' else 'bytes'
+            family = f'deepbnb_{re.sub(r"[^a-zA-Z0-9_]", "_", match["stage"])}_{unit}'
+            labels = {k: match[k] for k in ('survey', 'name') if match[k]}
+            families.setdefault(family, []).append((labels, value))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            gauges.append(f'deepbnb_stat{{key="{_escape(key)}"}} {value}')
+
+    lines = []
+    for family, histograms in families.items():
+        lines.append(f'# TYPE {family} histogram')
+        for labels, histogram in histograms:
+            label_text = ''.join(f'{k}="{_escape(v)}",' for k, v in labels.items())
+            cumulative = 0
+            for bound, count in zip((*histogram.bounds, '+Inf'), histogram.counts):
+                cumulative += count
+                lines.append(f'{family}_bucket{{{label_text}le="{bound}"}} {cumulative}')
+            label_text = f'{{{label_text.rstrip(",")}}}' if labels else ''
+            lines.append(f'{family}_sum{label_text} {histogram.sum}')
+            lines.append(f'{family}_count{label_text} {histogram.count}')
+
+    if gauges:
+        lines.append('# TYPE deepbnb_stat gauge')
+        lines.extend(gauges)
+
+    with open(path + '.tmp', 'w') as f:  # replaced at once, so a scraper never reads a partial file
+        f.write('\n'.join(lines) + '\n')
+    os.replace(path + '.tmp', path)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Instrumentation:
+    """Record download latency and response size per API endpoint as histograms in the crawl stats. Set
+    INSTRUMENTATION_ENABLED to use.
+
+    Callback, JSON decode and parse times are recorded by `InstrumentationMiddleware`, item pipeline times by
+    `timed_pipeline`, and time from search hit to item by the spider. With METRICS_FILE set, all stats are
+    written to that Prometheus text file every METRICS_INTERVAL seconds, and when the spider closes.
+    """
+
+    def __init__(self, stats, metrics_file: str | None, interval: float):
+        self.__dump = None
+        self.__interval = interval
+        self.__metrics_file = metrics_file
+        self.__stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('INSTRUMENTATION_ENABLED'):
+            raise NotConfigured
+
+        settings = crawler.settings
+        ext = cls(crawler.stats, settings.get('METRICS_FILE'), settings.getfloat('METRICS_INTERVAL', 15))
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        if self.__metrics_file:
+            self.__dump = task.LoopingCall(self.write_metrics)
+            self.__dump.start(self.__interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.__dump and self.__dump.running:
+            self.__dump.stop()
+
+        if self.__metrics_file:
+            self.write_metrics()
+
+    def response_received(self, response, request, spider):
+        path = urlparse(response.url).path
+        endpoint = path[len('/api/v3/'):] if path.startswith('/api/v3/') else 'page'
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            observe(self.__stats, f'timing/download/{endpoint}', latency)
+
+        observe(self.__stats, f'size/response/{endpoint}', len(response.body), SIZE_BUCKETS)
+
+    def write_metrics(self):
+        write_prometheus(self.__stats.get_stats(), self.__metrics_file)
@@ -16,6 +16,7 @@ class DeepbnbItem(scrapy.Item):
     allows_events = scrapy.Field()
     amenities = scrapy.Field()
     amenity_ids = scrapy.Field()
+    available_dates = scrapy.Field()
     avg_rating = scrapy.Field()
     bathrooms = scrapy.Field()
     bedrooms = scrapy.Field()
@@ -56,6 +57,7 @@ class DeepbnbItem(scrapy.Item):
     satisfaction_guest = scrapy.Field()
     star_rating = scrapy.Field()
     state = scrapy.Field()
+    survey = scrapy.Field()
     total_price = scrapy.Field()
     transit = scrapy.Field()
     url = scrapy.Field()
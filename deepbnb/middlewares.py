@@ -5,7 +5,17 @@
 # See documentation in:
 # http://doc.scrapy.org/en/latest/topics/spider-middleware.html
 
+import json
+import time
+
 from scrapy import signals
+from scrapy.downloadermiddlewares.retry import get_retry_request
+from scrapy.exceptions import NotConfigured
+from urllib.parse import urlparse
+
+from deepbnb.archive import ResponseArchive
+from deepbnb.fixtures import FixtureArchive
+from deepbnb.instrumentation import observe
 
 
 class DeepbnbSpiderMiddleware(object):
@@ -54,3 +64,278 @@ class DeepbnbSpiderMiddleware(object):
 
     def spider_opened(self, spider):
         spider.logger.info('Spider opened: %s' % spider.name)
+
+
+class InstrumentationMiddleware:
+    """Record time spent in each spider callback, and the JSON decode and parse time within it, as histograms in the
+    crawl stats. Set INSTRUMENTATION_ENABLED to use.
+
+    Time is wall time, so that of async callbacks includes time awaited, e.g. for parser processes.
+    """
+
+    def __init__(self, stats):
+        self.__stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('INSTRUMENTATION_ENABLED'):
+            raise NotConfigured
+
+        return cls(crawler.stats)
+
+    def process_spider_output(self, response, result, spider):
+        elapsed = 0.0
+        iterator = iter(result)
+        while True:
+            start = time.perf_counter()
+            try:
+                output = next(iterator)
+            except StopIteration:
+                self.__observe(response, spider, elapsed + time.perf_counter() - start)
+                return
+            elapsed += time.perf_counter() - start
+            yield output
+
+    async def process_spider_output_async(self, response, result, spider):
+        elapsed = 0.0
+        iterator = result.__aiter__()
+        while True:
+            start = time.perf_counter()
+            try:
+                output = await iterator.__anext__()
+            except StopAsyncIteration:
+                self.__observe(response, spider, elapsed + time.perf_counter() - start)
+                return
+            elapsed += time.perf_counter() - start
+            yield output
+
+    def __observe(self, response, spider, elapsed: float):
+        callback = response.request.callback or spider.parse
+        name = getattr(callback, '__qualname__', repr(callback))
+        decode_seconds = response.meta.get('decode_seconds', 0.0)  # set by ApiBase.read_data
+        observe(self.__stats, f'timing/callback/{name}', elapsed)
+        observe(self.__stats, f'timing/decode/{name}', decode_seconds)
+        observe(self.__stats, f'timing/parse/{name}', max(elapsed - decode_seconds, 0.0))
+
+
+class ResponseArchiveMiddleware(DeepbnbSpiderMiddleware):
+    """Append API responses reaching the spider to the response archive set in RESPONSE_ARCHIVE, for reparsing."""
+
+    def __init__(self, archive_path: str, stats):
+        self.__archive = ResponseArchive(archive_path, 'a')
+        self.__stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        archive_path = crawler.settings.get('RESPONSE_ARCHIVE')
+        if not archive_path:
+            raise NotConfigured
+
+        s = cls(archive_path, crawler.stats)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def process_spider_input(self, response, spider):
+        if response.status == 200 and urlparse(response.request.url).path.startswith('/api/v3/'):
+            self.__archive.append(response.request.url, response.status, response.body)
+            self.__stats.inc_value('response_archive/appended')
+
+        return None
+
+    def spider_closed(self, spider):
+        self.__archive.close()
+
+
+class FixtureRecorderMiddleware:
+    """Record Airbnb API responses to the fixture archive set in FIXTURE_ARCHIVE, for offline replay by benchmarks."""
+
+    def __init__(self, archive_path: str, stats):
+        self.__archive = FixtureArchive(archive_path, 'a')
+        self.__stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        archive_path = crawler.settings.get('FIXTURE_ARCHIVE')
+        if not archive_path:
+            raise NotConfigured
+
+        s = cls(archive_path, crawler.stats)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def process_response(self, request, response, spider):
+        if response.status != 200 or not urlparse(request.url).path.startswith('/api/v3/'):
+            return response
+
+        body = response.body
+        if body.lstrip().startswith(b'<'):  # rendered by Playwright, remove html wrapper
+            body = response.xpath('body/pre/text()').get()
+
+        if self.__archive.add(request.url, json.loads(body)):
+            self.__stats.inc_value('fixtures/recorded')
+
+        return response
+
+    def spider_closed(self, spider):
+        self.__archive.close()
+        spider.logger.info(f'Recorded fixtures: {len(self.__archive)} responses in archive')
+
+
+class EndpointRate:
+    """Request rate and concurrency of one API endpoint, increased additively and decreased multiplicatively."""
+
+    def __init__(self, rate: float, concurrency: int):
+        self.backoff_until = 0.0
+        self.concurrency = concurrency
+        self.first_response = None
+        self.last_response = None
+        self.rate = rate
+        self.responses = 0
+        self.__healthy = 0
+
+    def count_response(self, now: float):
+        self.first_response = self.first_response or now
+        self.last_response = now
+        self.responses += 1
+
+    def increase(self, step: float, max_rate: float, max_concurrency: int):
+        """Raise rate by `step` requests/sec per second, and concurrency by one per `concurrency` responses."""
+        self.rate = min(self.rate + step / self.rate, max_rate)
+        self.__healthy += 1
+        if self.__healthy >= self.concurrency:
+            self.__healthy = 0
+            self.concurrency = min(self.concurrency + 1, max_concurrency)
+
+    def decrease(self, factor: float, min_rate: float, now: float, retry_after: float | None) -> bool:
+        """Cut rate and concurrency by `factor`, at most once per second. Return whether they were cut."""
+        if now < self.backoff_until:  # more responses to requests sent before the last cut
+            return False
+
+        self.backoff_until = now + 1
+        self.concurrency = max(int(self.concurrency * factor), 1)
+        self.rate = max(self.rate * factor, min_rate)
+        self.__healthy = 0
+        if retry_after:
+            self.rate = min(self.rate, 1 / retry_after)
+
+        return True
+
+    @property
+    def achieved_rate(self) -> float:
+        elapsed = (self.last_response or 0) - (self.first_response or 0)
+        return self.responses / elapsed if elapsed > 0 else 0.0
+
+
+class AdaptiveRateLimitMiddleware:
+    """Limit requests per Airbnb API endpoint, adapting to 403, 429 and 5xx responses. Set RATE_LIMIT_ENABLED to use.
+
+    Each endpoint (ExploreSearch, PdpPlatformSections, PdpReviews, ...) is downloaded through a slot of its own, so a
+    throttled endpoint doesn't hold back the others. Slot delay is set to 1 / rate, and slot concurrency to the
+    endpoint's concurrency. While an endpoint responds normally, both are raised additively; when it throttles, both are
+    cut multiplicatively, and the rate to at most one request per `Retry-After`. This overrides AutoThrottle's delay for
+    API requests. Airbnb throttles with 403 as well as 429, so 403 responses to API requests are retried too.
+    """
+
+    throttle_statuses = (403, 429)
+
+    def __init__(self, crawler, start_rate: float, min_rate: float, max_rate: float, increase: float,
+                 decrease: float, max_concurrency: int):
+        self.__crawler = crawler
+        self.__decrease = decrease
+        self.__endpoints = {}
+        self.__increase = increase
+        self.__max_concurrency = max_concurrency
+        self.__max_rate = max_rate
+        self.__min_rate = min_rate
+        self.__start_rate = start_rate
+        self.__stats = crawler.stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('RATE_LIMIT_ENABLED'):
+            raise NotConfigured
+
+        s = cls(
+            crawler,
+            settings.getfloat('RATE_LIMIT_START_RATE', 1.0),
+            settings.getfloat('RATE_LIMIT_MIN_RATE', 0.05),
+            settings.getfloat('RATE_LIMIT_MAX_RATE', 20.0),
+            settings.getfloat('RATE_LIMIT_INCREASE', 0.1),
+            settings.getfloat('RATE_LIMIT_DECREASE', 0.5),
+            settings.getint('RATE_LIMIT_MAX_CONCURRENCY', settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN'))
+        )
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def process_request(self, request, spider):
+        parsed = urlparse(request.url)
+        if not parsed.path.startswith('/api/v3/'):
+            return None
+
+        endpoint = parsed.path[len('/api/v3/'):]
+        slot_key = f'{parsed.netloc}/{endpoint}'
+        request.meta['download_slot'] = slot_key
+        if endpoint not in self.__endpoints:
+            self.__endpoints[endpoint] = EndpointRate(self.__start_rate, 1)
+            self.__set_stats(endpoint)
+
+        self.__apply(endpoint, slot_key)  # slot is created by the downloader after the endpoint's first request
+        return None
+
+    def process_response(self, request, response, spider):
+        path = urlparse(request.url).path
+        if not path.startswith('/api/v3/'):
+            return response
+
+        endpoint = path[len('/api/v3/'):]
+        limit = self.__endpoints.get(endpoint)
+        if limit is None:  # answered before reaching this middleware
+            return response
+
+        now = time.monotonic()
+        limit.count_response(now)
+        if response.status in self.throttle_statuses or response.status >= 500:
+            self.__stats.inc_value(f'ratelimit/{endpoint}/throttled/{response.status}')
+            if limit.decrease(self.__decrease, self.__min_rate, now, self.__retry_after(response)):
+                self.__stats.inc_value(f'ratelimit/{endpoint}/backoffs')
+                spider.logger.info(
+                    f'{endpoint} responded {response.status}, backing off to {limit.rate:.2f} requests/sec, '
+                    f'concurrency {limit.concurrency}'
+                )
+        elif response.status < 400:
+            limit.increase(self.__increase, self.__max_rate, self.__max_concurrency)
+
+        self.__set_stats(endpoint)
+        self.__apply(endpoint, request.meta['download_slot'])
+
+        if response.status == 403:  # RetryMiddleware retries 429 and 5xx, not 403
+            return get_retry_request(request, spider=spider, reason='403 Forbidden') or response
+
+        return response
+
+    def spider_closed(self, spider):
+        for endpoint, limit in self.__endpoints.items():
+            self.__stats.set_value(f'ratelimit/{endpoint}/achieved_rate', round(limit.achieved_rate, 3))
+
+    def __apply(self, endpoint: str, slot_key: str):
+        """Set delay and concurrency of endpoint's downloader slot, which together act as its token bucket."""
+        slot = self.__crawler.engine.downloader.slots.get(slot_key)
+        if slot:
+            limit = self.__endpoints[endpoint]
+            slot.concurrency = limit.concurrency
+            slot.delay = 1 / limit.rate
+
+    def __set_stats(self, endpoint: str):
+        limit = self.__endpoints[endpoint]
+        self.__stats.set_value(f'ratelimit/{endpoint}/concurrency', limit.concurrency)
+        self.__stats.set_value(f'ratelimit/{endpoint}/rate', round(limit.rate, 3))
+
+    @staticmethod
+    def __retry_after(response) -> float | None:
+        """Return `Retry-After` header in seconds, if given in seconds."""
+        try:
+            return float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            return None
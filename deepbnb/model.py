@@ -1,47 +1,63 @@
-# class Listing(Document):
-#     """Base class containing the common fields."""
-#     access = Text()
-#     additional_house_rules = Text()
-#     allows_events = Boolean()
-#     amenities = Keyword(multi=True)
-#     amenity_ids = Keyword(multi=True)
-#     avg_rating = Float()
-#     bathrooms = Float()
-#     bedrooms = Integer()
-#     beds = Integer()
-#     business_travel_ready = Boolean()
-#     city = Text(fields={'keyword': Keyword()}, required=True)
-#     country = Text(fields={'keyword': Keyword()}, required=True)
-#     coordinates = GeoPoint()
-#     description = Text()
-#     host_id = Integer(fields={'keyword': Keyword()})
-#     house_rules = Text()
-#     interaction = Text()
-#     is_hotel = Boolean()
-#     monthly_price_factor = Float()
-#     name = Text(fields={'keyword': Keyword()}, required=True)
-#     neighborhood_overview = Text()
-#     person_capacity = Integer()
-#     photo_count = Integer()
-#     photos = Keyword(multi=True)
-#     place_id = Text(fields={'keyword': Keyword()})
-#     price_rate = Float()
-#     price_rate_type = Text(fields={'keyword': Keyword()}, required=True)
-#     province = Text(fields={'keyword': Keyword()})
-#     rating_accuracy = Float()
-#     rating_checkin = Float()
-#     rating_cleanliness = Float()
-#     rating_communication = Float()
-#     rating_location = Float()
-#     rating_value = Float()
-#     review_count = Integer()
-#     reviews = Nested()
-#     room_and_property_type = Text(fields={'keyword': Keyword()}, required=True)
-#     room_type = Text(fields={'keyword': Keyword()}, required=True)
-#     room_type_category = Text(fields={'keyword': Keyword()}, required=True)
-#     satisfaction_guest = Float()
-#     star_rating = Float()
-#     state = Text(fields={'keyword': Keyword()}, required=True)
-#     transit = Text()
-#     url = Text(fields={'keyword': Keyword()}, required=True)
-#     weekly_price_factor = Float()
+"""Elasticsearch index mapping for listings."""
+
+_text = {'type': 'text'}
+_text_keyword = {'type': 'text', 'fields': {'keyword': {'type': 'keyword'}}}
+_keyword = {'type': 'keyword'}
+_boolean = {'type': 'boolean'}
+_float = {'type': 'float'}
+_integer = {'type': 'integer'}
+
+LISTING_MAPPING = {
+    'properties': {
+        'access':                 _text,
+        'additional_house_rules': _text,
+        'allows_events':          _boolean,
+        'amenities':              _keyword,
+        'amenity_ids':            _keyword,
+        'available_dates':        _keyword,
+        'avg_rating':             _float,
+        'bathrooms':              _float,
+        'bedrooms':               _integer,
+        'beds':                   _integer,
+        'business_travel_ready':  _boolean,
+        'city':                   _text_keyword,
+        'country':                _text_keyword,
+        'coordinates':            {'type': 'geo_point'},
+        'datetime_scrape':        {'type': 'date'},
+        'description':            _text,
+        'host_id':                {'type': 'long', 'fields': {'keyword': _keyword}},
+        'house_rules':            _text,
+        'interaction':            _text,
+        'is_hotel':               _boolean,
+        'monthly_price_factor':   _float,
+        'name':                   _text_keyword,
+        'neighborhood_overview':  _text,
+        'person_capacity':        _integer,
+        'photo_count':            _integer,
+        'photos':                 _keyword,
+        'place_id':               _text_keyword,
+        'price_rate':             _float,
+        'price_rate_type':        _text_keyword,
+        'province':               _text_keyword,
+        'rating_accuracy':        _float,
+        'rating_checkin':         _float,
+        'rating_cleanliness':     _float,
+        'rating_communication':   _float,
+        'rating_location':        _float,
+        'rating_value':           _float,
+        'review_count':           _integer,
+        'review_score':           _float,
+        'reviews':                {'type': 'nested'},
+        'room_and_property_type': _text_keyword,
+        'room_type':              _text_keyword,
+        'room_type_category':     _text_keyword,
+        'satisfaction_guest':     _float,
+        'star_rating':            _float,
+        'state':                  _text_keyword,
+        'survey':                 _text_keyword,
+        'total_price':            _integer,
+        'transit':                _text,
+        'url':                    _text_keyword,
+        'weekly_price_factor':    _float,
+    }
+}
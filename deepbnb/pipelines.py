@@ -1,107 +1,47 @@
 # -*- coding: utf-8 -*-
-import elasticsearch.exceptions
-import re
+import logging
 import webbrowser
 
 from datetime import datetime
+from elasticsearch import Elasticsearch, helpers
+from twisted.internet import defer, task, threads
 
-# from deepbnb.model import Listing
-from scrapy.exceptions import DropItem
+from deepbnb.filters import ListingFilter
+from deepbnb.instrumentation import timed_pipeline
+from deepbnb.textindex import TextIndex
+from scrapy.exceptions import DropItem, NotConfigured
 
 
 class BnbPipeline:
     @classmethod
     def from_crawler(cls, crawler):
         return cls(
-            minimum_monthly_discount=crawler.settings.get('MINIMUM_MONTHLY_DISCOUNT'),
-            minimum_weekly_discount=crawler.settings.get('MINIMUM_WEEKLY_DISCOUNT'),
-            minimum_photos=crawler.settings.get('MINIMUM_PHOTOS'),
-            skip_list=crawler.settings.get('SKIP_LIST'),
-            cannot_have=crawler.settings.get('CANNOT_HAVE'),
-            must_have=crawler.settings.get('MUST_HAVE'),
-            property_type_blacklist=crawler.settings.get('PROPERTY_TYPE_BLACKLIST'),
+            listing_filter=ListingFilter.from_settings(crawler.settings),
             feed_format=crawler.settings.get('FEED_FORMAT'),  # output file type, autogenerated from -o file ext.
-            web_browser=crawler.settings.get('WEB_BROWSER')
+            web_browser=crawler.settings.get('WEB_BROWSER'),
+            stats=crawler.stats
         )
 
-    def __init__(
-            self,
-            minimum_monthly_discount,
-            minimum_weekly_discount,
-            minimum_photos,
-            skip_list,
-            cannot_have,
-            must_have,
-            property_type_blacklist,
-            feed_format,
-            web_browser
-    ):
+    def __init__(self, listing_filter, feed_format, web_browser, stats=None):
         """Class constructor."""
         self._feed_format = feed_format
-        # self._fields_to_check = ['description', 'name', 'summary', 'notes']
-        self._fields_to_check = ['description', 'name']
-        self._minimum_monthly_discount = minimum_monthly_discount
-        self._minimum_weekly_discount = minimum_weekly_discount
-        self._minimum_photos = minimum_photos
-
-        self._skip_list = skip_list
-        self._property_type_blacklist = property_type_blacklist
-
-        self._cannot_have_regex = cannot_have
-        if self._cannot_have_regex:
-            self._cannot_have_regex = re.compile(str(self._cannot_have_regex), re.IGNORECASE)
-
-        self._must_have_regex = must_have
-        if self._must_have_regex:
-            self._must_have_regex = re.compile(str(self._must_have_regex), re.IGNORECASE)
+        self._listing_filter = listing_filter
+        self._stats = stats
 
         self._web_browser = web_browser
         if self._web_browser:
             self._web_browser = webbrowser.get(web_browser + ' %s')  # append URL placeholder (%s)
 
+    @timed_pipeline
     def process_item(self, item, spider):
-        """Drop items not fitting parameters. Open in browser if specified. Return accepted items."""
-
-        if self._skip_list and str(item.get('id')) in self._skip_list:
-            raise DropItem('Item in skip list: {}'.format(item['id']))
-
-        if self._property_type_blacklist and item['room_and_property_type'] in self._property_type_blacklist:
-            raise DropItem('Skipping property type: {}'.format(item['room_and_property_type']))
-
-        if self._minimum_monthly_discount and 'monthly_discount' in item:
-            if item['monthly_discount'] < self._minimum_monthly_discount:
-                raise DropItem('Monthly discount too low: {}'.format(item['monthly_discount']))
-
-        if self._minimum_weekly_discount and 'weekly_discount' in item:
-            if item['weekly_discount'] < self._minimum_monthly_discount:
-                raise DropItem('Weekly discount too low: {}'.format(item['weekly_discount']))
-
-        if self._minimum_photos and item['photo_count'] < self._minimum_photos:
-            raise DropItem('Photos too low: {} photos'.format(item['photo_count']))
-
-        # check regexes
-        if self._cannot_have_regex:
-            for f in self._fields_to_check:
-                field_val = item[f]
-                if field_val is None:
-                    continue
-                v = str(field_val.encode('ASCII', 'replace'))
-                if self._cannot_have_regex.search(v):
-                    raise DropItem('Found: {}'.format(self._cannot_have_regex.pattern))
-
-        if self._must_have_regex:
-            has_must_haves = False
-            for f in self._fields_to_check:
-                field_val = item[f]
-                if field_val is None:
-                    continue
-                v = str(field_val.encode('ASCII', 'replace'))
-                if self._must_have_regex.search(v):
-                    has_must_haves = True
-                    break
-
-            if not has_must_haves:
-                raise DropItem('Not Found: {}'.format(self._must_have_regex.pattern))
+        """Drop items not fitting parameters, counting the filter that rejected each. Open in browser if specified.
+        Return accepted items."""
+        rejection = self._listing_filter.check(item)
+        if rejection:
+            filter_name, reason = rejection
+            if self._stats:
+                self._stats.inc_value(f'filter/rejected/{filter_name}')
+            raise DropItem(reason)
 
         if self._web_browser:  # open in browser
             self._web_browser.open_new_tab(item['url'])
@@ -109,83 +49,148 @@ class BnbPipeline:
         return item
 
 
+class TextIndexPipeline:
+    """Add items to the local text index in the TEXT_INDEX database as they're scraped, so they can be filtered again
+    with `python -m deepbnb.refilter`. Enabled before BnbPipeline, to index items its filters drop as well.
+    """
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.get('TEXT_INDEX'):
+            raise NotConfigured
+
+        text_index = TextIndex(
+            crawler.settings.get('TEXT_INDEX'), crawler.settings.getdict('PROPERTY_AMENITIES').values())
+
+        return cls(text_index=text_index, stats=crawler.stats)
+
+    def __init__(self, text_index, stats):
+        """Class constructor."""
+        self._stats = stats
+        self._text_index = text_index
+
+    def close_spider(self, spider):
+        self._text_index.close()
+
+    @timed_pipeline
+    def process_item(self, item, spider):
+        self._text_index.add(item)
+        self._stats.inc_value('text_index/items')
+
+        return item
+
+
 class ElasticBnbPipeline:
+    """Upsert items into Elasticsearch in bulk.
+
+    Items are buffered, and sent in a bulk request once `bulk_size` items are buffered or every `flush_interval`
+    seconds. Bulk requests run in a thread, so indexing never holds up the crawl. Closing the spider waits for all
+    bulk requests to finish.
+    """
     _datetime_scrape = datetime.now()
 
+    # item fields indexed as document properties, besides `coordinates` and `datetime_scrape`
+    properties = (
+        'access', 'additional_house_rules', 'allows_events', 'amenities', 'amenity_ids', 'available_dates',
+        'avg_rating', 'bathrooms', 'bedrooms', 'beds', 'business_travel_ready', 'city', 'country', 'description',
+        'host_id', 'house_rules', 'interaction', 'is_hotel', 'monthly_price_factor', 'name', 'neighborhood_overview',
+        'person_capacity', 'photo_count', 'photos', 'place_id', 'price_rate', 'price_rate_type', 'province',
+        'rating_accuracy', 'rating_checkin', 'rating_cleanliness', 'rating_communication', 'rating_location',
+        'rating_value', 'review_count', 'review_score', 'reviews', 'room_and_property_type', 'room_type',
+        'room_type_category', 'satisfaction_guest', 'star_rating', 'state', 'survey', 'total_price', 'transit', 'url',
+        'weekly_price_factor'
+    )
+
     @classmethod
     def from_crawler(cls, crawler):
-        return cls(elasticsearch_index=crawler.settings.get('ELASTICSEARCH_INDEX'))
+        return cls(
+            elasticsearch_servers=crawler.settings.getlist('ELASTICSEARCH_SERVERS', ['http://localhost:9200']),
+            elasticsearch_index=crawler.settings.get('ELASTICSEARCH_INDEX'),
+            bulk_size=crawler.settings.getint('ELASTICSEARCH_BULK_SIZE', 500),
+            flush_interval=crawler.settings.getfloat('ELASTICSEARCH_FLUSH_INTERVAL', 5.0),
+            stats=crawler.stats
+        )
 
-    def __init__(self, elasticsearch_index):
+    def __init__(self, elasticsearch_servers, elasticsearch_index, bulk_size, flush_interval, stats):
         """Class constructor."""
+        self._actions = []
+        self._bulk_size = bulk_size
+        self._client = Elasticsearch(elasticsearch_servers)
         self._elasticsearch_index = elasticsearch_index
+        self._flush_interval = flush_interval
+        self._flush_loop = task.LoopingCall(self._flush)
+        self._in_flight = set()
+        self._logger = logging.getLogger(__name__)
+        self._stats = stats
+
+    def open_spider(self, spider):
+        self._flush_loop.start(self._flush_interval, now=False)
+
+    def close_spider(self, spider):
+        """Flush remaining items, then wait for all bulk requests to finish."""
+        if self._flush_loop.running:
+            self._flush_loop.stop()
+
+        self._flush()
+
+        return defer.DeferredList(list(self._in_flight))
 
+    @timed_pipeline
     def process_item(self, item, spider):
-        """Insert / update items in ElasticSearch."""
-        properties = {
-            'access':                 item['access'],
-            'additional_house_rules': item['additional_house_rules'],
-            'allows_events':          item['allows_events'],
-            'amenities':              item['amenities'],
-            'amenity_ids':            item['amenity_ids'],
-            'avg_rating':             item['avg_rating'],
-            'bathrooms':              item['bathrooms'],
-            'bedrooms':               item['bedrooms'],
-            'beds':                   item['beds'],
-            'business_travel_ready':  item['business_travel_ready'],
-            'city':                   item['city'],
-            'country':                item['country'],
-            'coordinates':            {'lon': item['longitude'], 'lat': item['latitude']},
-            'description':            item['description'],
-            'host_id':                item['host_id'],
-            'house_rules':            item['house_rules'],
-            'interaction':            item.get('interaction'),
-            'is_hotel':               item['is_hotel'],
-            'monthly_price_factor':   item['monthly_price_factor'],
-            'name':                   item['name'],
-            'neighborhood_overview':  item['neighborhood_overview'],
-            'person_capacity':        item['person_capacity'],
-            'photo_count':            item['photo_count'],
-            'photos':                 item['photos'],
-            'place_id':               item['place_id'],
-            'price_rate':             item['price_rate'],
-            'price_rate_type':        item['price_rate_type'],
-            'province':               item['province'],
-            'rating_accuracy':        item['rating_accuracy'],
-            'rating_checkin':         item['rating_checkin'],
-            'rating_cleanliness':     item['rating_cleanliness'],
-            'rating_communication':   item['rating_communication'],
-            'rating_location':        item['rating_location'],
-            'rating_value':           item['rating_value'],
-            'review_count':           item['review_count'],
-            'review_score':           item.get('review_score'),
-            'reviews':                item.get('reviews'),
-            'room_and_property_type': item['room_and_property_type'],
-            'room_type':              item['room_type'],
-            'room_type_category':     item['room_type_category'],
-            'satisfaction_guest':     item['satisfaction_guest'],
-            'datetime_scrape':        self._datetime_scrape,
-            'star_rating':            item['star_rating'],
-            'state':                  item['state'],
-            'transit':                item.get('transit'),
-            'url':                    item['url'],
-            'weekly_price_factor':    item['weekly_price_factor']
-        }
-
-        # update if exists, else insert new
-        try:
-            listing = Listing.get(id=item['id'], index=self._elasticsearch_index)
-            listing.update(**properties)
-        except elasticsearch.exceptions.NotFoundError:
-            properties['meta'] = {'id': item['id']}
-            listing = Listing(**properties)
-            listing.save(index=self._elasticsearch_index)
+        """Queue item to be inserted / updated in Elasticsearch."""
+        self._actions.append({
+            '_op_type':      'update',
+            '_index':        self._elasticsearch_index,
+            '_id':           item['id'],
+            'doc':           self._get_properties(item),
+            'doc_as_upsert': True,
+        })
+
+        if len(self._actions) >= self._bulk_size:
+            self._flush()
 
         return item
 
+    def _flush(self):
+        """Send buffered items in a bulk request, in a thread."""
+        if not self._actions:
+            return
+
+        actions, self._actions = self._actions, []
+        d = threads.deferToThread(helpers.bulk, self._client, actions, raise_on_error=False)
+        d.addCallbacks(self._bulk_done, self._bulk_failed, errbackArgs=(len(actions),))
+        d.addBoth(self._forget, d)
+        self._in_flight.add(d)
+
+    def _bulk_done(self, result):
+        n_success, errors = result
+        self._stats.inc_value('elasticsearch/indexed', n_success)
+        if errors:
+            self._stats.inc_value('elasticsearch/errors', len(errors))
+            self._logger.error(f'Elasticsearch bulk request had {len(errors)} errors, first: {errors[0]}')
+
+    def _bulk_failed(self, failure, n_actions):
+        self._stats.inc_value('elasticsearch/errors', n_actions)
+        self._logger.error(f'Elasticsearch bulk request for {n_actions} items failed: {failure.value!r}')
+
+    def _forget(self, result, d):
+        self._in_flight.discard(d)
+        return result
+
+    def _get_properties(self, item) -> dict:
+        """Get document properties for item, as mapped in deepbnb.model.LISTING_MAPPING. Fields the item doesn't have,
+        e.g. those only found on listing pages if they aren't requested, are left out, so upserts keep their values."""
+        properties = {name: item[name] for name in self.properties if name in item}
+        if 'longitude' in item and 'latitude' in item:
+            properties['coordinates'] = {'lon': item['longitude'], 'lat': item['latitude']}
+        properties['datetime_scrape'] = self._datetime_scrape
+
+        return properties
+
 
 class DuplicatesPipeline:
-    """Looks for duplicate items, and drops those items that were already processed
+    """Looks for duplicate items, and drops those items that were already processed. In a distributed crawl, items
+    processed by any worker are dropped.
 
     @ref: https://docs.scrapy.org/en/latest/topics/item-pipeline.html#duplicates-filter
     """
@@ -193,9 +198,17 @@ class DuplicatesPipeline:
     def __init__(self):
         self.ids_seen = set()
 
+    @timed_pipeline
     def process_item(self, item, spider):
-        if item['id'] in self.ids_seen:
+        frontier = getattr(spider, 'frontier', None)
+        if frontier:  # distributed crawl, items may be saved by any worker
+            if not frontier.claim(f'item/{item["id"]}'):
+                raise DropItem("Duplicate item found: %s" % item)
+            return item
+
+        key = (item.get('survey'), item['id'])  # surveys of a batch crawl may share listings
+        if key in self.ids_seen:
             raise DropItem("Duplicate item found: %s" % item)
         else:
-            self.ids_seen.add(item['id'])
+            self.ids_seen.add(key)
             return item
@@ -0,0 +1,137 @@
+from logging import LoggerAdapter
+
+from scrapy.statscollectors import StatsCollector
+
+
+class SearchPlanner:
+    """Split searches which exceed Airbnb's per-search result cap into smaller searches.
+
+    Airbnb stops returning results for a search after a fixed number of results (`result_cap`). A search that reaches
+    the cap is split in two by price band, until bands are no wider than the price increment. After that, its bounding
+    box is split into four quadtree tiles, until tiles are no smaller than `min_tile_size`. Sub-searches are returned as
+    search params, which the spider requests concurrently instead of paginating the capped search.
+    """
+
+    bbox_keys = ('ne_lat', 'ne_lng', 'sw_lat', 'sw_lng')
+    min_tile_size = 0.005  # degrees latitude / longitude
+
+    def __init__(self, logger: LoggerAdapter, stats: StatsCollector, price_range: tuple, result_cap: int = 300,
+                 bbox: dict = None):
+        self.__bbox = {k: float(v) for k, v in bbox.items()} if bbox and all(bbox.values()) else None
+        self.__counted_roots = set()
+        self.__depths = {}
+        self.__logger = logger
+        self.__price_min, self.__price_max, self.__price_increment = price_range
+        self.__result_cap = result_cap
+        self.__root_result_count = 0
+        self.__split_keys = set()
+        self.__stats = stats
+
+    def split(self, params: dict, metadata: dict) -> list:
+        """Return sub-search params if the search for `params` reaches the result cap, otherwise an empty list.
+
+        :param params: search params of the response, as collected by ExploreSearch.add_search_params
+        :param metadata: exploreV3 response metadata
+        """
+        key = self.__search_key(params)
+        if key in self.__split_keys:
+            return []  # already split, following pages of the same search
+
+        depth = self.__depths.setdefault(key, 0)
+        result_count = self._get_result_count(metadata)
+        if depth == 0 and result_count is not None and key not in self.__counted_roots:
+            self.__counted_roots.add(key)
+            self.__root_result_count += result_count
+
+        if not self.__is_capped(result_count, metadata['paginationMetadata']):
+            return []
+
+        self.__split_keys.add(key)
+        sub_searches = self.__split_price_band(params) or self.__split_bbox(params)
+        if not sub_searches:
+            self.__stats.inc_value('planner/capped_searches')
+            self.__logger.warning(f'Search cannot be split any further, results capped: {params}')
+            return []
+
+        for sub_params in sub_searches:
+            self.__depths[self.__search_key(sub_params)] = depth + 1
+
+        self.__stats.inc_value('planner/sub_searches', len(sub_searches))
+        self.__stats.max_value('planner/max_depth', depth + 1)
+
+        return sub_searches
+
+    def report(self, listings_found: int):
+        """Log coverage statistics and add them to crawl stats."""
+        self.__stats.set_value('planner/searches', len(self.__depths))
+        self.__stats.set_value('planner/listings_found', listings_found)
+        self.__stats.set_value('planner/listings_reported', self.__root_result_count)
+        if self.__root_result_count:
+            coverage = round(100 * listings_found / self.__root_result_count, 1)
+            self.__stats.set_value('planner/coverage_percent', coverage)
+            self.__logger.info(f'Search coverage: {listings_found} of {self.__root_result_count} ({coverage}%)')
+
+    @staticmethod
+    def _get_result_count(metadata: dict) -> int | None:
+        """Get total number of results for a search, if Airbnb reports it."""
+        result_count = metadata.get('listingsCount', metadata['paginationMetadata'].get('totalCount'))
+
+        return int(result_count) if result_count is not None else None
+
+    def __is_capped(self, result_count: int | None, pagination: dict) -> bool:
+        """Determine whether a search reaches the result cap. Without a result count, check where pagination ends."""
+        if result_count is not None:
+            return result_count >= self.__result_cap
+
+        return pagination['hasNextPage'] and pagination['itemsOffset'] >= self.__result_cap
+
+    def __split_price_band(self, params: dict) -> list:
+        """Split price band in two, rounded to the price increment. Open-ended bands are split at the max price."""
+        price_min = int(params.get('priceMin', self.__price_min))
+        price_max = int(params['priceMax']) if 'priceMax' in params else None
+        if price_max is None:
+            if price_min >= self.__price_max:
+                return []
+            price_mid = self.__price_max
+        elif price_max - price_min > self.__price_increment:
+            half = (price_max - price_min) // 2
+            price_mid = price_min + max(half - half % self.__price_increment, self.__price_increment)
+        else:
+            return []
+
+        self.__stats.inc_value('planner/splits/price')
+        lower = params | {'priceMin': price_min, 'priceMax': price_mid}
+        upper = params | {'priceMin': price_mid + 1}
+        if price_max is not None:
+            upper['priceMax'] = price_max
+
+        return [lower, upper]
+
+    def __split_bbox(self, params: dict) -> list:
+        """Split bounding box into four quadtree tiles."""
+        bbox = self.__bbox
+        if all(k in params for k in self.bbox_keys):
+            bbox = {k: float(params[k]) for k in self.bbox_keys}
+
+        if not bbox:
+            return []
+
+        lat_mid = (bbox['ne_lat'] + bbox['sw_lat']) / 2
+        lng_mid = (bbox['ne_lng'] + bbox['sw_lng']) / 2
+        if bbox['ne_lat'] - lat_mid < self.min_tile_size or bbox['ne_lng'] - lng_mid < self.min_tile_size:
+            return []
+
+        self.__stats.inc_value('planner/splits/bbox')
+        tiles = [
+            {'ne_lat': lat_mid, 'ne_lng': lng_mid, 'sw_lat': bbox['sw_lat'], 'sw_lng': bbox['sw_lng']},
+            {'ne_lat': lat_mid, 'ne_lng': bbox['ne_lng'], 'sw_lat': bbox['sw_lat'], 'sw_lng': lng_mid},
+            {'ne_lat': bbox['ne_lat'], 'ne_lng': lng_mid, 'sw_lat': lat_mid, 'sw_lng': bbox['sw_lng']},
+            {'ne_lat': bbox['ne_lat'], 'ne_lng': bbox['ne_lng'], 'sw_lat': lat_mid, 'sw_lng': lng_mid},
+        ]
+
+        return [params | tile for tile in tiles]
+
+    @staticmethod
+    def __search_key(params: dict) -> tuple:
+        """Identify a search by its params, excluding pagination."""
+        return tuple(sorted((k, str(v)) for k, v in params.items() if k not in ('itemsOffset', 'lastSearchSessionId')))
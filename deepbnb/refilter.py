@@ -0,0 +1,52 @@
+"""Filter the items of a text index again, e.g. with new CANNOT_HAVE / MUST_HAVE patterns, without crawling again.
+
+    python -m deepbnb.refilter INDEX -o items.jsonl [--survey NAME] [-s NAME=VALUE ...]
+
+The index is written during a crawl with the TEXT_INDEX setting. Its items are checked against the BnbPipeline filters
+in `settings.py`, with settings given by -s taking precedence, and accepted items are written to the output file, in
+the format given by its extension, as with `scrapy crawl -o`. Keyword filters are looked up in the index first, and
+AMENITIES_REQUIRED / AMENITIES_EXCLUDED checked on the amenity bitsets of all items at once, so only items they may
+accept are read.
+"""
+import argparse
+import time
+
+from scrapy.utils.project import get_project_settings
+
+from deepbnb.filters import ListingFilter
+from deepbnb.items import DeepbnbItem
+from deepbnb.reparse import export, output_format
+from deepbnb.textindex import TextIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('index', help='text index database, written with the TEXT_INDEX setting')
+    parser.add_argument('-o', '--output', required=True, help='output file, e.g. items.jsonl, items.xlsx')
+    parser.add_argument('--survey', help='only items of this survey of a batch crawl')
+    parser.add_argument('-s', dest='settings', action='append', default=[], metavar='NAME=VALUE',
+                        help='setting, e.g. -s MUST_HAVE="(balcony|terrace)"')
+    args = parser.parse_args()
+
+    settings = get_project_settings()
+    settings.setdict(dict(s.split('=', 1) for s in args.settings), priority='cmdline')
+    try:
+        output_format(args.output, settings)
+    except ValueError as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    listing_filter = ListingFilter.from_settings(settings)
+    text_index = TextIndex(args.index)
+    total = text_index.count()
+    items = text_index.items(listing_filter.text_rules, args.survey, listing_filter.amenity_filter)
+    accepted = [DeepbnbItem(item) for item in items if not listing_filter.check(item)]
+    text_index.close()
+    elapsed = time.perf_counter() - start
+
+    export(accepted, args.output, settings)
+    print(f'Refiltered {len(accepted)} of {total} items to {args.output} in {elapsed * 1000:.0f} ms')
+
+
+if __name__ == '__main__':
+    main()
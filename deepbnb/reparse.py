@@ -0,0 +1,285 @@
+"""Rebuild items from a response archive, without network access.
+
+    python -m deepbnb.reparse ARCHIVE -o items.jsonl [--workers 4] [-a NAME=VALUE ...] [-s NAME=VALUE ...]
+
+Archived search responses are split between worker processes, and parsed by `AirbnbSpider.parse`, with a spider for
+the query of each search. The listings found are then split between the workers, which answer the listing, calendar and
+review requests they generate from the archive instead of downloading them. Requests missing from the archive fail as
+if the download had failed. Item pipelines aren't run, but items are checked against the BnbPipeline filters if that
+pipeline is enabled.
+
+Spider arguments are taken from the first archived search of each query, unless given with -a. Output format is chosen
+by the output file extension, as with `scrapy crawl -o`.
+"""
+import argparse
+import os
+import zlib
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from scrapy import Request
+from scrapy.crawler import Crawler
+from scrapy.exceptions import DropItem, IgnoreRequest
+from scrapy.http import TextResponse
+from scrapy.statscollectors import MemoryStatsCollector
+from scrapy.utils.misc import create_instance, load_object
+from scrapy.utils.project import get_project_settings
+from scrapy.settings import Settings
+from twisted.python.failure import Failure
+
+from deepbnb.archive import ResponseArchive
+from deepbnb.filters import ListingFilter
+from deepbnb.fixtures import FixtureArchive
+from deepbnb.spiders.airbnb import AirbnbSpider
+
+
+FORMAT_ALIASES = {'jsonl': 'jsonlines'}  # output file extensions Scrapy has no exporter for by that name
+
+
+class ReparseSpider(AirbnbSpider):
+    """AirbnbSpider for archived responses. Searches may have been for dates now in the past."""
+
+    name = 'airbnb_reparse'
+
+    @staticmethod
+    def _validate_dates(checkin: str, checkout: str):
+        pass
+
+
+def search_query(url: str) -> str:
+    """Return query of archived search, given its URL."""
+    _, variables = FixtureArchive.parse_url(url)
+    return variables['query']
+
+
+def get_spider_kwargs(archive: ResponseArchive) -> dict:
+    """Get spider arguments for each query searched in the archive, from its first archived search. Return query:
+    arguments."""
+    searches = sorted((e for k, e in archive.index.items() if k.startswith('ExploreSearch/')), key=lambda e: e['time'])
+    if not searches:
+        raise ValueError('No searches in archive')
+
+    spider_kwargs = {}
+    for entry in searches:
+        _, variables = FixtureArchive.parse_url(entry['url'])
+        if variables['query'] in spider_kwargs:
+            continue
+
+        kwargs = {'query': variables['query']}
+        if variables.get('checkin'):
+            kwargs.update(checkin=variables['checkin'], checkout=variables['checkout'])
+        spider_kwargs[variables['query']] = kwargs
+
+    return spider_kwargs
+
+
+def reparse_settings(settings) -> Settings:
+    """Return settings for crawlers built to reparse or export, which never run a crawl."""
+    settings = Settings(settings)
+    settings.set('ITEM_PIPELINES', {})  # no Elasticsearch index creation or prefiltering, items are filtered after
+    settings.set('CRAWL_STATE_DB', None)
+    settings.set('FRONTIER', None)  # never push archived listings to a live distributed crawl
+    settings.set('PDP_PARSE_WORKERS', 0)  # reparse workers are processes already
+    settings.set('TWISTED_REACTOR', None)  # no reactor is run, so none needs installing
+
+    return settings
+
+
+def open_spider(settings: dict, spider_kwargs: dict) -> ReparseSpider:
+    """Create spider for reparsing, and set up its API classes. Its requests are answered from the archive."""
+    crawler = Crawler(ReparseSpider, reparse_settings(settings))
+    crawler.stats = crawler.stats or MemoryStatsCollector(crawler)  # Scrapy 2.11+ only sets up stats in crawl()
+    spider = ReparseSpider.from_crawler(crawler, **spider_kwargs)
+    crawler.spider = spider
+    for _ in spider.start_requests():  # start requests are answered from the archive instead
+        pass
+
+    return spider
+
+
+def close_spiders(spiders: dict) -> int:
+    """Close spiders. Return number of responses they failed to parse."""
+    for spider in spiders.values():
+        spider.closed('finished')
+
+    return sum(spider.crawler.stats.get_value('reparse/failed', 0) for spider in spiders.values())
+
+
+def find_listings(archive_path: str, settings: dict, spider_kwargs: dict, workers: int = 1, worker: int = 0) -> tuple:
+    """Parse the archived searches assigned to this worker, each with a spider for its query. Return items built from
+    search results, (query, listing task) pairs of the listings to rebuild from their listing pages or calendars, and
+    number of searches that failed to parse.
+    """
+    archive = ResponseArchive(archive_path)
+    searches = sorted((e for k, e in archive.index.items() if k.startswith('ExploreSearch/')), key=lambda e: e['time'])
+    spiders = {}
+    items = []
+    tasks = []
+    for entry in searches:
+        if zlib.crc32(archive.key(entry['url']).encode()) % workers != worker:
+            continue  # search belongs to another worker
+
+        query = search_query(entry['url'])
+        if query not in spiders:
+            spiders[query] = open_spider(settings, spider_kwargs[query])
+
+        spider = spiders[query]
+        for result in answer_safely(archive, Request(entry['url'], callback=spider.parse), spider):
+            if not isinstance(result, Request):
+                items.append(result)
+            elif 'listing_id' in result.meta:  # other searches are archived too, and parsed by their own worker
+                tasks.append((query, spider._listing_task(result.meta['listing_id'])))
+
+    archive.close()
+
+    return items, tasks, close_spiders(spiders)
+
+
+def reparse(archive_path: str, settings: dict, spider_kwargs: dict, tasks: list) -> tuple:
+    """Rebuild items of the listings assigned to this worker from their archived responses, given (query, listing task)
+    pairs. Return items, and number of responses that failed to parse."""
+    archive = ResponseArchive(archive_path)
+    spiders = {}
+    pending = deque()
+    items = []
+    for query, listing_task in tasks:
+        if query not in spiders:
+            spiders[query] = open_spider(settings, spider_kwargs[query])
+
+        pending.append((spiders[query], spiders[query]._task_requests('listing', listing_task)))
+
+    while pending:
+        spider, results = pending.popleft()
+        for result in results:
+            if isinstance(result, Request):
+                pending.append((spider, answer_safely(archive, result, spider)))
+            else:
+                items.append(result)
+
+    archive.close()
+
+    return items, close_spiders(spiders)
+
+
+def answer(archive: ResponseArchive, request: Request):
+    """Call request callback with archived response, or errback if request isn't archived. Return callback output."""
+    entry = archive.index.get(archive.key(request.url))
+    if entry is None:
+        if not request.errback:
+            return []
+
+        return request.errback(Failure(IgnoreRequest(f'Not in archive: {request.url}'))) or []
+
+    response = TextResponse(
+        entry['url'], status=entry['status'], body=archive.read(entry), encoding='utf-8', request=request)
+
+    return request.callback(response, **request.cb_kwargs) or []
+
+
+def answer_safely(archive: ResponseArchive, request: Request, spider: ReparseSpider) -> list:
+    """Answer request from the archive, as `answer` does. If its callback raises, log and count the error, and give up
+    on the request only, so one bad response doesn't fail the whole worker."""
+    try:
+        return list(answer(archive, request))
+    except Exception:
+        spider.logger.exception(f'Failed to reparse {request.url}')
+        spider.crawler.stats.inc_value('reparse/failed')
+        return []
+
+
+def output_format(output: str, settings: Settings) -> str:
+    """Return feed format of output file, given by its extension. Raise ValueError if no exporter handles it."""
+    extension = os.path.splitext(output)[1].lstrip('.')
+    feed_format = FORMAT_ALIASES.get(extension, extension)
+    if not settings.getwithbase('FEED_EXPORTERS').get(feed_format):
+        raise ValueError(f'No exporter for output file {output}, use one of the extensions: '
+                         f'{", ".join(sorted(set(settings.getwithbase("FEED_EXPORTERS")) | set(FORMAT_ALIASES)))}')
+
+    return feed_format
+
+
+def export(items: list, output: str, settings: Settings):
+    """Export items to output file in the format given by its extension."""
+    exporter_cls = load_object(settings.getwithbase('FEED_EXPORTERS')[output_format(output, settings)])
+    crawler = Crawler(ReparseSpider, reparse_settings(settings))
+    with open(output, 'wb') as f:
+        exporter = create_instance(exporter_cls, settings, crawler, f, fields_to_export=settings.getlist(
+            'FEED_EXPORT_FIELDS') or None)
+        exporter.start_exporting()
+        for item in items:
+            exporter.export_item(item)
+        exporter.finish_exporting()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('archive', help='response archive directory, written with the RESPONSE_ARCHIVE setting')
+    parser.add_argument('-o', '--output', required=True, help='output file, e.g. items.jsonl, items.xlsx')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('-a', dest='spider_args', action='append', default=[], metavar='NAME=VALUE',
+                        help='spider argument, e.g. -a query="Madrid, Spain"')
+    parser.add_argument('-s', dest='settings', action='append', default=[], metavar='NAME=VALUE',
+                        help='setting, e.g. -s MINIMUM_PHOTOS=5')
+    args = parser.parse_args()
+
+    settings = get_project_settings()
+    settings.setdict(dict(s.split('=', 1) for s in args.settings), priority='cmdline')
+    try:
+        output_format(args.output, settings)
+    except ValueError as e:
+        parser.error(str(e))
+
+    archive = ResponseArchive(args.archive)
+    cmdline_kwargs = dict(a.split('=', 1) for a in args.spider_args)
+    spider_kwargs = {query: kwargs | cmdline_kwargs for query, kwargs in get_spider_kwargs(archive).items()}
+    archive.close()
+
+    settings_dict = settings.copy_to_dict()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(find_listings, args.archive, settings_dict, spider_kwargs, args.workers, worker)
+                   for worker in range(args.workers)]
+        found = [future.result() for future in futures]
+        failed = sum(searches_failed for _, _, searches_failed in found)
+
+        # listings found by searches of several workers are rebuilt once, by the worker their ID is assigned to
+        items = []
+        ids_seen = set()
+        shards = [[] for _ in range(args.workers)]
+        for found_items, tasks, _ in found:
+            for item in found_items:
+                if item['id'] not in ids_seen:
+                    ids_seen.add(item['id'])
+                    items.append(item)
+
+            for query, listing_task in tasks:
+                if listing_task['id'] not in ids_seen:
+                    ids_seen.add(listing_task['id'])
+                    shards[zlib.crc32(str(listing_task['id']).encode()) % args.workers].append((query, listing_task))
+
+        futures = [executor.submit(reparse, args.archive, settings_dict, spider_kwargs, shard)
+                   for shard in shards if shard]
+        for future in futures:
+            listing_items, listings_failed = future.result()
+            items += listing_items
+            failed += listings_failed
+
+    listing_filter = None
+    if 'deepbnb.pipelines.BnbPipeline' in settings.getdict('ITEM_PIPELINES'):
+        listing_filter = ListingFilter.from_settings(settings)
+
+    accepted = []
+    for item in items:
+        try:
+            if listing_filter:
+                listing_filter.check_item(item)
+            accepted.append(item)
+        except DropItem:
+            pass
+
+    export(accepted, args.output, settings)
+    print(f'Reparsed {len(accepted)} items ({len(items) - len(accepted)} filtered, {failed} responses failed to parse) '
+          f'to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
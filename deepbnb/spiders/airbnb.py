@@ -1,14 +1,34 @@
 import json
+import multiprocessing
+import os
 import re
 import scrapy
+import socket
+import time
 
+from concurrent.futures import Executor, ProcessPoolExecutor
 from datetime import date, timedelta
+from elasticsearch import Elasticsearch
+from scrapy import signals
+from scrapy.crawler import Crawler
+from scrapy.exceptions import DontCloseSpider
 from scrapy.http import HtmlResponse
+from scrapy.statscollectors import StatsCollector
 from scrapy_playwright.page import PageMethod
+from twisted.internet import task
 
+from deepbnb.api.ApiBase import ApiBase
 from deepbnb.api.ExploreSearch import ExploreSearch
+from deepbnb.api.PdpAvailabilityCalendar import PdpAvailabilityCalendar
 from deepbnb.api.PdpPlatformSections import PdpPlatformSections
 from deepbnb.api.PdpReviews import PdpReviews
+from deepbnb.cache import ListingDataCache
+from deepbnb.filters import ListingFilter
+from deepbnb.frontier import Frontier
+from deepbnb.instrumentation import observe
+from deepbnb.model import LISTING_MAPPING
+from deepbnb.planner import SearchPlanner
+from deepbnb.state import CrawlState
 
 
 class AirbnbSpider(scrapy.Spider):
@@ -42,22 +62,58 @@ class AirbnbSpider(scrapy.Spider):
     ):
         """Class constructor."""
         super().__init__(**kwargs)
+        self.__availability_calendar = None
         self.__checkin = checkin
+        self.__checkin_vars = None
         self.__checkout = checkout
+        self.__crawl_state = None
         self.__currency = currency
-        self.__data_cache = {}
+        self.__data_cache = None
         self.__explore_search = None
+        self.__frontier = None
+        self.__frontier_poll = None
         self.__geography = {}
-        self.__ids_seen = set()
+        self.__ids_seen = set()  # one int per listing found, as many as the survey's search results
+        self.__in_batch = False
+        self.__landing_listing_ids = None
+        self.__listing_filter = None
+        self.__listing_pages = True
         self.__ne_lat = ne_lat
         self.__ne_lng = ne_lng
+        self.__pdp_executor = None
         self.__pdp_platform_sections = None
         self.__pdp_reviews = None
         self.__query = query
         self.__search_params = {}
+        self.__search_hits = None
+        self.__search_planner = None
+        self.__start_params = {}
         self.__set_price_params(max_price, min_price)
+        self.__stats = None
+        self.__survey = None
         self.__sw_lat = sw_lat
         self.__sw_lng = sw_lng
+        self.__tasks_in_progress = set()
+
+    @property
+    def frontier(self) -> Frontier | None:
+        return self.__frontier
+
+    @property
+    def listings_found(self) -> int:
+        return len(self.__ids_seen)
+
+    def join_batch(self, survey: str, stats: StatsCollector, crawl_state: CrawlState, pdp_executor: Executor):
+        """Run as one survey of a batch crawl, before start_requests.
+
+        Items are tagged with the survey name, and stats go to `stats`. Crawl state and listing page parser processes
+        are the batch's, which opens and closes them.
+        """
+        self.__crawl_state = crawl_state
+        self.__in_batch = True
+        self.__pdp_executor = pdp_executor
+        self.__stats = stats
+        self.__survey = survey
 
     def start_requests(self):
         """Spider entry point. Generate the first search request(s)."""
@@ -65,7 +121,58 @@ class AirbnbSpider(scrapy.Spider):
         if 'deepbnb.pipelines.ElasticBnbPipeline' in self.settings.get('ITEM_PIPELINES'):
             self.__create_index_if_not_exists()
 
+        if not self.__in_batch:
+            self.__stats = self.crawler.stats
+            self.__crawl_state = self.open_crawl_state(self.crawler)
+            self.__pdp_executor = self.create_pdp_executor(self.settings)
+            self.__frontier = self.open_frontier(self.crawler, self.__query)
+
+        if self.settings.getbool('INSTRUMENTATION_ENABLED'):
+            self.__search_hits = {}  # listing ID: time found in search results
+
+        if not self.__in_batch and (self.__frontier or self.__search_hits is not None):
+            self.crawler.signals.connect(self.item_scraped, signal=signals.item_scraped)
+            self.crawler.signals.connect(self.item_dropped, signal=signals.item_dropped)
+
+        self.crawler.signals.connect(self.__listing_error, signal=signals.spider_error)
+
+        if self.__frontier:  # distributed crawl, searches and listings go through the frontier
+            self.crawler.signals.connect(self.__frontier_idle, signal=signals.spider_idle)
+            self.crawler.signals.connect(self.__complete_task, signal=signals.response_received)
+            self.crawler.signals.connect(self.__task_left_downloader, signal=signals.request_left_downloader)
+            # lease tasks pushed by other workers while idle, sooner than the engine's idle checks
+            self.__frontier_poll = task.LoopingCall(self.__lease_tasks)
+            self.__frontier_poll.start(self.settings.getfloat('FRONTIER_POLL_INTERVAL', 1.0), now=False)
+
+        self.__data_cache = ListingDataCache(
+            self.logger,
+            self.__stats,
+            self.settings.getint('LISTING_CACHE_MAX_BYTES'),
+            self.settings.get('LISTING_CACHE_SPILL_DIR')
+        )
+
+        # apply BnbPipeline filters to search results, to avoid requesting listings that would be dropped anyway
+        if 'deepbnb.pipelines.BnbPipeline' in self.settings.get('ITEM_PIPELINES'):
+            self.__listing_filter = ListingFilter.from_settings(self.settings)
+
+        self.__listing_pages = self.listing_pages_wanted(self.settings, self.__listing_filter)
+        if not self.__listing_pages:
+            self.logger.info('Not requesting listing pages, items are built from search results')
+
+        ApiBase.set_json_decoder(self.settings.get('JSON_DECODER', 'auto'))
         api_key = self.settings.get('AIRBNB_API_KEY')
+        pdp_reviews = None
+        if self.reviews_wanted(self.settings):
+            reviews_max = self.settings.get('REVIEWS_MAX')
+            pdp_reviews = PdpReviews(
+                api_key,
+                self.logger,
+                self.__currency,
+                crawl_state=self.__crawl_state,
+                max_reviews=int(reviews_max) if reviews_max is not None else None
+            )
+        else:
+            self.logger.info('Not fetching reviews, no feed exports them')
         self.__explore_search = ExploreSearch(
             api_key,
             self.logger,
@@ -73,7 +180,8 @@ class AirbnbSpider(scrapy.Spider):
             self,
             self.settings.get('ROOM_TYPES'),
             self.__geography,
-            self.__query
+            self.__query,
+            self.settings.getbool('PLAYWRIGHT_API_REQUESTS', True)
         )
         self.__pdp_platform_sections = PdpPlatformSections(
             api_key,
@@ -81,9 +189,22 @@ class AirbnbSpider(scrapy.Spider):
             self.__currency,
             self.__data_cache,
             self.__geography,
-            PdpReviews(api_key, self.logger, self.__currency)
+            pdp_reviews,
+            self.__pdp_executor,
+            self.__survey,
+            self.__listing_filter,
+            self.__stats
         )
 
+        if self.settings.getbool('SEARCH_PLANNER'):
+            self.__search_planner = SearchPlanner(
+                self.logger,
+                self.__stats,
+                self.price_range,
+                self.settings.getint('SEARCH_RESULT_CAP', 300),
+                {'ne_lat': self.__ne_lat, 'ne_lng': self.__ne_lng, 'sw_lat': self.__sw_lat, 'sw_lng': self.__sw_lng}
+            )
+
         # get params from injected constructor values
         params = {}
         if self.__price_max:
@@ -105,74 +226,171 @@ class AirbnbSpider(scrapy.Spider):
             params['sw_lng'] = self.__sw_lng
 
         if self.__checkin:  # assume self._checkout also
-            checkin, checkout, checkin_range_spec, checkout_range_spec = self._process_checkin_vars()
-            yield from self.__explore_search.perform_checkin_start_requests(
-                checkin, checkout, checkin_range_spec, checkout_range_spec, params)
+            self.__checkin_vars = self._process_checkin_vars()
+            self.__start_params = params
+            checkin_range_spec, checkout_range_spec = self.__checkin_vars[2:]
+            if (checkin_range_spec or checkout_range_spec) and self.settings.getbool('FLEXIBLE_DATES_CALENDAR'):
+                self.__availability_calendar = PdpAvailabilityCalendar(
+                    api_key,
+                    self.logger,
+                    self.__currency,
+                    self.__data_cache,
+                    self.__explore_search.get_date_pairs(*self.__checkin_vars),
+                    self.__pdp_requests,
+                    self.__listing_done
+                )
+
+            if self.settings.getbool('PLAYWRIGHT_API_REQUESTS', True):
+                yield from self.__checkin_search()
+            else:  # get session cookies from browser first, API requests don't use it
+                yield from self.__city_search(self.parse_session_bootstrap)
         else:
-            yield from self.__city_search()
+            yield from self.__city_search(self.parse_landing_page)
+
+    def __checkin_search(self):
+        """Search for the checkin / checkout dates (or ranges) given to the constructor."""
+        if self.__availability_calendar:  # search once, then check each listing's calendar for matching dates
+            yield from self.__frontier_searches([self.__explore_search.api_request(
+                self.__query, self.__start_params, self.__explore_search.parse_landing_page)])
+            return
+
+        checkin, checkout, checkin_range_spec, checkout_range_spec = self.__checkin_vars
+        yield from self.__frontier_searches(self.__explore_search.perform_checkin_start_requests(
+            checkin, checkout, checkin_range_spec, checkout_range_spec, self.__start_params))
+
+    def closed(self, reason):
+        """Report search coverage, clean up listing data cache and save crawl state when the spider closes."""
+        if self.__search_planner:
+            self.__search_planner.report(len(self.__ids_seen))
+
+        if self.__data_cache is not None:
+            self.__data_cache.close()
+
+        if self.__in_batch:
+            return  # crawl state and listing page parser processes are closed by the batch
 
-    def __city_search(self):
-        """Search entire city given in self.__query"""
+        if self.__crawl_state:
+            self.__crawl_state.close()
+
+        if self.__frontier_poll and self.__frontier_poll.running:
+            self.__frontier_poll.stop()
+
+        if self.__frontier:
+            self.__frontier.close()
+
+        if self.__pdp_executor:
+            self.__pdp_executor.shutdown(cancel_futures=True)
+
+    def __city_search(self, callback):
+        """Load search landing page for entire city given in self.__query in browser."""
         search_path = self.__query.replace(', ', '--').replace(' ', '-') + '/homes'
         url = self.__explore_search.build_airbnb_url('s/' + search_path)
         headers = self.__get_search_headers()
-        yield scrapy.Request(url, callback=self.parse_landing_page, headers=headers, meta={
+        yield scrapy.Request(url, callback=callback, headers=headers, meta={
             'playwright':              True,
             'playwright_include_page': True,
             'playwright_page_methods': [PageMethod('wait_for_selector', '#data-deferred-state', state='hidden')]
-        }, errback=self.errback, cb_kwargs={'headers': headers})
+        }, errback=self.errback, cb_kwargs={'headers': headers}, dont_filter=True)  # batch surveys may share a city
 
     async def errback(self, failure):
         page = failure.request.meta['playwright_page']
         await page.close()
 
+    async def parse_session_bootstrap(self, response: HtmlResponse, headers: dict):
+        """Collect session cookies from the browser, then start the checkin / checkout searches."""
+        await self.__collect_session_cookies(response)
+        for request in self.__checkin_search():
+            yield request
+
     async def parse_landing_page(self, response: HtmlResponse, headers: dict):
         """Parse search response and generate URLs for all searches, then perform them."""
+        await self.__collect_session_cookies(response)
+
         # debugging: get data from all script data-* attributes
         # script_data = {s.attrib['id']: json.loads(s.css('::text').get()) for s in response.css('script[id^=data-]')}
-        data_deferred = json.loads(response.xpath('//script[@id="data-deferred-state"]/text()').get())
-        data_deferred['niobeMinimalClientData'][0][0] = json.loads(
+        data_deferred = ApiBase.decode_data(response.xpath('//script[@id="data-deferred-state"]/text()').get())
+        data_deferred['niobeMinimalClientData'][0][0] = ApiBase.decode_data(
             re.sub(r'^StaysSearch:', '', data_deferred['niobeMinimalClientData'][0][0]))
 
         explore_data = data_deferred['niobeMinimalClientData'][0][1]['data']['presentation']['explore']
         if 'sectionIndependentData' in explore_data['sections']:
             stays_search = explore_data['sections']['sectionIndependentData']['staysSearch']
-            remarketing_data = stays_search['loggingMetadata']['remarketingLoggingData']
-            listing_data = stays_search['searchResults']
+            listing_items = stays_search['searchResults']
+            has_next_page = bool((stays_search.get('paginationInfo') or {}).get('nextPageCursor'))
         else:
-            remarketing_data = self.__find_section(explore_data['sections']['sections'], 'EXPLORE_REMARKETING')
             listing_data_wrapper = self.__find_section(explore_data['sections']['sections'], 'EXPLORE_SECTION_WRAPPER')
-            listing_data = listing_data_wrapper['child']['section']
-
-        yield self.__explore_search.api_request(self.__query, {}, self.parse, response, headers)
+            listing_items = listing_data_wrapper['child']['section'].get('items') or []
+            has_next_page = True  # unknown here, the next API response will tell
+
+        if not listing_items:  # nothing embedded in page, request first page from API
+            for request in self.__frontier_searches(
+                    [self.__explore_search.api_request(self.__query, {}, self.parse, response, headers)]):
+                yield request
+            return
+
+        listing_ids = self.__get_listings_from_items(listing_items)
+        geography = self.__find_geography(data_deferred)
+        if geography:  # the first page of results is embedded in the landing page, request listings right away
+            self.__geography.update(geography)
+            for request in self.__listing_requests(listing_ids):
+                yield request
+        else:  # items need geography, request listings once the first API response has it
+            self.__landing_listing_ids = listing_ids
+
+        if has_next_page or not geography:
+            next_section = {'itemsOffset': len(listing_items) if has_next_page else 0}
+            for request in self.__frontier_searches(
+                    [self.__explore_search.api_request(self.__query, next_section, self.parse, response, headers)]):
+                yield request
 
     def parse(self, response, **kwargs):
         """Default parse method."""
-        self.logger.debug(f"Parsing {response.url}")
-        json_response = response.xpath('body/pre/text()').get()  # remove html wrapper
-        data = json.loads(json_response)
+        data = self.__explore_search.read_data(response)
+
+        # Collect geography, unless already known from the search landing page
+        metadata = data['data']['dora']['exploreV3']['metadata']
+        if not self.__geography:
+            self.__geography.update(metadata['geography'])
+
+        # request listings embedded in the landing page, held back until geography is known
+        if self.__landing_listing_ids:
+            listing_ids, self.__landing_listing_ids = self.__landing_listing_ids, None
+            yield from self.__listing_requests(listing_ids)
+
+        # Split searches that reach the result cap into concurrent sub-searches, instead of paginating them
+        sub_searches = []
+        if self.__search_planner:
+            search_params = {}
+            self.__explore_search.add_search_params(search_params, response)
+            sub_searches = self.__search_planner.split(search_params, metadata)
+            yield from self.__frontier_searches(
+                self.__explore_search.api_request(self.__query, sub_search_params, response=response)
+                for sub_search_params in sub_searches
+            )
 
         # Handle pagination
         next_section = {}
-        pagination = data['data']['dora']['exploreV3']['metadata']['paginationMetadata']
-        if pagination['hasNextPage']:
+        pagination = metadata['paginationMetadata']
+        if pagination['hasNextPage'] and not sub_searches:
             items_offset = pagination['itemsOffset']
             self.__explore_search.add_search_params(next_section, response)
             next_section.update({'itemsOffset': items_offset})
 
-            yield self.__explore_search.api_request(self.__query, next_section, response=response)
+            yield from self.__frontier_searches(
+                [self.__explore_search.api_request(self.__query, next_section, response=response)])
 
         # handle listings
-        params = {'key': self.__explore_search.api_key}
-        self.__explore_search.add_search_params(params, response)
         listing_ids = self.__get_listings_from_sections(data['data']['dora']['exploreV3']['sections'])
-        for listing_id in listing_ids:  # request each property page
-            if listing_id in self.__ids_seen:
-                continue  # filter duplicates
-
-            self.__ids_seen.add(listing_id)
-
-            yield self.__pdp_platform_sections.api_request(listing_id)
+        yield from self.__listing_requests(listing_ids)
+
+    async def __collect_session_cookies(self, response: HtmlResponse):
+        """Share cookies from the browser page with API requests, then close the page."""
+        page = response.meta['playwright_page']
+        self.__explore_search.session_cookies = [
+            {'name': c['name'], 'value': c['value'], 'domain': c['domain'], 'path': c['path']}
+            for c in await page.context.cookies()
+        ]
+        await page.close()
 
     @staticmethod
     def _get_neighborhoods(data):
@@ -197,31 +415,35 @@ class AirbnbSpider(scrapy.Spider):
 
     def _collect_listing_data(self, listing_item: dict):
         """Collect listing data from search results, save in _data_cache. All listing data is aggregated together in the
-        parse_listing_contents method."""
+        parse_listing_contents method.
+
+        Search results embedded in the landing page carry fewer listing fields than ExploreSearch results, so missing
+        fields are left empty.
+        """
         listing = listing_item['listing']
-        pricing = listing_item['pricingQuote'] or {}
+        pricing = listing_item.get('pricingQuote') or {}
 
         self.__data_cache[listing['id']] = {
             # get general data
-            'avg_rating':             listing['avgRating'],
-            'bathrooms':              listing['bathrooms'],
-            'bedrooms':               listing['bedrooms'],
-            'beds':                   listing['beds'],
-            'business_travel_ready':  listing['isBusinessTravelReady'],
-            'city':                   listing['city'],
-            'host_id':                listing['user']['id'],
-            'latitude':               listing['lat'],
-            'longitude':              listing['lng'],
-            'name':                   listing['name'],
-            'neighborhood_overview':  listing['neighborhoodOverview'],
-            'person_capacity':        listing['personCapacity'],
-            'photo_count':            listing['pictureCount'],
-            'photos':                 [p['picture'] for p in listing['contextualPictures']],
-            'review_count':           listing['reviewsCount'],
-            'room_and_property_type': listing['roomAndPropertyType'],
-            'room_type':              listing['roomType'],
-            'room_type_category':     listing['roomTypeCategory'],
-            'star_rating':            listing['starRating'],
+            'avg_rating':             listing.get('avgRating'),
+            'bathrooms':              listing.get('bathrooms'),
+            'bedrooms':               listing.get('bedrooms'),
+            'beds':                   listing.get('beds'),
+            'business_travel_ready':  listing.get('isBusinessTravelReady'),
+            'city':                   listing.get('city'),
+            'host_id':                (listing.get('user') or {}).get('id'),
+            'latitude':               listing.get('lat'),
+            'longitude':              listing.get('lng'),
+            'name':                   listing.get('name'),
+            'neighborhood_overview':  listing.get('neighborhoodOverview'),
+            'person_capacity':        listing.get('personCapacity'),
+            'photo_count':            listing.get('pictureCount'),
+            'photos':                 [p['picture'] for p in listing.get('contextualPictures') or []],
+            'review_count':           listing.get('reviewsCount'),
+            'room_and_property_type': listing.get('roomAndPropertyType'),
+            'room_type':              listing.get('roomType'),
+            'room_type_category':     listing.get('roomTypeCategory'),
+            'star_rating':            listing.get('starRating'),
 
             # get pricing data
             'monthly_price_factor':   pricing.get('monthlyPriceFactor'),
@@ -234,9 +456,93 @@ class AirbnbSpider(scrapy.Spider):
 
     def __create_index_if_not_exists(self):
         index_name = self.settings.get('ELASTICSEARCH_INDEX')
-        # index = Index(index_name)
-        # if not index.exists():
-        #     Listing.init(index_name)
+        client = Elasticsearch(self.settings.getlist('ELASTICSEARCH_SERVERS', ['http://localhost:9200']))
+        if not client.indices.exists(index=index_name):
+            self.logger.info(f'Creating Elasticsearch index: {index_name}')
+            client.indices.create(index=index_name, mappings=LISTING_MAPPING)
+
+    @staticmethod
+    def create_pdp_executor(settings) -> ProcessPoolExecutor | None:
+        """Create process pool for parsing listing pages, if PDP_PARSE_WORKERS is set."""
+        workers = settings.getint('PDP_PARSE_WORKERS')
+        if not workers:
+            return None
+
+        # spawn rather than fork, the reactor and browser threads must not be copied into workers
+        return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+
+    @staticmethod
+    def exports_any(settings, fields: tuple, formats: tuple = ()) -> bool:
+        """Return whether any feed exports any of the fields, by exporting them or all fields, or is in one of the
+        formats. Always true without feeds, as items may be for other pipelines, or with Elasticsearch, which indexes
+        all fields."""
+        feeds = settings.getdict('FEEDS')
+        if not feeds or 'deepbnb.pipelines.ElasticBnbPipeline' in settings.get('ITEM_PIPELINES'):
+            return True
+
+        for options in feeds.values():
+            exported = options.get('fields', settings.getlist('FEED_EXPORT_FIELDS') or None)
+            if not exported or set(fields) & set(exported) or options.get('format') in formats:
+                return True
+
+        return False
+
+    @staticmethod
+    def reviews_wanted(settings) -> bool:
+        """Return whether reviews are exported (Parquet exports them to a file of their own). REVIEWS_MAX = 0 turns
+        reviews off."""
+        if settings.get('REVIEWS_MAX') is not None and settings.getint('REVIEWS_MAX') == 0:
+            return False
+
+        return AirbnbSpider.exports_any(settings, ('reviews',), ('parquet',))
+
+    @staticmethod
+    def listing_pages_wanted(settings, listing_filter: ListingFilter | None) -> bool:
+        """Return whether listing pages are requested, per LISTING_PAGES: 'always', 'never', or 'auto' if fields only
+        found on listing pages are exported or filtered on. Otherwise, items are built from search results alone."""
+        mode = settings.get('LISTING_PAGES', 'auto')
+        if mode not in ('always', 'auto', 'never'):
+            raise ValueError(f"LISTING_PAGES must be 'always', 'auto' or 'never', not {mode!r}")
+
+        if mode != 'auto':
+            return mode == 'always'
+
+        if listing_filter and listing_filter.checks_any(PdpPlatformSections.listing_page_fields):
+            return True
+
+        return AirbnbSpider.exports_any(settings, PdpPlatformSections.listing_page_fields)
+
+    @staticmethod
+    def open_frontier(crawler: Crawler, survey: str) -> Frontier | None:
+        """Open crawl frontier shared with the other workers of a distributed crawl, if FRONTIER is set."""
+        if not crawler.settings.get('FRONTIER'):
+            return None
+
+        return Frontier.open(
+            crawler.settings.get('FRONTIER'),
+            survey,
+            crawler.settings.get('FRONTIER_WORKER') or f'{socket.gethostname()}-{os.getpid()}',
+            crawler.stats,
+            crawler.settings.getfloat('FRONTIER_LEASE_SECONDS', 600),
+            crawler.settings.getint('FRONTIER_MAX_ATTEMPTS', 3)
+        )
+
+    @staticmethod
+    def open_crawl_state(crawler: Crawler) -> CrawlState | None:
+        """Open crawl state database, if CRAWL_STATE_DB is set, and record scraped and dropped items in it."""
+        if not crawler.settings.get('CRAWL_STATE_DB'):
+            return None
+
+        # remember listings between crawls, to skip or deprioritize those unchanged since they were last scraped
+        crawl_state = CrawlState(
+            crawler.settings.get('CRAWL_STATE_DB'),
+            crawler.stats,
+            crawler.settings.getfloat('CRAWL_STATE_MAX_AGE', 7)
+        )
+        crawler.signals.connect(crawl_state.record_item, signal=signals.item_scraped)
+        crawler.signals.connect(crawl_state.record_item, signal=signals.item_dropped)
+
+        return crawl_state
 
     def __get_listings_from_sections(self, sections: list) -> list:
         """Get listings from "sections" (i.e. search results page sections).
@@ -246,29 +552,229 @@ class AirbnbSpider(scrapy.Spider):
         """
         listing_ids = []
         for section in [s for s in sections if s['sectionComponentType'] == 'listings_ListingsGrid_Explore']:
-            for listing_item in section.get('items'):
-                pricing = listing_item['pricingQuote']
-                if pricing:
-                    rate_with_service_fee = pricing['rateWithServiceFee']
-                    if rate_with_service_fee is None:  # some properties need dates to show rates
-                        rate_with_service_fee_amt = 0
-                        pricing['rateWithServiceFee'] = {'amount': None}
-                    else:
-                        rate_with_service_fee_amt = rate_with_service_fee['amount']
-
-                    # To account for results where price_max was specified as monthly but quoted rate is nightly, calculate
-                    # monthly rate and drop listing if it is greater. Use 28 days = 1 month. Assume price_max of 1000+ is a
-                    # monthly price requirement.
-                    if (self.__price_max and self.__price_max > 1000
-                            and pricing['structuredStayDisplayPrice']['primaryLine']['qualifier'] != 'month'
-                            and (rate_with_service_fee_amt * 28) > self.__price_max):
-                        continue
-
-                self._collect_listing_data(listing_item)
-                listing_ids.append(listing_item['listing']['id'])
+            listing_ids.extend(self.__get_listings_from_items(section.get('items')))
 
         return listing_ids
 
+    def __get_listings_from_items(self, listing_items: list) -> list:
+        """Get listings from a list of search result items, collecting data for each along the way."""
+        listing_ids = []
+        for listing_item in listing_items:
+            pricing = listing_item.get('pricingQuote')
+            if pricing:
+                rate_with_service_fee = pricing.get('rateWithServiceFee')
+                if rate_with_service_fee is None:  # some properties need dates to show rates
+                    rate_with_service_fee_amt = 0
+                    pricing['rateWithServiceFee'] = {'amount': None}
+                else:
+                    rate_with_service_fee_amt = rate_with_service_fee['amount']
+
+                # To account for results where price_max was specified as monthly but quoted rate is nightly, calculate
+                # monthly rate and drop listing if it is greater. Use 28 days = 1 month. Assume price_max of 1000+ is a
+                # monthly price requirement.
+                if (self.__price_max and self.__price_max > 1000
+                        and pricing['structuredStayDisplayPrice']['primaryLine']['qualifier'] != 'month'
+                        and (rate_with_service_fee_amt * 28) > self.__price_max):
+                    continue
+
+            self._collect_listing_data(listing_item)
+            listing_ids.append(listing_item['listing']['id'])
+
+        return listing_ids
+
+    def __listing_requests(self, listing_ids: list):
+        """Generate a request for each listing page not seen before, unless search data already rules listing out, or
+        crawl state shows the listing is unchanged since last scraped. In a distributed crawl, listings not seen by any
+        worker before are pushed to the frontier instead."""
+        for listing_id in listing_ids:
+            seen_id = int(listing_id) if listing_id.isdigit() else listing_id  # int takes less memory than str
+            if seen_id in self.__ids_seen:
+                continue  # filter duplicates
+
+            self.__ids_seen.add(seen_id)
+
+            if self.__frontier and not self.__frontier.claim(f'listing/{listing_id}'):
+                del self.__data_cache[listing_id]
+                continue  # found by another worker
+
+            if self.__listing_filter:
+                rejection = self.__listing_filter.check_search_data(listing_id, self.__data_cache[listing_id])
+                if rejection:
+                    filter_name, reason = rejection
+                    self.logger.debug(f'Skipping listing {listing_id}: {reason}')
+                    self.__stats.inc_value('prefilter/pdp_requests_avoided')
+                    self.__stats.inc_value(f'prefilter/rejected/{filter_name}')
+                    del self.__data_cache[listing_id]
+                    continue
+
+            priority = 0
+            state_key = CrawlState.key(listing_id, self.__survey)
+            if self.__crawl_state and self.__crawl_state.is_unchanged(state_key, self.__data_cache[listing_id]):
+                if self.settings.get('CRAWL_STATE_UNCHANGED', 'skip') == 'skip':
+                    self.logger.debug(f'Skipping listing {listing_id}: unchanged since last scraped')
+                    self.__stats.inc_value('state/pdp_requests_avoided')
+                    del self.__data_cache[listing_id]
+                    continue
+
+                priority = -1  # fetch after new and changed listings
+
+            if self.__frontier and self.__listing_pages:  # items from search results are built by the claiming worker
+                self.__frontier.push(f'listing/{listing_id}', 'listing', self._listing_task(listing_id, priority))
+                del self.__data_cache[listing_id]  # held by the frontier, until a worker leases the listing
+                continue
+
+            if self.__search_hits is not None:
+                self.__search_hits[listing_id] = time.time()
+
+            yield from self.__listing_task_requests(listing_id, priority)
+
+        if self.__frontier:
+            self.__lease_tasks()
+
+    def _listing_task(self, listing_id: str, priority: int = 0) -> dict:
+        """Return task of listing found in search results, for another worker or reparse process to request it."""
+        return {
+            'id':        listing_id,
+            'data':      self.__data_cache[listing_id],
+            'geography': self.__geography,
+            'priority':  priority,
+            'found':     time.time(),
+        }
+
+    def __listing_task_requests(self, listing_id: str, priority: int = 0):
+        """Generate request for listing: its availability calendar if checking calendars, its page otherwise. Without
+        listing pages, generate its item."""
+        if self.__availability_calendar:
+            requests = [self.__listing_request(self.__availability_calendar.api_request(listing_id), listing_id)]
+        else:
+            requests = self.__pdp_requests(listing_id)
+
+        for request in requests:
+            yield request.replace(priority=priority) if priority and isinstance(request, scrapy.Request) else request
+
+    def __listing_request(self, request: scrapy.Request, listing_id: str) -> scrapy.Request:
+        """Tag request for listing page or calendar with its listing and survey, and fail the listing if the request
+        fails."""
+        request.meta['listing_id'] = listing_id
+        request.meta['survey'] = self.__survey
+        return request.replace(errback=self.__listing_failed)
+
+    def __frontier_searches(self, requests):
+        """Pass search requests through, or push them to the frontier in a distributed crawl, for any worker to lease.
+        Workers searching the same pages push them once."""
+        for request in requests:
+            if not self.__frontier:
+                yield request
+                continue
+
+            params = ExploreSearch.get_request_params(request.url)
+            callback = request.callback.__name__  # parse, or ExploreSearch.parse_landing_page
+            key = f'search/{callback}/{json.dumps(params, sort_keys=True)}'
+            self.__frontier.push(key, 'search', {'params': params, 'callback': callback})
+
+        if self.__frontier:
+            self.__lease_tasks()
+
+    def __lease_tasks(self) -> int:
+        """Schedule tasks leased from the frontier, up to FRONTIER_BATCH tasks in progress. Return number leased."""
+        count = self.settings.getint('FRONTIER_BATCH', self.settings.getint('CONCURRENT_REQUESTS'))
+        count -= len(self.__tasks_in_progress)
+        if count <= 0:
+            return 0
+
+        tasks = self.__frontier.lease(count)
+        for key, kind, payload in tasks:
+            self.__tasks_in_progress.add(key)
+            for request in self._task_requests(kind, payload):
+                request.meta['frontier_task'] = key
+                self.crawler.engine.crawl(request)
+
+        return len(tasks)
+
+    def __frontier_idle(self):
+        """Lease more tasks once idle. Keep spider open while other workers may push tasks, or their leases expire."""
+        if self.__lease_tasks() or self.__frontier.pending():
+            raise DontCloseSpider
+
+    def __task_left_downloader(self, request, spider):
+        """Lease more tasks once half of those in progress are downloaded."""
+        key = request.meta.get('frontier_task')
+        if key in self.__tasks_in_progress:
+            self.__tasks_in_progress.discard(key)
+            batch = self.settings.getint('FRONTIER_BATCH', self.settings.getint('CONCURRENT_REQUESTS'))
+            if len(self.__tasks_in_progress) <= batch // 2:
+                self.__lease_tasks()
+
+    def _task_requests(self, kind: str, payload: dict):
+        """Generate requests for a task leased from the frontier, or handed to a reparse process."""
+        if kind == 'search':
+            callback = self.parse if payload['callback'] == 'parse' else self.__explore_search.parse_landing_page
+            yield self.__explore_search.api_request(self.__query, payload['params'], callback)
+            return
+
+        listing_id = payload['id']
+        if not self.__geography:
+            self.__geography.update(payload['geography'])
+
+        self.__data_cache[listing_id] = payload['data']
+        if self.__search_hits is not None:  # found by whichever worker pushed the task
+            self.__search_hits[listing_id] = payload.get('found', time.time())
+
+        yield from self.__listing_task_requests(listing_id, payload['priority'])
+
+    def __complete_task(self, response, request, spider):
+        """Complete search task once its response is received. Failed tasks are left to be leased again."""
+        key = request.meta.get('frontier_task')
+        if key and key.startswith('search/') and response.status < 400:
+            self.__frontier.complete(key)
+
+    def item_scraped(self, item):
+        """Complete the item's listing, and record time from search hit to item. The batch spider calls this too."""
+        found = self.__listing_done(item['id'])
+        if found:
+            observe(self.__stats, 'timing/search_to_item', time.time() - found)
+
+    def item_dropped(self, item):
+        self.__listing_done(item['id'])
+
+    def __listing_failed(self, failure):
+        """Give up on listing once its page or calendar request fails, after retries."""
+        listing_id = failure.request.meta['listing_id']
+        self.logger.error(f'Failed to get listing {listing_id}: {failure.value!r}')
+        self.__stats.inc_value('listing/failed')
+        self.__forget_listing_data(listing_id)
+        self.__listing_done(listing_id)
+
+    def __listing_error(self, failure, response, spider):
+        """Give up on listing once parsing its page or calendar raises. In a batch crawl, `spider` is the batch spider,
+        so each survey handles the listings of its own survey."""
+        listing_id = response.meta.get('listing_id')
+        if listing_id and response.meta.get('survey') == self.__survey:
+            self.__stats.inc_value('listing/failed')
+            self.__forget_listing_data(listing_id)
+            self.__listing_done(listing_id)
+
+    def __forget_listing_data(self, listing_id: str):
+        """Evict search data of a failed listing from the data cache, or its spill file, as building its item would."""
+        if listing_id in self.__data_cache:
+            del self.__data_cache[listing_id]
+
+    def __listing_done(self, listing_id: str) -> float | None:
+        """Complete listing task once its item is scraped or dropped, it's not available for any dates, or it failed.
+        Return time the listing was found in search results, if instrumented."""
+        if self.__frontier and self.__listing_pages:
+            self.__frontier.complete(f'listing/{listing_id}')
+
+        if self.__search_hits is not None:
+            return self.__search_hits.pop(listing_id, None)
+
+    def __pdp_requests(self, listing_id: str):
+        """Generate request for listing page, or item built from search results if listing pages aren't wanted."""
+        if self.__listing_pages:
+            yield self.__listing_request(self.__pdp_platform_sections.api_request(listing_id), listing_id)
+        else:
+            yield from self.__pdp_platform_sections.search_result_item(listing_id)
+
     @staticmethod
     def __get_search_headers() -> dict:
         return {
@@ -324,6 +830,24 @@ class AirbnbSpider(scrapy.Spider):
 
         return int(amount_match[1].replace(',', ''))
 
+    @staticmethod
+    def __find_geography(data):
+        """Find search metadata geography in landing page data, wherever the page embeds it. None if not found."""
+        if isinstance(data, dict):
+            metadata = data.get('metadata')
+            if isinstance(metadata, dict) and metadata.get('geography'):
+                return metadata['geography']
+            data = data.values()
+        elif not isinstance(data, list):
+            return None
+
+        for value in data:
+            geography = AirbnbSpider.__find_geography(value)
+            if geography:
+                return geography
+
+        return None
+
     @staticmethod
     def __find_section(sections: list, section_type: str):
         result = [i for i in sections if i.get('sectionComponentType') == section_type]
@@ -352,16 +876,20 @@ class AirbnbSpider(scrapy.Spider):
             checkout_range_spec = self.__checkout[checkout_plus_range_position:]
             self.__checkout = self.__checkout[:checkout_plus_range_position]
 
-        # Validate checkin / checkout values
-        today = date.today()
-        if date.fromisoformat(self.__checkin) < today:
-            raise ValueError('Checkin cannot be in past: {}'.format(self.__checkin))
-        tomorrow = today + timedelta(days=1)
-        if date.fromisoformat(self.__checkout) < tomorrow:
-            raise ValueError('Checkout must be tomorrow or later: {}'.format(self.__checkout))
+        self._validate_dates(self.__checkin, self.__checkout)
 
         return self.__checkin, self.__checkout, checkin_range_spec, checkout_range_spec
 
+    @staticmethod
+    def _validate_dates(checkin: str, checkout: str):
+        """Validate checkin / checkout values."""
+        today = date.today()
+        if date.fromisoformat(checkin) < today:
+            raise ValueError('Checkin cannot be in past: {}'.format(checkin))
+        tomorrow = today + timedelta(days=1)
+        if date.fromisoformat(checkout) < tomorrow:
+            raise ValueError('Checkout must be tomorrow or later: {}'.format(checkout))
+
     def __set_price_params(self, price_max, price_min):
         """Set price parameters based on price_max and price_min input values."""
         self.__price_max = price_max
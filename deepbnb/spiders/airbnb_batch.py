@@ -0,0 +1,208 @@
+import csv
+import json
+import re
+import scrapy
+import time
+
+from collections import deque
+from scrapy import signals
+from scrapy.exceptions import DropItem
+from scrapy.extensions.feedexport import FeedExporter, ItemFilter
+from scrapy.statscollectors import StatsCollector
+
+from deepbnb.spiders.airbnb import AirbnbSpider
+
+
+class AirbnbBatchSpider(scrapy.Spider):
+    """Airbnb Batch Spider
+
+    Run several surveys in one crawl, concurrently, sharing one process, browser and HTTP session. Each survey is an
+    `AirbnbSpider`, with its own geography, listing data cache and duplicate checks, run for one entry of the `queries`
+    file. Items are tagged with the name of their survey, and stats are kept per survey under `batch/<survey>/`.
+
+    The queries file holds one survey per line (.jsonl), or per row (.csv), with the `airbnb` spider arguments as
+    keys / columns, and an optional `name` (default: `query`). Other spider arguments are defaults for all surveys.
+    With a `%(survey)s` placeholder in an output file name, each survey is written to a file of its own.
+    """
+
+    name = 'airbnb_batch'
+    allowed_domains = AirbnbSpider.allowed_domains
+    survey_args = (
+        'query', 'checkin', 'checkout', 'currency', 'max_price', 'min_price', 'ne_lat', 'ne_lng', 'sw_lat', 'sw_lng'
+    )
+
+    def __init__(self, queries: str, **kwargs):
+        """Class constructor."""
+        defaults = {k: kwargs.pop(k) for k in self.survey_args if k in kwargs}
+        super().__init__(**kwargs)
+        self.__crawl_state = None
+        self.__item_times = {}
+        self.__pdp_executor = None
+        self.__start_time = None
+        self.__surveys = {}
+
+        for survey_args in self.read_queries(queries):
+            survey_args = defaults | survey_args
+            name = survey_args.pop('name', None) or survey_args.get('query')
+            if not survey_args.get('query'):
+                raise ValueError(f'No query for survey in {queries}: {survey_args}')
+            if name in self.__surveys:
+                raise ValueError(f'Duplicate survey {name!r} in {queries}, give surveys distinct names')
+            self.__surveys[name] = AirbnbSpider(**survey_args)
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(spider.item_dropped, signal=signals.item_dropped)
+
+        return spider
+
+    @classmethod
+    def update_settings(cls, settings):
+        """Export feeds with a `%(survey)s` placeholder in their URI through SurveyFeedExporter. Survey names are only
+        known once the spider reads its queries file, after settings are frozen, so the exporter partitions them."""
+        super().update_settings(settings)
+        if not any('%(survey)s' in str(uri) for uri in settings.getdict('FEEDS')):
+            return
+
+        priority = settings.getdict('EXTENSIONS_BASE').get('scrapy.extensions.feedexport.FeedExporter', 0)
+        settings.set('EXTENSIONS', settings.getdict('EXTENSIONS') | {
+            'scrapy.extensions.feedexport.FeedExporter':      None,
+            'deepbnb.spiders.airbnb_batch.SurveyFeedExporter': priority,
+        }, priority=settings.getpriority('EXTENSIONS'))
+
+    @property
+    def surveys(self) -> list:
+        return list(self.__surveys)
+
+    @classmethod
+    def read_queries(cls, path: str) -> list:
+        """Read survey arguments from a .jsonl or .csv file. Values are strings, as given with -a."""
+        with open(path, newline='', encoding='utf-8') as f:
+            if path.endswith('.csv'):
+                rows = list(csv.DictReader(f))
+            else:
+                rows = [json.loads(line) for line in f if line.strip()]
+
+        surveys = []
+        for row in rows:
+            unknown = set(row) - set(cls.survey_args) - {'name'}
+            if unknown:
+                raise ValueError(f'Unknown survey arguments in {path}: {", ".join(sorted(unknown))}')
+            surveys.append({k: str(v) for k, v in row.items() if v not in (None, '')})
+
+        return surveys
+
+    def start_requests(self):
+        """Start all surveys, taking start requests from each in turn."""
+        self.logger.info(f'starting batch of {len(self.__surveys)} surveys')
+        self.__start_time = time.time()
+        self.__crawl_state = AirbnbSpider.open_crawl_state(self.crawler)
+        self.__pdp_executor = AirbnbSpider.create_pdp_executor(self.settings)
+
+        start_requests = deque()
+        for name, survey in self.__surveys.items():
+            survey.crawler = self.crawler
+            survey.settings = self.settings
+            survey.join_batch(name, SurveyStats(self.crawler.stats, f'batch/{name}/'), self.__crawl_state,
+                              self.__pdp_executor)
+            start_requests.append(survey.start_requests())
+
+        while start_requests:
+            requests = start_requests.popleft()
+            request = next(requests, None)
+            if request is not None:
+                start_requests.append(requests)
+                yield request
+
+    def parse(self, response, **kwargs):
+        """Not used, survey requests have callbacks of their own."""
+        pass
+
+    def item_scraped(self, item):
+        survey = item.get('survey')
+        self.crawler.stats.inc_value(f'batch/{survey}/item_scraped_count')
+        self.__item_times[survey] = time.time()
+        if survey in self.__surveys:
+            self.__surveys[survey].item_scraped(item)
+
+    def item_dropped(self, item, exception: DropItem):
+        survey = item.get('survey')
+        self.crawler.stats.inc_value(f'batch/{survey}/item_dropped_count')
+        if survey in self.__surveys:
+            self.__surveys[survey].item_dropped(item)
+
+    def closed(self, reason):
+        """Close surveys, then report throughput per survey, from the start of the batch to its last item."""
+        for name, survey in self.__surveys.items():
+            survey.closed(reason)
+            stats = self.crawler.stats
+            stats.set_value(f'batch/{name}/listings_found', survey.listings_found)
+            items = stats.get_value(f'batch/{name}/item_scraped_count', 0)
+            if items and self.__start_time:
+                minutes = (self.__item_times[name] - self.__start_time) / 60
+                stats.set_value(f'batch/{name}/items_per_minute', round(items / minutes, 1) if minutes else None)
+
+        if self.__crawl_state:
+            self.__crawl_state.close()
+
+        if self.__pdp_executor:
+            self.__pdp_executor.shutdown(cancel_futures=True)
+
+
+class SurveyStats:
+    """Stats of one survey in a batch. Counts and maxima go to both the crawl's stats and stats under `prefix`, values
+    set only under `prefix`."""
+
+    def __init__(self, stats: StatsCollector, prefix: str):
+        self.__prefix = prefix
+        self.__stats = stats
+
+    def get_value(self, key: str, default=None):
+        return self.__stats.get_value(self.__prefix + key, default)
+
+    def set_value(self, key: str, value):
+        self.__stats.set_value(self.__prefix + key, value)
+
+    def inc_value(self, key: str, count: int = 1, start: int = 0):
+        self.__stats.inc_value(key, count, start)
+        self.__stats.inc_value(self.__prefix + key, count, start)
+
+    def max_value(self, key: str, value):
+        self.__stats.max_value(key, value)
+        self.__stats.max_value(self.__prefix + key, value)
+
+    def min_value(self, key: str, value):
+        self.__stats.min_value(key, value)
+        self.__stats.min_value(self.__prefix + key, value)
+
+
+class SurveyItemFilter(ItemFilter):
+    """Feed item filter accepting the items of one batch survey, given by the `survey` feed option."""
+
+    def accepts(self, item) -> bool:
+        return item.get('survey') == self.feed_options['survey']
+
+
+class SurveyFeedExporter(FeedExporter):
+    """Feed exporter replacing each feed with a `%(survey)s` placeholder in its URI by one feed per batch survey."""
+
+    def open_spider(self, spider):
+        if isinstance(spider, AirbnbBatchSpider):
+            self.partition_feeds(spider.surveys)
+
+        return super().open_spider(spider)
+
+    def partition_feeds(self, surveys: list):
+        for uri, options in list(self.feeds.items()):
+            if '%(survey)s' not in uri:
+                continue
+
+            del self.feeds[uri]
+            del self.filters[uri]
+            for name in surveys:
+                slug = re.sub(r'[^\w.-]+', '_', name).strip('_')
+                survey_uri = uri.replace('%(survey)s', slug)
+                self.feeds[survey_uri] = dict(options, survey=name)
+                self.filters[survey_uri] = SurveyItemFilter(self.feeds[survey_uri])
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+from scrapy.statscollectors import StatsCollector
+
+
+class CrawlState:
+    """Listing state kept between crawls in a SQLite database, so repeat surveys only fetch new or changed listings.
+
+    For each listing, the database holds a fingerprint of its search result data, when its item was last scraped, and
+    the date of its newest review. A listing is unchanged if its search result data has the same fingerprint as when it
+    was last scraped, less than `max_age` days ago. Surveys of a batch crawl keep separate state (see `key`).
+    """
+
+    commit_every = 500
+
+    def __init__(self, path: str, stats: StatsCollector, max_age: float = 7):
+        """Class constructor.
+
+        :param path: SQLite database file, created if it doesn't exist
+        :param max_age: days after which unchanged listings are considered stale, and fetched again
+        """
+        self.__connection = sqlite3.connect(path)
+        self.__connection.execute(
+            'CREATE TABLE IF NOT EXISTS listing ('
+            'id TEXT PRIMARY KEY, fingerprint TEXT, last_scraped REAL, newest_review TEXT)'
+        )
+        self.__max_age = max_age * 86400
+        self.__stats = stats
+        self.__uncommitted = 0
+
+    @staticmethod
+    def key(listing_id: str, survey: str = None) -> str:
+        """Database key of a listing, in a batch survey if given."""
+        return f'{survey}/{listing_id}' if survey else listing_id
+
+    @staticmethod
+    def fingerprint(listing_data: dict) -> str:
+        return hashlib.sha1(json.dumps(listing_data, sort_keys=True, default=str).encode()).hexdigest()
+
+    def is_unchanged(self, listing_id: str, listing_data: dict) -> bool:
+        """Check whether listing is unchanged since last scraped. If not, remember its new fingerprint."""
+        fingerprint = self.fingerprint(listing_data)
+        row = self.__connection.execute(
+            'SELECT fingerprint, last_scraped FROM listing WHERE id = ?', (listing_id,)).fetchone()
+
+        if row and row[0] == fingerprint:
+            if row[1] is not None and time.time() - row[1] < self.__max_age:
+                self.__stats.inc_value('state/unchanged')
+                return True
+
+            self.__stats.inc_value('state/stale')
+            return False
+
+        # not scraped with this fingerprint yet, so forget when the listing was last scraped until it is again
+        self.__stats.inc_value('state/changed' if row else 'state/new')
+        self.__write(
+            'INSERT INTO listing (id, fingerprint) VALUES (?, ?) '
+            'ON CONFLICT (id) DO UPDATE SET fingerprint = excluded.fingerprint, last_scraped = NULL',
+            (listing_id, fingerprint)
+        )
+
+        return False
+
+    def newest_review(self, listing_id: str) -> str | None:
+        """Return creation date of the newest review seen for listing, if any."""
+        row = self.__connection.execute('SELECT newest_review FROM listing WHERE id = ?', (listing_id,)).fetchone()
+
+        return row[0] if row else None
+
+    def record_item(self, item):
+        """Record scraped item. Connected to the item_scraped and item_dropped signals: listings the pipelines drop
+        are unchanged until their search result data changes too. Their reviews, not fetched, are left as they were."""
+        newest_review = max((r['created_at'] for r in item.get('reviews') or []), default=None)
+        self.__write(
+            'INSERT INTO listing (id, last_scraped, newest_review) VALUES (?, ?, ?) '
+            'ON CONFLICT (id) DO UPDATE SET last_scraped = excluded.last_scraped, '
+            "newest_review = nullif(max(coalesce(newest_review, ''), coalesce(excluded.newest_review, '')), '')",
+            (self.key(item['id'], item.get('survey')), time.time(), newest_review)
+        )
+
+    def close(self):
+        self.__connection.commit()
+        self.__connection.close()
+
+    def __write(self, sql: str, parameters: tuple):
+        """Execute statement, committing every `commit_every` writes."""
+        self.__connection.execute(sql, parameters)
+        self.__uncommitted += 1
+        if self.__uncommitted >= self.commit_every:
+            self.__connection.commit()
+            self.__uncommitted = 0
@@ -0,0 +1,136 @@
+import json
+import sqlite3
+
+from deepbnb.amenities import AmenityBits, AmenityFilter
+from deepbnb.filters import TextRule, field_text
+
+
+class TextIndex:
+    """Local full-text index of scraped items in a SQLite database, to filter a crawl again without crawling again.
+
+    Items are stored whole, and their text fields in an FTS5 table with the trigram tokenizer, folded as by the item
+    text filters, so a keyword found by a filter is found by a trigram query too. Amenity ids are stored as bitsets,
+    mapped by the index's own amenity bit mapping. `items` narrows items down with index queries for the keyword rules
+    of the filters, and a batch check of amenity bitsets, and returns the rest for the filters to check exactly.
+    """
+
+    commit_every = 500
+    fields = ('description', 'name', 'neighborhood_overview', 'transit', 'interaction', 'house_rules', 'reviews')
+
+    def __init__(self, path: str, known_amenity_ids=()):
+        """Class constructor.
+
+        :param path: SQLite database file, created if it doesn't exist
+        :param known_amenity_ids: amenity ids given the lowest bits of amenity bitsets, e.g. PROPERTY_AMENITIES ids, if
+            the database is created. Otherwise, the database's mapping is used.
+        """
+        self.__connection = sqlite3.connect(path)
+        self.__connection.execute('PRAGMA journal_mode = WAL')  # may be read while the crawl adds items
+        self.__connection.execute(
+            'CREATE TABLE IF NOT EXISTS item (key TEXT UNIQUE, survey TEXT, data TEXT)')
+        self.__connection.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS item_text USING fts5({", ".join(self.fields)}, tokenize = trigram)')
+        self.__connection.execute(
+            'CREATE TABLE IF NOT EXISTS amenity_bit (amenity_id INTEGER PRIMARY KEY, bit INTEGER)')
+        self.__connection.execute('CREATE TABLE IF NOT EXISTS item_amenities (rowid INTEGER PRIMARY KEY, bitset BLOB)')
+        self.__amenity_bits = AmenityBits.load(
+            self.__connection.execute('SELECT amenity_id, bit FROM amenity_bit ORDER BY bit'))
+        self.__stored_bits = len(self.__amenity_bits.bits)  # bits are mapped in order, those below this are stored
+        if not self.__amenity_bits.bits and known_amenity_ids and not self.count():
+            self.__amenity_bits = AmenityBits(known_amenity_ids)
+            self.__store_amenity_bits()
+        self.__uncommitted = 0
+
+    def add(self, item):
+        """Add item, or replace the item of the same listing and survey."""
+        survey = item.get('survey')
+        key = f'{survey}/{item["id"]}' if survey else item['id']
+        rowid = self.__connection.execute(
+            'INSERT INTO item (key, survey, data) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET data = excluded.data RETURNING rowid',
+            (key, survey, json.dumps(dict(item), default=str))
+        ).fetchone()[0]
+        self.__connection.execute('DELETE FROM item_text WHERE rowid = ?', (rowid,))
+        self.__connection.execute(
+            f'INSERT INTO item_text (rowid, {", ".join(self.fields)}) VALUES (?{", ?" * len(self.fields)})',
+            (rowid, *(field_text(item, f) for f in self.fields))
+        )
+
+        bitset = self.__amenity_bits.bitset(item.get('amenity_ids') or ())
+        self.__store_amenity_bits()
+        self.__connection.execute(
+            'INSERT OR REPLACE INTO item_amenities (rowid, bitset) VALUES (?, ?)',
+            (rowid, AmenityBits.to_bytes(bitset))
+        )
+
+        self.__uncommitted += 1
+        if self.__uncommitted >= self.commit_every:
+            self.__connection.commit()
+            self.__uncommitted = 0
+
+    def items(self, text_rules: list = (), survey: str = None, amenity_filter: AmenityFilter = None):
+        """Generate items, of a survey if given, which may pass the text rules and pass the amenity filter. Rules
+        checking only indexed fields for keywords of 3 or more characters exclude the items they're sure to reject;
+        items are to be checked exactly.
+        """
+        sql = 'SELECT data FROM item WHERE 1'
+        parameters = []
+        if survey:
+            sql += ' AND survey = ?'
+            parameters.append(survey)
+
+        for rule in text_rules:
+            query = self.match_query(rule)
+            if query:
+                sql += f' AND rowid {"NOT IN" if rule.cannot_have else "IN"} ' \
+                       '(SELECT rowid FROM item_text WHERE item_text MATCH ?)'
+                parameters.append(query)
+
+        if amenity_filter:
+            masks = amenity_filter.masks(self.__amenity_bits)
+            if masks:
+                sql = sql.replace('SELECT data', 'SELECT rowid', 1)
+                rowids = self.__select_amenities(sql, parameters, masks, amenity_filter)
+                sql = 'SELECT data FROM item WHERE rowid IN (SELECT value FROM json_each(?))'
+                parameters = [json.dumps(rowids)]
+
+        for data, in self.__connection.execute(sql, parameters):
+            yield json.loads(data)
+
+    def __select_amenities(self, sql: str, parameters: list, masks: dict, amenity_filter: AmenityFilter) -> list:
+        """Return rowids of items selected by SQL query whose amenity bitsets pass the filter masks."""
+        rows = self.__connection.execute(
+            'SELECT item.rowid, bitset FROM item LEFT JOIN item_amenities ON item_amenities.rowid = item.rowid '
+            f'WHERE item.rowid IN ({sql})',
+            parameters
+        ).fetchall()
+        columns = {
+            word: b''.join((bitset or b'')[8 * word:8 * word + 8].ljust(8, b'\0') for _, bitset in rows)
+            for word in masks
+        }
+        keep = amenity_filter.select(masks, columns, len(rows))
+
+        return [row[0] for row, passed in zip(rows, keep) if passed]
+
+    def match_query(self, rule: TextRule) -> str | None:
+        """Return FTS5 query for items containing any keyword of rule in its fields, or None if the index can't tell."""
+        if not rule.keywords or any(len(k) < 3 for k in rule.keywords) or not set(rule.fields) <= set(self.fields):
+            return None  # trigrams can't find shorter keywords
+
+        keywords = ' OR '.join('"{}"'.format(k.replace('"', '""')) for k in rule.keywords)
+
+        return f'{{{" ".join(rule.fields)}}}: ({keywords})'
+
+    def count(self) -> int:
+        return self.__connection.execute('SELECT count(*) FROM item').fetchone()[0]
+
+    def close(self):
+        self.__connection.commit()
+        self.__connection.close()
+
+    def __store_amenity_bits(self):
+        """Store amenity bits mapped since last stored, as ids are mapped in turn to the next free bit."""
+        new_bits = list(self.__amenity_bits.bits.items())[self.__stored_bits:]
+        if new_bits:
+            self.__connection.executemany('INSERT INTO amenity_bit (amenity_id, bit) VALUES (?, ?)', new_bits)
+            self.__stored_bits += len(new_bits)
@@ -0,0 +1,13 @@
+import shutil
+
+import pytest
+
+from pathlib import Path
+
+
+@pytest.fixture
+def project_settings(tmp_path, monkeypatch):
+    """Use the shipped settings.py.dist as project settings, as a fresh checkout would after copying it."""
+    shutil.copy(Path(__file__).parent.parent / 'deepbnb' / 'settings.py.dist', tmp_path / 'dist_settings.py')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setenv('SCRAPY_SETTINGS_MODULE', 'dist_settings')
@@ -0,0 +1,67 @@
+import json
+
+from scrapy import Request, signals
+from scrapy.crawler import CrawlerProcess
+from scrapy.http import TextResponse
+from scrapy.utils.test import get_crawler
+from twisted.python.failure import Failure
+
+from benchmarks.stub_server import explore_search_payload
+from deepbnb.api.ExploreSearch import ExploreSearch
+from deepbnb.items import DeepbnbItem
+from deepbnb.spiders.airbnb_batch import AirbnbBatchSpider
+
+
+class OfflineBatchSpider(AirbnbBatchSpider):
+    """Batch spider scraping one item per survey, without requests."""
+
+    name = 'airbnb_batch_offline'
+
+    def start_requests(self):
+        for i, survey in enumerate(self.surveys):
+            item = DeepbnbItem(id=str(i), name=f'listing in {survey}', survey=survey)
+            self.crawler.signals.send_catch_log(signals.item_scraped, item=item, response=None, spider=self)
+
+        yield from ()
+
+
+def test_survey_feeds(tmp_path):
+    queries = tmp_path / 'surveys.jsonl'
+    queries.write_text('{"query": "Madrid, Spain"}\n{"query": "Lisbon, Portugal", "name": "lisbon"}\n')
+    process = CrawlerProcess({
+        'FEEDS':                 {str(tmp_path / 'output' / '%(survey)s.jl'): {'format': 'jsonlines'}},
+        'LOG_LEVEL':             'WARNING',
+        'TELNETCONSOLE_ENABLED': False,
+    })
+    crawler = process.create_crawler(OfflineBatchSpider)
+    process.crawl(crawler, queries=str(queries))
+    process.start()
+
+    assert crawler.stats.get_value('item_scraped_count') == 2
+    assert sorted(p.name for p in (tmp_path / 'output').iterdir()) == ['Madrid_Spain.jl', 'lisbon.jl']
+    for file, survey in (('Madrid_Spain.jl', 'Madrid, Spain'), ('lisbon.jl', 'lisbon')):
+        items = [json.loads(line) for line in (tmp_path / 'output' / file).read_text().splitlines()]
+        assert [item['survey'] for item in items] == [survey]
+
+
+def test_survey_evicts_listing_data_when_parse_fails(tmp_path):
+    queries = tmp_path / 'surveys.jsonl'
+    queries.write_text('{"query": "Springfield"}\n{"query": "Shelbyville"}\n')
+    crawler = get_crawler(AirbnbBatchSpider, {'TWISTED_REACTOR': None})
+    spider = AirbnbBatchSpider.from_crawler(crawler, queries=str(queries))
+    crawler.spider = spider
+    survey = next(iter(spider.start_requests())).callback.__self__  # survey spider loading its landing page
+
+    url = ExploreSearch('key', None, 'USD', None, None, {}, 'Springfield')._get_url('Springfield')
+    body = json.dumps(explore_search_payload(['1', '2'], 0, False, 0)).encode()
+    search = TextResponse(url, body=body, request=Request(url))
+    listing_requests = [r for r in survey.parse(search) if 'listing_id' in r.meta]
+    assert [r.meta['listing_id'] for r in listing_requests] == ['1', '2']
+
+    response = TextResponse(listing_requests[0].url, body=b'{}', request=listing_requests[0])
+    crawler.signals.send_catch_log(signals.spider_error, failure=Failure(KeyError('data')), response=response,
+                                   spider=spider)
+
+    assert crawler.stats.get_value('batch/Springfield/listing_cache/evictions') == 1
+    assert crawler.stats.get_value('batch/Springfield/listing/failed') == 1
+    assert crawler.stats.get_value('batch/Shelbyville/listing/failed') is None
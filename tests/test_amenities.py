@@ -0,0 +1,58 @@
+from deepbnb.amenities import AmenityBits, AmenityFilter
+from deepbnb.filters import ListingFilter
+from deepbnb.textindex import TextIndex
+
+NAMES = {'kitchen': 8, 'tv': 58, 'washer': 33, 'dryer': 34, 'wifi': 4}
+
+
+def test_known_ids_take_lowest_bits():
+    first, second = AmenityBits(NAMES.values()), AmenityBits(reversed(list(NAMES.values())))
+    assert first.bitset([4, 33]) == second.bitset([33, 4]) == 0b101
+    assert first.bits == {4: 0, 8: 1, 33: 2, 34: 3, 58: 4}
+
+
+def test_other_ids_take_next_free_bits():
+    amenity_bits = AmenityBits(NAMES.values())
+    assert amenity_bits.bitset([701, 4, 1000]) == 0b1100001
+    assert amenity_bits.bit(701) == 5
+    assert amenity_bits.bit(1000) == 6
+    assert amenity_bits.bit(702) == 7
+
+
+def test_check_on_item_bitsets(tmp_path):
+    items = [
+        {'id': '1', 'amenity_ids': [4, 8, 33]},
+        {'id': '2', 'amenity_ids': [4, 33, 57]},
+        {'id': '3', 'amenity_ids': [4, 34, 120]},
+        {'id': '4'},
+    ]
+    listing_filter = ListingFilter(amenities_required=['wifi', 'washer'], amenities_excluded=['57'],
+                                   property_amenities=NAMES)
+
+    accepted = [item['id'] for item in items if not listing_filter.check(item)]
+    assert accepted == ['1']
+    assert 'amenity_bits' not in items[0]
+    assert listing_filter.check(items[1]) == ('amenities_excluded', 'Excluded amenities: [57]')
+    assert listing_filter.check(items[2]) == ('amenities_required', 'Missing amenities: [33]')
+
+    text_index = TextIndex(str(tmp_path / 'index.sqlite'), NAMES.values())
+    for item in items:
+        text_index.add(item)
+    text_index.close()
+
+    text_index = TextIndex(str(tmp_path / 'index.sqlite'))  # as refilter opens it, mapping from the index
+    refiltered = [item['id'] for item in text_index.items(amenity_filter=listing_filter.amenity_filter)]
+    text_index.close()
+    assert refiltered == accepted
+
+    # ids the index had to map itself, 57 and 120, are stored too: amenity 120 is found after reopening the index
+    text_index = TextIndex(str(tmp_path / 'index.sqlite'))
+    refiltered = [item['id'] for item in text_index.items(amenity_filter=AmenityFilter(['120']))]
+    text_index.close()
+    assert refiltered == ['3']
+
+
+def test_masks_of_other_mapping():
+    amenity_filter = AmenityFilter([33], [57], NAMES)
+    assert amenity_filter.masks() == {0: (1 << 2, 1 << 4)}  # 57 is filtered, so known too, and sorted before 58
+    assert amenity_filter.masks(AmenityBits([33, 57])) == {0: (1, 2)}
@@ -0,0 +1,31 @@
+from datetime import date
+
+import pytest
+
+from deepbnb.api.PdpAvailabilityCalendar import PdpAvailabilityCalendar
+
+
+def calendar_day(day: int, **fields) -> tuple:
+    return date(2023, 10, day), {'calendarDate': f'2023-10-{day:02}', 'price': {'localPriceFormatted': '$100'}} | fields
+
+
+@pytest.mark.parametrize('checkin_fields, expected', [
+    ({'available': True}, 300),
+    ({'availableForCheckin': True}, 300),  # checkin day without 'available'
+    ({'availableForCheckin': False, 'available': True}, False),
+])
+def test_stay_price(checkin_fields, expected):
+    days = dict([
+        calendar_day(1, **checkin_fields),
+        calendar_day(2, available=True),
+        calendar_day(3, availableForCheckin=True),  # a night without 'available' is taken as its checkin availability
+        calendar_day(4, available=False, availableForCheckout=True),
+    ])
+
+    assert PdpAvailabilityCalendar._get_stay_price(days, date(2023, 10, 1), date(2023, 10, 4)) == expected
+
+
+def test_stay_price_unavailable_night():
+    days = dict([calendar_day(1, available=True), calendar_day(2, available=False), calendar_day(3, available=True)])
+
+    assert PdpAvailabilityCalendar._get_stay_price(days, date(2023, 10, 1), date(2023, 10, 3)) is False
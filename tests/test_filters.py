@@ -0,0 +1,44 @@
+import scrapy
+
+from deepbnb.api.PdpPlatformSections import PdpPlatformSections
+from deepbnb.api.PdpReviews import PdpReviews
+from deepbnb.filters import ListingFilter
+
+SEARCH_FIELDS = (
+    'avg_rating', 'bathrooms', 'bedrooms', 'beds', 'business_travel_ready', 'city', 'host_id', 'latitude', 'longitude',
+    'neighborhood_overview', 'person_capacity', 'photo_count', 'photos', 'room_and_property_type', 'room_type',
+    'room_type_category', 'star_rating', 'monthly_price_factor', 'weekly_price_factor', 'price_rate',
+    'price_rate_type', 'total_price',
+)
+BALCONY_REVIEWS = {'balcony': {'fields': ['reviews'], 'must_have': ['balcony']}}
+
+
+def build(listing_filter: ListingFilter, name: str) -> list:
+    """Build item of a listing with reviews from search data, as when listing pages aren't wanted."""
+    data_cache = {'1': dict.fromkeys(SEARCH_FIELDS) | {'name': name, 'review_count': 3}}
+    pdp_reviews = PdpReviews('key', None, 'USD')
+    pdp_platform_sections = PdpPlatformSections(
+        'key', None, 'USD', data_cache, {}, pdp_reviews, listing_filter=listing_filter)
+
+    return list(pdp_platform_sections.search_result_item('1'))
+
+
+def test_reviews_must_have_waits_for_reviews():
+    listing_filter = ListingFilter(text_filters=BALCONY_REVIEWS)
+    item = {'id': '1', 'name': 'Sunny flat'}
+
+    assert listing_filter.check(item, complete=False) is None
+    assert listing_filter.check(item | {'reviews': []})[0] == 'balcony'
+    assert listing_filter.check(item | {'reviews': [{'comments': 'Lovely balcony'}]}) is None
+
+
+def test_reviews_requested_for_reviews_must_have():
+    results = build(ListingFilter(text_filters=BALCONY_REVIEWS), 'Sunny flat')
+
+    assert len(results) == 1 and isinstance(results[0], scrapy.Request)
+
+
+def test_reviews_not_requested_for_rejected_item():
+    results = build(ListingFilter(cannot_have=['sunny'], text_filters=BALCONY_REVIEWS), 'Sunny flat')
+
+    assert len(results) == 1 and results[0]['reviews'] == []
@@ -0,0 +1,34 @@
+import pytest
+
+from scrapy.utils.test import get_crawler
+
+from deepbnb.frontier import Frontier, SqliteFrontier
+
+
+def test_incomplete_backend_fails_when_created():
+    class IncompleteFrontier(Frontier):
+        def _claim(self, key: str) -> bool:
+            return True
+
+    with pytest.raises(TypeError, match='abstract'):
+        IncompleteFrontier('Springfield', 'worker', get_crawler().stats, 600, 3)
+
+
+def test_sqlite_frontier_shared_by_workers(tmp_path):
+    stats = get_crawler().stats
+    path = str(tmp_path / 'frontier.db')
+    first, second = (Frontier.open(path, 'Springfield', worker, stats) for worker in ('first', 'second'))
+    assert isinstance(first, SqliteFrontier)
+
+    assert first.push('listing/1', 'listing', {'id': '1'})
+    assert not second.push('listing/1', 'listing', {'id': '1'})
+    assert first.lease(10) == [('listing/1', 'listing', {'id': '1'})]
+    assert second.lease(10) == []
+    assert second.pending() == 1
+
+    assert first.complete('listing/1')
+    assert second.pending() == 0
+    assert first.claim('item/1')
+    assert not second.claim('item/1')
+    first.close()
+    second.close()
@@ -0,0 +1,42 @@
+import pytest
+
+from scrapy import Spider
+from scrapy.exceptions import DropItem
+from scrapy.utils.test import get_crawler
+from twisted.internet.defer import succeed
+
+from deepbnb.instrumentation import timed_pipeline
+from deepbnb.pipelines import DuplicatesPipeline
+
+
+class DeferringPipeline:
+    @timed_pipeline
+    def process_item(self, item, spider):
+        return succeed(item)
+
+
+@pytest.fixture
+def spider():
+    crawler = get_crawler(settings_dict={'INSTRUMENTATION_ENABLED': True})
+    crawler.stats.open_spider(None)
+    return Spider.from_crawler(crawler, name='test')
+
+
+def test_pipelines_timed_separately(spider):
+    duplicates = DuplicatesPipeline()
+    duplicates.process_item({'id': '1'}, spider)
+    with pytest.raises(DropItem):
+        duplicates.process_item({'id': '1'}, spider)
+    DeferringPipeline().process_item({'id': '1'}, spider)
+
+    stats = spider.crawler.stats
+    assert stats.get_value('timing/pipeline/DuplicatesPipeline').count == 2
+    assert stats.get_value('timing/pipeline/DeferringPipeline').count == 1
+
+
+def test_pipelines_not_timed_by_default():
+    crawler = get_crawler()
+    spider = Spider.from_crawler(crawler, name='test')
+    DuplicatesPipeline().process_item({'id': '1'}, spider)
+
+    assert not [key for key in crawler.stats.get_stats() if key.startswith('timing/')]
@@ -0,0 +1,68 @@
+import logging
+
+from scrapy.utils.test import get_crawler
+
+from deepbnb.planner import SearchPlanner
+
+BBOX = {'ne_lat': 40.0, 'ne_lng': -80.0, 'sw_lat': 39.0, 'sw_lng': -81.0}
+
+
+def metadata(listings_count: int) -> dict:
+    return {'listingsCount': listings_count, 'paginationMetadata': {'hasNextPage': True, 'itemsOffset': 0}}
+
+
+def planner(bbox: dict = None):
+    stats = get_crawler().stats
+
+    return SearchPlanner(logging.getLogger('test_planner'), stats, (0, 1000, 100), 300, bbox), stats
+
+
+def test_search_below_cap_is_not_split():
+    search_planner, stats = planner(BBOX)
+
+    assert search_planner.split({}, metadata(299)) == []
+    assert stats.get_value('planner/sub_searches') is None
+
+
+def test_capped_search_split_by_price_band_then_bounding_box():
+    search_planner, stats = planner(BBOX)
+
+    assert search_planner.split({}, metadata(2000)) == [{'priceMin': 0, 'priceMax': 1000}, {'priceMin': 1001}]
+    assert search_planner.split({'priceMin': 0, 'priceMax': 1000}, metadata(1500)) == [
+        {'priceMin': 0, 'priceMax': 500}, {'priceMin': 501, 'priceMax': 1000}]
+
+    narrow_band = {'priceMin': 0, 'priceMax': 100}
+    tiles = search_planner.split(narrow_band, metadata(400))
+    assert [{k: tile[k] for k in ('ne_lat', 'sw_lat')} for tile in tiles] == [
+        {'ne_lat': 39.5, 'sw_lat': 39.0}, {'ne_lat': 39.5, 'sw_lat': 39.0},
+        {'ne_lat': 40.0, 'sw_lat': 39.5}, {'ne_lat': 40.0, 'sw_lat': 39.5}]
+    assert all(tile['priceMax'] == 100 for tile in tiles)
+
+    assert stats.get_value('planner/splits/price') == 2
+    assert stats.get_value('planner/splits/bbox') == 1
+    assert stats.get_value('planner/max_depth') == 2
+
+
+def test_following_pages_of_split_search_are_not_split_again():
+    search_planner, _ = planner(BBOX)
+    search_planner.split({}, metadata(2000))
+
+    assert search_planner.split({'itemsOffset': 20}, metadata(2000)) == []
+
+
+def test_search_that_cannot_be_split_is_counted_as_capped():
+    search_planner, stats = planner()
+
+    assert search_planner.split({'priceMin': 0, 'priceMax': 100}, metadata(400)) == []
+    assert stats.get_value('planner/capped_searches') == 1
+
+
+def test_report_coverage_of_root_searches():
+    search_planner, stats = planner(BBOX)
+    for params in search_planner.split({}, metadata(2000)):
+        search_planner.split(params, metadata(1000))
+    search_planner.report(1500)
+
+    assert stats.get_value('planner/listings_reported') == 2000
+    assert stats.get_value('planner/coverage_percent') == 75.0
+    assert stats.get_value('planner/searches') == 9  # lower band split by price, open-ended band into tiles
@@ -0,0 +1,91 @@
+from types import SimpleNamespace
+
+import pytest
+
+from scrapy import Request, Spider
+from scrapy.core.downloader import Slot
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Response
+from scrapy.utils.test import get_crawler
+
+from deepbnb.middlewares import AdaptiveRateLimitMiddleware
+
+API_URL = 'https://www.airbnb.com/api/v3/'
+
+
+def rate_limit(**settings):
+    """Return middleware, spider and downloader slots, for a crawler whose engine only has downloader slots."""
+    crawler = get_crawler(Spider, {'RATE_LIMIT_ENABLED': True, 'TWISTED_REACTOR': None} | settings)
+    crawler.engine = SimpleNamespace(downloader=SimpleNamespace(slots={}))
+    spider = Spider('test_ratelimit')
+    spider.crawler = crawler
+
+    return AdaptiveRateLimitMiddleware.from_crawler(crawler), spider, crawler.engine.downloader.slots
+
+
+def download(middleware, spider, slots, endpoint: str, status: int, headers: dict = None):
+    request = Request(API_URL + endpoint)
+    middleware.process_request(request, spider)
+    slots.setdefault(request.meta['download_slot'], Slot(1, 0, False))
+
+    return middleware.process_response(request, Response(request.url, status=status, headers=headers), spider)
+
+
+def test_not_configured_unless_enabled():
+    with pytest.raises(NotConfigured):
+        AdaptiveRateLimitMiddleware.from_crawler(get_crawler(Spider, {'TWISTED_REACTOR': None}))
+
+
+def test_healthy_responses_raise_rate_and_concurrency_of_endpoint():
+    middleware, spider, slots = rate_limit(RATE_LIMIT_MAX_CONCURRENCY=4)
+    for _ in range(20):
+        download(middleware, spider, slots, 'PdpPlatformSections', 200)
+
+    stats = spider.crawler.stats
+    slot = slots['www.airbnb.com/PdpPlatformSections']
+    assert stats.get_value('ratelimit/PdpPlatformSections/rate') > 1.0
+    assert stats.get_value('ratelimit/PdpPlatformSections/concurrency') == slot.concurrency == 4
+    assert slot.delay == pytest.approx(1 / stats.get_value('ratelimit/PdpPlatformSections/rate'), 0.01)
+
+
+def test_throttled_endpoint_backs_off_without_holding_back_others():
+    middleware, spider, slots = rate_limit()
+    for _ in range(10):
+        download(middleware, spider, slots, 'PdpReviews', 200)
+        download(middleware, spider, slots, 'PdpPlatformSections', 200)
+    rate = spider.crawler.stats.get_value('ratelimit/PdpReviews/rate')
+
+    download(middleware, spider, slots, 'PdpReviews', 429)
+    download(middleware, spider, slots, 'PdpReviews', 429)  # response to a request sent before the backoff
+
+    stats = spider.crawler.stats
+    assert stats.get_value('ratelimit/PdpReviews/rate') == pytest.approx(rate / 2, 0.01)
+    assert stats.get_value('ratelimit/PdpReviews/backoffs') == 1
+    assert stats.get_value('ratelimit/PdpReviews/throttled/429') == 2
+    assert stats.get_value('ratelimit/PdpPlatformSections/rate') == rate
+    assert stats.get_value('ratelimit/PdpPlatformSections/backoffs') is None
+
+
+def test_retry_after_caps_rate():
+    middleware, spider, slots = rate_limit()
+    download(middleware, spider, slots, 'ExploreSearch', 503, {'Retry-After': '10'})
+
+    assert spider.crawler.stats.get_value('ratelimit/ExploreSearch/rate') == 0.1
+    assert slots['www.airbnb.com/ExploreSearch'].delay == 10
+
+
+def test_forbidden_api_responses_are_retried():
+    middleware, spider, slots = rate_limit()
+    retry = download(middleware, spider, slots, 'ExploreSearch', 403)
+
+    assert isinstance(retry, Request)
+    assert retry.meta['retry_times'] == 1
+    assert spider.crawler.stats.get_value('ratelimit/ExploreSearch/throttled/403') == 1
+
+
+def test_other_requests_are_not_limited():
+    middleware, spider, _ = rate_limit()
+    request = Request('https://www.airbnb.com/s/homes')
+    middleware.process_request(request, spider)
+
+    assert 'download_slot' not in request.meta
@@ -0,0 +1,34 @@
+import json
+import sys
+
+import pytest
+
+from deepbnb import refilter
+from deepbnb.textindex import TextIndex
+from tests.test_textindex import ITEMS
+
+
+@pytest.mark.parametrize('output', ['items.jsonl', 'items.jl', 'items.csv'])
+def test_refilter(tmp_path, monkeypatch, project_settings, output):
+    text_index = TextIndex(str(tmp_path / 'index.sqlite'))
+    for item in ITEMS:
+        text_index.add(item)
+    text_index.close()
+
+    monkeypatch.setattr(sys, 'argv', [
+        'refilter', str(tmp_path / 'index.sqlite'), '-o', str(tmp_path / output),
+        '-s', 'TEXT_FILTERS={"no_noise": {"fields": ["reviews"], "cannot_have": ["noisy"]}}', '-s', 'MINIMUM_PHOTOS=0',
+    ])
+    refilter.main()
+
+    lines = (tmp_path / output).read_text().splitlines()
+    if output.endswith('.csv'):
+        assert [line.split(',')[0] for line in lines[1:]] == ['Sunny flat', 'Attic room']
+    else:
+        assert [json.loads(line)['name'] for line in lines] == ['Sunny flat', 'Attic room']
+
+
+def test_refilter_rejects_unknown_format(tmp_path, monkeypatch, project_settings):
+    monkeypatch.setattr(sys, 'argv', ['refilter', str(tmp_path / 'index.sqlite'), '-o', str(tmp_path / 'items.txt')])
+    with pytest.raises(SystemExit):
+        refilter.main()
@@ -0,0 +1,57 @@
+import json
+import sys
+
+from benchmarks.stub_server import (
+    GEOGRAPHY, explore_search_payload, pdp_platform_sections_payload, pdp_reviews_payload
+)
+from deepbnb import reparse
+from deepbnb.api.ExploreSearch import ExploreSearch
+from deepbnb.api.PdpPlatformSections import PdpPlatformSections
+from deepbnb.api.PdpReviews import PdpReviews
+from deepbnb.archive import ResponseArchive
+
+LISTING_IDS = [str(10_000_000 + i) for i in range(30)]
+BROKEN_ID = LISTING_IDS[5]
+
+
+def write_archive(path: str):
+    """Archive searches for two queries sharing listings 20-29, listing pages, and reviews. One listing page is cut
+    short."""
+    args = ('bench-key', None, 'USD')
+    explore_search = ExploreSearch(*args, None, None, GEOGRAPHY, GEOGRAPHY['city'])
+    pdp_reviews = PdpReviews(*args)
+    pdp_platform_sections = PdpPlatformSections(*args, {}, GEOGRAPHY, pdp_reviews)
+
+    archive = ResponseArchive(path, 'a')
+    for query, listing_ids in (('Springfield', LISTING_IDS[:25]), ('Shelbyville', LISTING_IDS[20:])):
+        for offset in range(0, len(listing_ids), 10):
+            url = explore_search._get_url(query, {'itemsOffset': offset} if offset else None)
+            payload = explore_search_payload(listing_ids[offset:offset + 10], offset, offset + 10 < len(listing_ids), 2)
+            archive.append(url, 200, json.dumps(payload).encode())
+
+    for listing_id in LISTING_IDS:
+        body = json.dumps(pdp_platform_sections_payload(listing_id)).encode()
+        body = body[:100] if listing_id == BROKEN_ID else body
+        archive.append(pdp_platform_sections.api_request(listing_id).url, 200, body)
+        archive.append(pdp_reviews._get_url(listing_id, 50, 0), 200,
+                       json.dumps(pdp_reviews_payload(listing_id, 50, 0, 2)).encode())
+    archive.close()
+
+
+def test_reparse(tmp_path, monkeypatch, project_settings, capsys):
+    write_archive(str(tmp_path / 'archive'))
+    output = tmp_path / 'items.jsonl'
+    monkeypatch.setattr(sys, 'argv', ['reparse', str(tmp_path / 'archive'), '-o', str(output), '--workers', '2'])
+    reparse.main()
+
+    urls = sorted(json.loads(line)['url'] for line in output.read_text().splitlines())
+    assert urls == sorted(f'https://www.airbnb.com/rooms/{i}' for i in LISTING_IDS if i != BROKEN_ID)
+    assert '1 responses failed to parse' in capsys.readouterr().out
+
+
+def test_reparse_settings_never_crawl():
+    settings = reparse.reparse_settings({'FRONTIER': 'redis://localhost', 'TWISTED_REACTOR': 'asyncio'})
+
+    assert settings.get('FRONTIER') is None
+    assert settings.get('TWISTED_REACTOR') is None
+    assert settings.getdict('ITEM_PIPELINES') == {}
@@ -0,0 +1,88 @@
+import json
+import logging
+
+from scrapy import Request
+from scrapy.http import TextResponse
+from scrapy.utils.test import get_crawler
+
+from benchmarks.stub_server import pdp_reviews_payload
+from deepbnb.api.PdpReviews import PdpReviews
+from deepbnb.items import DeepbnbItem
+from deepbnb.state import CrawlState
+
+LIMIT = 50
+
+
+class RequestFailure:
+    """Failure of a review request, as passed to the errback."""
+
+    def __init__(self, request: Request):
+        self.request = request
+        self.value = ConnectionRefusedError()
+
+
+def pdp_reviews(crawl_state: CrawlState = None) -> PdpReviews:
+    return PdpReviews('key', logging.getLogger('test_reviews'), 'USD', LIMIT, crawl_state)
+
+
+def reviews_response(request: Request, reviews_count: int, body: bytes = None) -> TextResponse:
+    if body is None:
+        payload = pdp_reviews_payload(request.cb_kwargs['listing_id'], LIMIT, request.cb_kwargs['offset'], reviews_count)
+        body = json.dumps(payload).encode()
+
+    return TextResponse(request.url, body=body, request=request)
+
+
+def split(results) -> tuple:
+    """Split callback results into requests and items."""
+    results = list(results)
+
+    return [r for r in results if isinstance(r, Request)], [r for r in results if not isinstance(r, Request)]
+
+
+def test_reviews_requested_in_parallel_and_item_emitted_after_last_page():
+    api = pdp_reviews()
+    first = api.api_request(DeepbnbItem(id='1'))
+    requests, items = split(first.callback(reviews_response(first, 120), **first.cb_kwargs))
+    assert [r.cb_kwargs['offset'] for r in requests] == [50, 100]
+    assert items == []
+
+    # pages come back out of order, reviews are still attached in order
+    _, items = split(requests[1].callback(reviews_response(requests[1], 120), **requests[1].cb_kwargs))
+    assert items == []
+    _, items = split(requests[0].callback(reviews_response(requests[0], 120), **requests[0].cb_kwargs))
+    assert [r['comments'].split(' of ')[0] for r in items[0]['reviews']] == [f'Review {i}' for i in range(120)]
+
+
+def test_item_emitted_with_collected_reviews_when_page_fails_to_parse():
+    api = pdp_reviews()
+    first = api.api_request(DeepbnbItem(id='1'))
+    requests, _ = split(first.callback(reviews_response(first, 120), **first.cb_kwargs))
+
+    _, items = split(requests[0].callback(reviews_response(requests[0], 120, b'{"data": '), **requests[0].cb_kwargs))
+    assert items == []
+    _, items = split(api.errback(RequestFailure(requests[1])))
+    assert len(items[0]['reviews']) == 50
+
+
+def test_item_emitted_without_reviews_when_first_page_fails_to_parse():
+    api = pdp_reviews()
+    first = api.api_request(DeepbnbItem(id='1'))
+    requests, items = split(first.callback(reviews_response(first, 120, b'<html>blocked</html>'), **first.cb_kwargs))
+
+    assert requests == []
+    assert items[0]['reviews'] == []
+
+
+def test_paging_stops_at_reviews_seen_before(tmp_path):
+    crawl_state = CrawlState(str(tmp_path / 'state.db'), get_crawler().stats)
+    crawl_state.record_item(DeepbnbItem(id='1', reviews=[{'created_at': '2022-06-01T00:00:00Z'}]))
+    api = pdp_reviews(crawl_state)
+    first = api.api_request(DeepbnbItem(id='1'))
+
+    page = pdp_reviews_payload('1', LIMIT, 0, 120)
+    page['data']['merlin']['pdpReviews']['reviews'][-1]['createdAt'] = '2022-01-01T00:00:00Z'
+    requests, items = split(first.callback(reviews_response(first, 120, json.dumps(page).encode()), **first.cb_kwargs))
+
+    assert requests == []
+    assert len(items[0]['reviews']) == 49
@@ -0,0 +1,46 @@
+from scrapy import signals
+from scrapy.exceptions import DropItem
+from scrapy.utils.test import get_crawler
+
+from deepbnb.items import DeepbnbItem
+from deepbnb.spiders.airbnb import AirbnbSpider
+from deepbnb.state import CrawlState
+
+
+def open_crawl_state(tmp_path):
+    crawler = get_crawler(AirbnbSpider, {'CRAWL_STATE_DB': str(tmp_path / 'state.db'), 'TWISTED_REACTOR': None})
+
+    return crawler, AirbnbSpider.open_crawl_state(crawler)
+
+
+def test_dropped_item_is_unchanged_until_its_search_data_changes(tmp_path):
+    crawler, crawl_state = open_crawl_state(tmp_path)
+    listing_data = {'price': 100, 'reviews_count': 3}
+    assert not crawl_state.is_unchanged('1', listing_data)
+
+    crawler.signals.send_catch_log(signals.item_dropped, item=DeepbnbItem(id='1', reviews=[]), response=None,
+                                   exception=DropItem('filtered'), spider=None)
+
+    assert crawl_state.is_unchanged('1', listing_data)
+    assert not crawl_state.is_unchanged('1', listing_data | {'price': 120})
+    assert crawler.stats.get_value('state/new') == 1
+    assert crawler.stats.get_value('state/unchanged') == 1
+    assert crawler.stats.get_value('state/changed') == 1
+
+
+def test_dropped_item_keeps_newest_review_seen(tmp_path):
+    crawler, crawl_state = open_crawl_state(tmp_path)
+    scraped = DeepbnbItem(id='1', reviews=[{'created_at': '2022-06-01T00:00:00Z'}])
+    crawler.signals.send_catch_log(signals.item_scraped, item=scraped, response=None, spider=None)
+    crawler.signals.send_catch_log(signals.item_dropped, item=DeepbnbItem(id='1', reviews=[]), response=None,
+                                   exception=DropItem('filtered'), spider=None)
+
+    assert crawl_state.newest_review('1') == '2022-06-01T00:00:00Z'
+
+
+def test_batch_surveys_keep_separate_state(tmp_path):
+    crawl_state = CrawlState(str(tmp_path / 'state.db'), get_crawler().stats)
+    crawl_state.record_item(DeepbnbItem(id='1', survey='Springfield', reviews=[{'created_at': '2022-06-01'}]))
+
+    assert crawl_state.newest_review(CrawlState.key('1', 'Springfield')) == '2022-06-01'
+    assert crawl_state.newest_review('1') is None
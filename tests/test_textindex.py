@@ -0,0 +1,47 @@
+import pytest
+
+from deepbnb.filters import ListingFilter
+from deepbnb.textindex import TextIndex
+
+
+def review(comments: str) -> dict:
+    return {'comments': comments, 'created_at': '2022-10-01T12:00:00Z', 'language': 'en', 'rating': 5,
+            'response': None}
+
+
+ITEMS = [
+    {'id': '1', 'name': 'Sunny flat', 'description': 'Quiet street', 'reviews': [review('Lovely balcony')]},
+    {'id': '2', 'name': 'Dark flat', 'description': 'Busy street', 'reviews': [review('Noisy at night'),
+                                                                                 review('Great host')]},
+    {'id': '3', 'name': 'Attic room', 'description': 'Top floor', 'reviews': []},
+]
+
+
+@pytest.mark.parametrize('text_filters', [
+    {'no_comments': {'fields': ['reviews'], 'cannot_have': ['comments']}},
+    {'no_dates': {'fields': ['reviews'], 'cannot_have': ['2022']}},
+    {'no_noise': {'fields': ['reviews'], 'cannot_have': ['noisy']}},
+    {'balcony': {'fields': ['reviews'], 'must_have': ['balcony']}},
+    {'language': {'fields': ['reviews'], 'must_have': r'\ben\b'}},
+    {'host': {'fields': ['reviews', 'description'], 'must_have': r'gr[e]at|quiet'}},
+])
+def test_refilter_agrees_with_live_filter(tmp_path, text_filters):
+    listing_filter = ListingFilter(text_filters=text_filters)
+    text_index = TextIndex(str(tmp_path / 'index.sqlite'))
+    for item in ITEMS:
+        text_index.add(item)
+
+    refiltered = [item['id'] for item in text_index.items(listing_filter.text_rules) if not listing_filter.check(item)]
+    text_index.close()
+
+    assert refiltered == [item['id'] for item in ITEMS if not listing_filter.check(item)]
+
+
+def test_index_matches_review_comments_only(tmp_path):
+    listing_filter = ListingFilter(text_filters={'rating': {'fields': ['reviews'], 'must_have': ['rating']}})
+    text_index = TextIndex(str(tmp_path / 'index.sqlite'))
+    for item in ITEMS:
+        text_index.add(item)
+
+    assert list(text_index.items(listing_filter.text_rules)) == []
+    text_index.close()
@@ -0,0 +1,103 @@
+"""Request URLs of the API classes, checked against golden URLs built by the URL builders before URL templates."""
+import logging
+
+from deepbnb.api.ExploreSearch import ExploreSearch
+from deepbnb.api.PdpPlatformSections import PdpPlatformSections
+from deepbnb.api.PdpReviews import PdpReviews
+
+logger = logging.getLogger(__name__)
+
+EXPLORE_QUERY = (
+    'https://www.airbnb.com/api/v3/ExploreSearch?operationName=ExploreSearch&locale=en&currency=USD&_cb=l'
+    'd7rar1fhh6if&variables={"request":{"metadataOnly":false,"version":"1.7.9","itemsPerGrid":20,"tabId":'
+    '"home_tab","refinementPaths":["/homes"],"source":"structured_search_input_header","searchType":"filt'
+    'er_change","query":"S\\u00e3o Paulo, Brazil","cdnCacheSafe":false,"simpleSearchTreatment":"simple_sea'
+    'rch_only","treatmentFlags":["simple_search_1_1","simple_search_desktop_v3_full_bleed","flexible_date'
+    's_options_extend_one_three_seven_days"],"screenSize":"large"}}&extensions={"persistedQuery":{"versio'
+    'n":1,"sha256Hash":"13aa9971e70fbf5ab888f2a851c765ea098d8ae68c81e1f4ce06e2046d91b6ea"}}'
+)
+
+EXPLORE_PARAMS = (
+    'https://www.airbnb.com/api/v3/ExploreSearch?operationName=ExploreSearch&locale=en&currency=USD&_cb=l'
+    'd7rar1fhh6if&variables={"request":{"metadataOnly":false,"version":"1.7.9","itemsPerGrid":20,"tabId":'
+    '"home_tab","refinementPaths":["/homes"],"source":"structured_search_input_header","searchType":"filt'
+    'er_change","query":"Madrid, Spain","cdnCacheSafe":false,"simpleSearchTreatment":"simple_search_only"'
+    ',"treatmentFlags":["simple_search_1_1","simple_search_desktop_v3_full_bleed","flexible_dates_options'
+    '_extend_one_three_seven_days"],"screenSize":"large","checkin":"2023-06-01","checkout":"2023-06-08","'
+    'priceMin":100,"priceMax":600,"itemsOffset":40,"ne_lat":"40.5","lastSearchSessionId":"abc\\"d"}}&exten'
+    'sions={"persistedQuery":{"version":1,"sha256Hash":"13aa9971e70fbf5ab888f2a851c765ea098d8ae68c81e1f4c'
+    'e06e2046d91b6ea"}}'
+)
+
+EXPLORE_OVERRIDE = (
+    'https://www.airbnb.com/api/v3/ExploreSearch?operationName=ExploreSearch&locale=en&currency=USD&_cb=l'
+    'd7rar1fhh6if&variables={"request":{"metadataOnly":false,"version":"1.7.9","itemsPerGrid":50,"tabId":'
+    '"home_tab","refinementPaths":["/homes"],"source":"structured_search_input_header","searchType":"filt'
+    'er_change","query":"Madrid, Spain","cdnCacheSafe":false,"simpleSearchTreatment":"simple_search_only"'
+    ',"treatmentFlags":["simple_search_1_1","simple_search_desktop_v3_full_bleed","flexible_dates_options'
+    '_extend_one_three_seven_days"],"screenSize":"large","itemsOffset":20}}&extensions={"persistedQuery":'
+    '{"version":1,"sha256Hash":"13aa9971e70fbf5ab888f2a851c765ea098d8ae68c81e1f4ce06e2046d91b6ea"}}'
+)
+
+PDP_SECTIONS = (
+    'https://www.airbnb.com/api/v3/PdpPlatformSections?operationName=PdpPlatformSections&locale=en&curren'
+    'cy=EUR&variables=%7B%22request%22%3A%7B%22id%22%3A%2212345678%22%2C%22layouts%22%3A%5B%22SIDEBAR%22%'
+    '2C%22SINGLE_COLUMN%22%5D%2C%22pdpTypeOverride%22%3Anull%2C%22translateUgc%22%3Anull%2C%22preview%22%'
+    '3Afalse%2C%22bypassTargetings%22%3Afalse%2C%22displayExtensions%22%3Anull%2C%22adults%22%3A%221%22%2'
+    'C%22children%22%3Anull%2C%22infants%22%3Anull%2C%22causeId%22%3Anull%2C%22disasterId%22%3Anull%2C%22'
+    'priceDropSource%22%3Anull%2C%22promotionUuid%22%3Anull%2C%22selectedCancellationPolicyId%22%3Anull%2'
+    'C%22forceBoostPriorityMessageType%22%3Anull%2C%22privateBooking%22%3Afalse%2C%22invitationClaimed%22'
+    '%3Afalse%2C%22discountedGuestFeeVersion%22%3Anull%2C%22staysBookingMigrationEnabled%22%3Afalse%2C%22'
+    'useNewSectionWrapperApi%22%3Afalse%2C%22previousStateCheckIn%22%3Anull%2C%22previousStateCheckOut%22'
+    '%3Anull%2C%22federatedSearchId%22%3Anull%2C%22interactionType%22%3Anull%2C%22searchId%22%3Anull%2C%2'
+    '2sectionIds%22%3Anull%2C%22checkIn%22%3Anull%2C%22checkOut%22%3Anull%2C%22p3ImpressionId%22%3A%22p3_'
+    '1608841700_z2VzPeybmBEdZG20%22%7D%7D&extensions=%7B%22persistedQuery%22%3A%7B%22version%22%3A1%2C%22'
+    'sha256Hash%22%3A%22625a4ba56ba72f8e8585d60078eb95ea0030428cac8772fde09de073da1bcdd0%22%7D%7D'
+)
+
+REVIEWS_FIRST = (
+    'https://www.airbnb.com/api/v3/PdpReviews?operationName=PdpReviews&locale=en&currency=USD&variables=%'
+    '7B%22request%22%3A%7B%22fieldSelector%22%3A%22for_p3%22%2C%22limit%22%3A50%2C%22listingId%22%3A%2212'
+    '345678%22%2C%22numberOfAdults%22%3A%221%22%2C%22numberOfChildren%22%3A%220%22%2C%22numberOfInfants%2'
+    '2%3A%220%22%7D%7D&extensions=%7B%22persistedQuery%22%3A%7B%22version%22%3A1%2C%22sha256Hash%22%3A%22'
+    '4730a25512c4955aa741389d8df80ff1e57e516c469d2b91952636baf6eee3bd%22%7D%7D'
+)
+
+REVIEWS_OFFSET = (
+    'https://www.airbnb.com/api/v3/PdpReviews?operationName=PdpReviews&locale=en&currency=USD&variables=%'
+    '7B%22request%22%3A%7B%22fieldSelector%22%3A%22for_p3%22%2C%22limit%22%3A50%2C%22listingId%22%3A%2212'
+    '345678%22%2C%22numberOfAdults%22%3A%221%22%2C%22numberOfChildren%22%3A%220%22%2C%22numberOfInfants%2'
+    '2%3A%220%22%2C%22offset%22%3A150%7D%7D&extensions=%7B%22persistedQuery%22%3A%7B%22version%22%3A1%2C%'
+    '22sha256Hash%22%3A%224730a25512c4955aa741389d8df80ff1e57e516c469d2b91952636baf6eee3bd%22%7D%7D'
+)
+
+
+
+def explore_search() -> ExploreSearch:
+    return ExploreSearch('key', logger, 'USD', None, [], {}, 'Madrid, Spain')
+
+
+def test_explore_search_query():
+    assert explore_search()._get_url('São Paulo, Brazil') == EXPLORE_QUERY
+
+
+def test_explore_search_params():
+    params = {'checkin': '2023-06-01', 'checkout': '2023-06-08', 'priceMin': 100, 'priceMax': 600, 'itemsOffset': 40,
+              'ne_lat': '40.5', 'lastSearchSessionId': 'abc"d'}
+    assert explore_search()._get_url('Madrid, Spain', params) == EXPLORE_PARAMS
+
+
+def test_explore_search_overridden_constant():
+    """A constant request variable given a value falls back to the URL builder."""
+    assert explore_search()._get_url('Madrid, Spain', {'itemsPerGrid': 50, 'itemsOffset': 20}) == EXPLORE_OVERRIDE
+
+
+def test_pdp_platform_sections():
+    pdp_platform_sections = PdpPlatformSections('key', logger, 'EUR', {}, {}, None)
+    assert pdp_platform_sections.api_request('12345678').url == PDP_SECTIONS
+
+
+def test_pdp_reviews():
+    pdp_reviews = PdpReviews('key', logger, 'USD')
+    assert pdp_reviews._get_url('12345678', 50, 0) == REVIEWS_FIRST
+    assert pdp_reviews._get_url('12345678', 50, 150) == REVIEWS_OFFSET